@@ -0,0 +1,230 @@
+import os
+import sqlite3
+from compaction import iter_raw_lines
+from record_scanner import RecordScanner
+
+MESSAGES_FILE = "../data/messages.jsonl"
+AUTHOR_INDEX_FILE = "../data/author_index.db"
+
+# Offset atual de um registro: o original menos o que o purge já removeu antes.
+_CURRENT_OFFSET = (
+    "records.offset - COALESCE((SELECT dropped.shift FROM dropped"
+    " WHERE dropped.offset < records.offset"
+    " ORDER BY dropped.offset DESC LIMIT 1), 0)"
+)
+_SQL_CHUNK = 500
+
+
+def _chunks(values, size: int = _SQL_CHUNK):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+def _placeholders(values) -> str:
+    return ",".join("?" * len(values))
+
+
+class AuthorIndex:
+    """
+    Índice persistente author_id -> registros do messages.jsonl (offset,
+    tamanho, message_id, ad_hash), para o purge achar as linhas de um autor
+    sem ler o journal inteiro.
+
+    Segue o arquivo como o OpportunityStore: se só cresceu, indexa o final;
+    se foi trocado por outro processo (cleaner), reconstrói.
+
+    Os offsets ficam na coordenada em que a linha foi indexada. Cada trecho
+    removido pelo purge vai para a tabela dropped, e o offset atual de um
+    registro é o original menos o total removido antes dele. Assim um purge
+    só apaga as linhas afetadas, sem renumerar o resto do índice.
+    """
+
+    def __init__(self, path: str = MESSAGES_FILE, index_path: str = AUTHOR_INDEX_FILE):
+        self.path = path
+        self._scanner = RecordScanner(("author_id", "message_id", "ad_hash"))
+        self._conn = sqlite3.connect(index_path)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS records (
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                author_id TEXT NOT NULL,
+                message_id TEXT,
+                ad_hash TEXT
+            );
+            CREATE INDEX IF NOT EXISTS records_offset ON records (offset);
+            CREATE INDEX IF NOT EXISTS records_author ON records (author_id);
+            CREATE INDEX IF NOT EXISTS records_hash ON records (ad_hash);
+            CREATE TABLE IF NOT EXISTS dropped (
+                offset INTEGER PRIMARY KEY,
+                length INTEGER NOT NULL,
+                shift INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+            """)
+        self._conn.commit()
+
+    def _meta(self):
+        rows = dict(self._conn.execute("SELECT key, value FROM meta"))
+        return (
+            rows.get("inode"),
+            rows.get("size", 0),
+            rows.get("mtime", 0),
+            rows.get("end", 0),
+        )
+
+    def _save_meta(self, end: int):
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            signature = (None, 0, 0)
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            list(zip(("inode", "size", "mtime", "end"), (*signature, end))),
+        )
+
+    def _total_dropped(self) -> int:
+        row = self._conn.execute(
+            "SELECT shift FROM dropped ORDER BY offset DESC LIMIT 1"
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _index_from(self, start: int):
+        """Indexa as linhas completas a partir de start (coordenada atual)."""
+        shift = self._total_dropped()
+        end = start
+        rows = []
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                for offset, line in iter_raw_lines(f, start):
+                    end = offset + len(line)
+                    record = self._scanner.extract(line)
+                    if record is None or not record.get("author_id"):
+                        continue
+                    rows.append(
+                        (
+                            offset + shift,
+                            len(line),
+                            record["author_id"],
+                            record.get("message_id"),
+                            record.get("ad_hash"),
+                        )
+                    )
+                    if len(rows) >= 10_000:
+                        self._insert(rows)
+                        rows = []
+        self._insert(rows)
+        self._save_meta(end)
+        self._conn.commit()
+
+    def _insert(self, rows):
+        self._conn.executemany(
+            "INSERT INTO records (offset, length, author_id, message_id, ad_hash)"
+            " VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def sync(self):
+        """Confere o índice contra o journal; indexa o final ou reconstrói."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        inode, size, mtime, end = self._meta()
+
+        if stat is None:
+            if inode is not None:
+                self.rebuild()
+            return
+        if stat.st_ino != inode or stat.st_size < end:
+            self.rebuild()
+        elif stat.st_size > end:
+            self._index_from(end)
+        elif (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+            # Mesmo tamanho, conteúdo trocado no lugar: não dá para confiar.
+            self.rebuild()
+
+    def rebuild(self):
+        self._conn.execute("DELETE FROM records")
+        self._conn.execute("DELETE FROM dropped")
+        self._index_from(0)
+
+    def records_for(self, author_ids):
+        """
+        Registros dos autores, em ordem de arquivo:
+        (offset atual, tamanho, offset original, author_id, message_id, ad_hash).
+        """
+        rows = []
+        for chunk in _chunks(set(author_ids)):
+            rows += self._conn.execute(
+                f"SELECT {_CURRENT_OFFSET}, length, offset, author_id,"
+                " message_id, ad_hash FROM records"
+                f" WHERE author_id IN ({_placeholders(chunk)})",
+                chunk,
+            ).fetchall()
+        return sorted(rows)
+
+    def verify(self, records) -> bool:
+        """Confere, lendo só essas linhas, se os offsets ainda batem com o arquivo."""
+        with open(self.path, "rb") as f:
+            for offset, length, _, author_id, message_id, _ in records:
+                f.seek(offset)
+                line = f.read(length)
+                if len(line) != length or not line.endswith(b"\n"):
+                    return False
+                record = self._scanner.extract(line)
+                if record is None or (
+                    record.get("author_id"),
+                    record.get("message_id"),
+                ) != (author_id, message_id):
+                    return False
+        return True
+
+    def shared_hashes(self, ad_hashes, author_ids) -> set:
+        """ad_hashes que ainda aparecem em mensagens de outros autores."""
+        author_ids = list(set(author_ids))
+        shared = set()
+        for chunk in _chunks({h for h in ad_hashes if h}):
+            shared.update(
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT DISTINCT ad_hash FROM records"
+                    f" WHERE ad_hash IN ({_placeholders(chunk)})"
+                    f" AND author_id NOT IN ({_placeholders(author_ids)})",
+                    chunk + author_ids,
+                )
+            )
+        return shared
+
+    def remove(self, records, removed_bytes: int):
+        """
+        Registra que o purge tirou esses registros do journal (já reescrito):
+        os trechos entram em dropped e o fim indexado recua removed_bytes.
+        """
+        _, _, _, end = self._meta()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO dropped (offset, length, shift) VALUES (?, ?, 0)",
+            [(original, length) for _, length, original, _, _, _ in records],
+        )
+        self._conn.executemany(
+            "DELETE FROM records WHERE offset = ?",
+            [(original,) for _, _, original, _, _, _ in records],
+        )
+
+        shift, updates = 0, []
+        for offset, length in self._conn.execute(
+            "SELECT offset, length FROM dropped ORDER BY offset"
+        ).fetchall():
+            shift += length
+            updates.append((shift, offset))
+        self._conn.executemany("UPDATE dropped SET shift = ? WHERE offset = ?", updates)
+
+        self._save_meta(end - removed_bytes)
+        self._conn.commit()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,299 @@
+"""
+Benchmarks locais do intel-engine com mensagens sintéticas de WhatsApp.
+
+Uso:
+    python benchmarks.py message --count 500
+    python benchmarks.py normalizer --count 2000 --batch-size 128
+    python benchmarks.py normalizer --count 5000 --workers 4
+    python benchmarks.py scan --size-mb 500
+    python benchmarks.py restore --count 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+NEIGHBORHOODS = ["Barra", "Recreio", "Barra Olímpica", "Jacarepaguá", "Ipanema"]
+CONDOMINIUMS = ["Barramares", "Alfa Barra", "Península", "Riserva Golf", "Maramar"]
+
+SELLING_TEMPLATES = [
+    "Vendo apartamento {rooms} quartos no {cond}, {neighborhood}. {area}m², "
+    "{parking} vagas, sol da manhã.\nValor: R$ {price:,}\nCondomínio: R$ 1.800",
+    "*OPÇÃO DIRETA* Cobertura duplex {neighborhood}\n{rooms} suítes, {area} m2\n"
+    "Preço: R$ {price:,}\nIPTU: R$ 4.000",
+    "Oportunidade! Casa {rooms}qts perto da praia no {neighborhood}, "
+    "{parking} vagas, {area}m². Aceita proposta. {millions} milhões",
+]
+
+BUYING_TEMPLATES = [
+    "Cliente procura {rooms} quartos na {neighborhood} até {thousands} mil, "
+    "mínimo {area}m², {parking} vaga",
+    "Busco apartamento no {cond} com {rooms} quartos, frente mar, até R$ {price:,}",
+    "Alguém tem cobertura {neighborhood} sol da manhã? Cliente direto, "
+    "no máximo {millions} milhões",
+]
+
+USELESS_TEMPLATES = [
+    "bom dia",
+    "https://example.com/imovel/{rooms}",
+    "Alugo apartamento {rooms} quartos na {neighborhood}, aluguel R$ 5.000",
+]
+
+
+def synthetic_messages(count: int, seed: int = 42):
+    """Gera mensagens no formato do messages.jsonl (compra, venda e inúteis)."""
+    rng = random.Random(seed)
+    now = int(time.time())
+    messages = []
+    for i in range(count):
+        templates = rng.choice([SELLING_TEMPLATES, BUYING_TEMPLATES, USELESS_TEMPLATES])
+        price = rng.randrange(500_000, 4_000_000, 10_000)
+        text = rng.choice(templates).format(
+            rooms=rng.randint(1, 5),
+            neighborhood=rng.choice(NEIGHBORHOODS),
+            cond=rng.choice(CONDOMINIUMS),
+            area=rng.randint(50, 400),
+            parking=rng.randint(1, 4),
+            price=price,
+            thousands=price // 1000,
+            millions=round(price / 1_000_000, 1),
+        )
+        messages.append(
+            {
+                "message_id": f"BENCH{i:08d}",
+                "group_id": "bench@g.us",
+                "group_name": "bench",
+                "author_id": f"{rng.randint(1, 200)}@lid",
+                "author_name": "Corretor",
+                "author_phone": "5521999999999",
+                "message": text,
+                "ad_hash": f"{i:032x}",
+                "timestamp": now - rng.randint(0, 86_400 * 60),
+            }
+        )
+    return messages
+
+
+def _report(label: str, seconds: float, count: int):
+    per_item = seconds / count * 1000 if count else 0.0
+    rate = count / seconds if seconds else float("inf")
+    print(f"{label:<28} {per_item:8.3f} ms/item {rate:10.1f} items/s")
+
+
+def bench_message(args):
+    """Latência de construção de Message: parse eager (antigo) x doc lazy."""
+    from classifier import (
+        classify_message,
+        SellingMessage,
+        BuyingMessage,
+        UselessMessage,
+    )
+    from nlp_provider import get_nlp
+
+    get_nlp()
+    messages = synthetic_messages(args.count, args.seed)
+    classes = {
+        "selling": SellingMessage,
+        "buying": BuyingMessage,
+        "useless": UselessMessage,
+    }
+    labels = [classify_message(m) for m in messages]
+    nlp = get_nlp()
+
+    start = time.perf_counter()
+    for data, label in zip(messages, labels):
+        message = classes[label](data)
+        # Comportamento anterior: todo Message era processado pelo spaCy.
+        nlp(message.normalized_message)
+    _report("eager (antes)", time.perf_counter() - start, len(messages))
+
+    start = time.perf_counter()
+    for data, label in zip(messages, labels):
+        classes[label](data)
+    _report("lazy (depois)", time.perf_counter() - start, len(messages))
+
+
+def bench_normalizer(args):
+    """Throughput do normalizer: nlp() por anúncio x nlp.pipe x pool de processos."""
+    from classifier import classify_message
+    from nlp_provider import get_nlp
+    from normalizer import (
+        NormalizedAd,
+        normalize_batch,
+        normalize_parallel,
+        shutdown_pool,
+    )
+
+    nlp = get_nlp()
+    intents = {"selling": "sell", "buying": "buy"}
+    items = []
+    for data in synthetic_messages(args.count, args.seed):
+        intent = intents.get(classify_message(data))
+        if intent:
+            items.append((data["message"], intent, data))
+
+    start = time.perf_counter()
+    for raw_text, intent, original in items:
+        ad = NormalizedAd(raw_text, intent, original)
+        ad._doc = nlp(ad.text)
+        ad.normalize()
+    _report("nlp() por anúncio (antes)", time.perf_counter() - start, len(items))
+
+    start = time.perf_counter()
+    normalize_batch(items, batch_size=args.batch_size, n_process=args.n_process)
+    _report("nlp.pipe em lote (depois)", time.perf_counter() - start, len(items))
+
+    if args.workers > 1:
+        # A primeira chamada inclui a subida dos workers e a carga do modelo.
+        normalize_parallel(items[: args.workers * 200], workers=args.workers)
+        start = time.perf_counter()
+        normalize_parallel(items, workers=args.workers)
+        _report(
+            f"pool com {args.workers} workers", time.perf_counter() - start, len(items)
+        )
+        shutdown_pool()
+
+
+def _write_journal(path: str, size_mb: int, seed: int):
+    """messages.jsonl sintético com cerca de size_mb MB, no formato do collector."""
+    pool = synthetic_messages(5000, seed)
+    rng = random.Random(seed)
+    now = int(time.time())
+    target = size_mb * 1024 * 1024
+    written = count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < target:
+            msg = dict(pool[count % len(pool)])
+            msg.update(
+                message_id=f"3EB0{count:016X}",
+                group_id="120363000000000000@g.us",
+                group_name="Imóveis Barra e Recreio",
+                author_id=f"{rng.randrange(20000)}@lid",
+                author_name="Corretor",
+                author_phone="5521999999999",
+                ad_hash=f"{rng.randrange(count + 1):032x}",
+                timestamp=now - rng.randrange(0, 120 * 86400),
+            )
+            line = json.dumps(msg, ensure_ascii=False) + "\n"
+            f.write(line)
+            written += len(line.encode("utf-8"))
+            count += 1
+    return count
+
+
+def bench_scan(args):
+    """Reescrita do cleaner/purge: json.loads + json.dumps x RecordScanner + cópia crua."""
+    from compaction import iter_raw_lines
+    from record_scanner import RecordScanner, orjson
+
+    fields = ("message_id", "ad_hash", "timestamp", "author_id")
+    cutoff = int(time.time()) - 60 * 86400
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        journal = os.path.join(tmp, "messages.jsonl")
+        output = os.path.join(tmp, "out.jsonl")
+        count = _write_journal(journal, args.size_mb, args.seed)
+        size_mb = os.path.getsize(journal) / (1024 * 1024)
+        print(f"journal sintético: {count} linhas, {size_mb:.0f} MB")
+
+        def report(label, seconds):
+            _report(label, seconds, count)
+            print(f"{'':<28} {size_mb / seconds:8.1f} MB/s")
+
+        # Antes: objeto inteiro decodificado e reserializado ao gravar.
+        start = time.perf_counter()
+        with open(journal, encoding="utf-8") as src, open(
+            output, "w", encoding="utf-8"
+        ) as dst:
+            for line in src:
+                obj = json.loads(line)
+                if obj.get("timestamp", 0) >= cutoff:
+                    dst.write(json.dumps(obj, ensure_ascii=False) + "\n")
+        report("json.loads + dumps (antes)", time.perf_counter() - start)
+
+        modes = [("scanner regex (stdlib)", False)]
+        if orjson is not None:
+            modes.append(("scanner orjson", True))
+        for label, use_orjson in modes:
+            scanner = RecordScanner(fields, use_orjson=use_orjson)
+            start = time.perf_counter()
+            with open(journal, "rb") as src, open(output, "wb") as dst:
+                for _, line in iter_raw_lines(src):
+                    record = scanner.extract(line)
+                    if record is not None and record.get("timestamp", 0) >= cutoff:
+                        dst.write(line)
+            report(label, time.perf_counter() - start)
+
+
+def bench_restore(args):
+    """Reinício do engine: renormalizar o histórico x restaurar do normalized_ads.bin."""
+    from classifier import classify_message
+    from inventory import AdInventory
+    from normalized_store import NormalizedAdStore, restore_inventory
+    from normalizer import normalize_batch
+
+    intents = {"selling": "sell", "buying": "buy"}
+    items = []
+    for data in synthetic_messages(args.count, args.seed):
+        intent = intents.get(classify_message(data))
+        if intent:
+            items.append((data["message"], intent, data))
+
+    start = time.perf_counter()
+    ads = normalize_batch(items)
+    AdInventory().add_many(ads)
+    _report("renormalizar (antes)", time.perf_counter() - start, len(items))
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        path = os.path.join(tmp, "normalized_ads.bin")
+        store = NormalizedAdStore(path)
+        store.add_many(ads)
+        store.close()
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        print(f"normalized_ads.bin: {len(ads)} anúncios, {size_mb:.1f} MB")
+
+        start = time.perf_counter()
+        store = NormalizedAdStore(path)
+        restore_inventory(AdInventory(), store)
+        _report("snapshot (depois)", time.perf_counter() - start, len(items))
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("message", help=bench_message.__doc__)
+    p.add_argument("--count", type=int, default=500)
+    p.add_argument("--seed", type=int, default=42)
+    p.set_defaults(func=bench_message)
+
+    p = sub.add_parser("normalizer", help=bench_normalizer.__doc__)
+    p.add_argument("--count", type=int, default=2000)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--batch-size", type=int, default=128)
+    p.add_argument("--n-process", type=int, default=1)
+    p.add_argument("--workers", type=int, default=1)
+    p.set_defaults(func=bench_normalizer)
+
+    p = sub.add_parser("scan", help=bench_scan.__doc__)
+    p.add_argument("--size-mb", type=int, default=500)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--dir", default=None, help="diretório do journal temporário")
+    p.set_defaults(func=bench_scan)
+
+    p = sub.add_parser("restore", help=bench_restore.__doc__)
+    p.add_argument("--count", type=int, default=20000)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--dir", default=None, help="diretório do snapshot temporário")
+    p.set_defaults(func=bench_restore)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Checkpoint do engine (engine_checkpoint.bin) para reinícios rápidos.
+
+Um arquivo só, gravado de tempos em tempos pelo engine logo depois de um
+commit, com um retrato consistente do estado: posição do journal, filtros de
+dedup (SeenStore), inventário de anúncios normalizados e o índice do matcher
+(SellerIndex). Ao iniciar, o engine retoma dele e só relê as linhas do
+messages.jsonl depois do offset do checkpoint.
+
+Uso:
+    python checkpoint.py            # status
+"""
+
+import marshal
+import mmap
+import os
+import struct
+import time
+from normalizer import NORMALIZER_RULES_VERSION
+
+CHECKPOINT_FILE = "../data/engine_checkpoint.bin"
+# Intervalo mínimo entre checkpoints (s); um também é gravado ao encerrar.
+CHECKPOINT_INTERVAL = 300
+
+# Cabeçalho: magic, versão do formato, versão do marshal, versão das regras
+# do normalizer, criado em, offset, inode e tamanho do messages.jsonl e
+# número de seções.
+HEADER = struct.Struct("<4sHH12sqqqqI")
+MAGIC = b"ECKP"
+FORMAT_VERSION = 1
+# Tabela de seções logo após o cabeçalho: nome, offset e tamanho.
+SECTION = struct.Struct("<8sQQ")
+
+# ids e hashes: digests de 16 bytes concatenados, como nos arquivos do
+# SeenStore. ads: AdInventory.snapshot() em marshal (o índice do matcher
+# compartilha os dicts dos vendedores, e o marshal preserva isso).
+SECTIONS = (b"ids", b"hashes", b"ads")
+
+
+def write_checkpoint(state, seen, inventory, path: str = CHECKPOINT_FILE) -> int:
+    """
+    Grava o checkpoint num temporário com fsync e troca com os.replace.
+    Precisa ser chamado com o estado consistente (na thread do engine, entre
+    ciclos). Retorna o tamanho gravado.
+    """
+    ids, hashes = seen.snapshot()
+    sections = [ids, hashes, marshal.dumps(inventory.snapshot())]
+    journal = state["journal"]
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        marshal.version,
+        NORMALIZER_RULES_VERSION.encode(),
+        int(time.time()),
+        journal.get("offset", 0),
+        journal.get("inode") or 0,
+        journal.get("size", 0),
+        len(sections),
+    )
+
+    position = HEADER.size + SECTION.size * len(sections)
+    table = []
+    for name, data in zip(SECTIONS, sections):
+        table.append(SECTION.pack(name, position, len(data)))
+        position += len(data)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header + b"".join(table))
+        for data in sections:
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return position
+
+
+class Checkpoint:
+    """
+    Checkpoint aberto com mmap: só o cabeçalho e a tabela de seções são lidos
+    ao abrir; cada seção é fatiada do mapa quando pedida.
+    """
+
+    def __init__(self, f, data, header, sections):
+        self._file = f
+        self._data = data
+        self._sections = sections
+        _, _, _, _, self.created, offset, inode, size, _ = header
+        self.journal = {"offset": offset, "inode": inode or None, "size": size}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def section(self, name: bytes) -> bytes:
+        offset, length = self._sections[name]
+        return self._data[offset : offset + length]
+
+    def seen(self):
+        """(ids, hashes) no formato de SeenStore.restore()."""
+        return self.section(b"ids"), self.section(b"hashes")
+
+    def inventory(self):
+        """Snapshot para AdInventory.restore()."""
+        return marshal.loads(self.section(b"ads"))
+
+
+def _read_header(data, size: int):
+    """(cabeçalho, seções) ou (None, motivo) se o arquivo não serve."""
+    if size < HEADER.size:
+        return None, "arquivo truncado"
+    header = HEADER.unpack_from(data)
+    magic, version, marshal_version, rules_version, *_, count = header
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return None, f"formato {magic!r} v{version}"
+    if marshal_version != marshal.version:
+        return None, f"marshal v{marshal_version}"
+    if rules_version != NORMALIZER_RULES_VERSION.encode():
+        return None, f"regras do normalizer {rules_version.decode()}"
+
+    sections = {}
+    for i in range(count):
+        name, offset, length = SECTION.unpack_from(data, HEADER.size + SECTION.size * i)
+        if offset + length > size:
+            return None, "arquivo truncado"
+        sections[name.rstrip(b"\0")] = (offset, length)
+    if any(name not in sections for name in SECTIONS):
+        return None, "seções faltando"
+    return header, sections
+
+
+def load_checkpoint(path: str = CHECKPOINT_FILE):
+    """Checkpoint aberto, ou None se não existe ou é de outra versão."""
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+
+    size = os.fstat(f.fileno()).st_size
+    if size == 0:
+        f.close()
+        return None
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header, sections = _read_header(data, size)
+    if header is None:
+        data.close()
+        f.close()
+        print(f"[CHECKPOINT] {path} ignorado ({sections}).")
+        return None
+    return Checkpoint(f, data, header, sections)
+
+
+if __name__ == "__main__":
+    checkpoint = load_checkpoint()
+    if checkpoint is None:
+        print(f"[CHECKPOINT] nenhum checkpoint utilizável em {CHECKPOINT_FILE}.")
+    else:
+        with checkpoint:
+            ids, hashes = checkpoint.seen()
+            age = time.time() - checkpoint.created
+            print(
+                f"[CHECKPOINT] {CHECKPOINT_FILE}: gravado há {age / 60:.0f} min, "
+                f"offset {checkpoint.journal['offset']} "
+                f"(inode {checkpoint.journal['inode']}), "
+                f"{len(ids) // 16} ids e {len(hashes) // 16} hashes vistos, "
+                f"{os.path.getsize(CHECKPOINT_FILE) / (1024 * 1024):.1f} MB."
+            )
@@ -0,0 +1,188 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from classifier import classify_message, CLASSIFIER_RULES_VERSION
+
+CLASSIFICATION_CACHE_FILE = "../data/classification_cache.db"
+MAX_MEMORY_ENTRIES = 50_000
+# PRAGMA user_version do arquivo; incrementar ao mudar as tabelas.
+SCHEMA_VERSION = 1
+
+
+def message_key(text: str) -> str:
+    """Chave do cache: MD5 do texto exato da mensagem."""
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+class ClassificationCache:
+    """
+    Cache persistente de classify_message pelo texto exato da mensagem.
+
+    A chave inclui a versão das regras do classifier, então qualquer mudança em
+    sinais/padrões invalida o que foi salvo antes. Em memória é um LRU limitado;
+    o resto fica em uma tabela SQLite em ../data.
+
+    A chave não é o ad_hash: ele ignora caixa e pontuação, e o classifier
+    não ("R$ 800.000" casa o PRICE_PATTERN, "R 800 000" não), então dois
+    textos com o mesmo ad_hash podem ter rótulos diferentes. O ad_hash fica
+    guardado ao lado só para o cleaner descartar entradas (discard/retain).
+    """
+
+    def __init__(
+        self,
+        path: str = CLASSIFICATION_CACHE_FILE,
+        rules_version: str = CLASSIFIER_RULES_VERSION,
+        max_entries: int = MAX_MEMORY_ENTRIES,
+    ):
+        self.rules_version = rules_version
+        self.max_entries = max_entries
+        # chave -> (rótulo, ad_hash)
+        self._lru = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        (schema,) = self._conn.execute("PRAGMA user_version").fetchone()
+        if schema != SCHEMA_VERSION:
+            self._create_schema()
+
+    def _create_schema(self):
+        """Cria as tabelas uma vez; esquema de outra versão é descartado (é só cache)."""
+        self._conn.executescript(
+            "DROP TABLE IF EXISTS classifications;"
+            "CREATE TABLE classifications ("
+            " rules_version TEXT NOT NULL,"
+            " message_key TEXT NOT NULL,"
+            " ad_hash TEXT,"
+            " label TEXT NOT NULL,"
+            " PRIMARY KEY (rules_version, message_key)"
+            ") WITHOUT ROWID;"
+            "CREATE INDEX classifications_hash ON classifications (ad_hash);"
+            f"PRAGMA user_version = {SCHEMA_VERSION};"
+        )
+
+    def _remember(self, key: str, label: str, ad_hash):
+        self._lru[key] = (label, ad_hash)
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._conn.execute(
+                    "SELECT label, ad_hash FROM classifications"
+                    " WHERE rules_version = ? AND message_key = ?",
+                    (self.rules_version, key),
+                ).fetchone()
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.disk_hits += 1
+            self._remember(key, *entry)
+            return entry[0]
+
+    def put(self, key: str, label: str, ad_hash=None):
+        with self._lock:
+            self._remember(key, label, ad_hash)
+            self._pending[key] = (label, ad_hash)
+
+    def classify(self, message_data: dict) -> str:
+        """classify_message com cache; mensagens sem texto não são cacheadas."""
+        text = message_data.get("message")
+        if not text or not isinstance(text, str):
+            return classify_message(message_data)
+
+        key = message_key(text)
+        label = self.get(key)
+        if label is None:
+            label = classify_message(message_data)
+            self.put(key, label, message_data.get("ad_hash"))
+        return label
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO classifications"
+                " (rules_version, message_key, ad_hash, label) VALUES (?, ?, ?, ?)",
+                [
+                    (self.rules_version, key, ad_hash, label)
+                    for key, (label, ad_hash) in self._pending.items()
+                ],
+            )
+            self._conn.commit()
+            self._pending = {}
+
+    def purge_stale(self) -> int:
+        """Remove entradas de versões antigas das regras."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM classifications WHERE rules_version != ?",
+                (self.rules_version,),
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def _forget(self, predicate):
+        for key in [k for k, (_, h) in self._lru.items() if predicate(h)]:
+            del self._lru[key]
+        for key in [k for k, (_, h) in self._pending.items() if predicate(h)]:
+            del self._pending[key]
+
+    def retain(self, ad_hashes) -> int:
+        """Mantém só as entradas cujo ad_hash ainda está no messages.jsonl."""
+        kept = {h for h in ad_hashes if h}
+        with self._lock:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (ad_hash TEXT)")
+            self._conn.execute("DELETE FROM keep")
+            self._conn.executemany("INSERT INTO keep VALUES (?)", ((h,) for h in kept))
+            cursor = self._conn.execute(
+                "DELETE FROM classifications"
+                " WHERE ad_hash IS NULL OR ad_hash NOT IN (SELECT ad_hash FROM keep)"
+            )
+            self._conn.execute("DELETE FROM keep")
+            self._conn.commit()
+            self._forget(lambda h: h not in kept)
+            return cursor.rowcount
+
+    def discard(self, ad_hashes) -> int:
+        """Remove entradas de hashes que saíram do journal (só a versão atual; purge_stale cuida do resto)."""
+        hashes = {h for h in ad_hashes if h}
+        with self._lock:
+            cursor = self._conn.executemany(
+                "DELETE FROM classifications WHERE rules_version = ? AND ad_hash = ?",
+                [(self.rules_version, h) for h in hashes],
+            )
+            self._conn.commit()
+            self._forget(lambda h: h in hashes)
+            return cursor.rowcount
+
+    def stats(self) -> dict:
+        total = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / total if total else 0.0,
+            "memory_entries": len(self._lru),
+        }
+
+    def close(self):
+        self.flush()
+        self._conn.close()
@@ -1,8 +1,9 @@
+import hashlib
 import re
-import spacy
-from typing import List, Dict, Any, Tuple
-
-nlp = spacy.load("pt_core_news_lg")
+from functools import cached_property
+from typing import List, Dict, Any, Tuple, NamedTuple
+from keyword_automaton import KeywordAutomaton
+from nlp_provider import get_nlp
 
 SELLING_SIGNALS = {
     "strong": [
@@ -111,6 +112,12 @@ USELESS_PATTERNS = [
 
 RENTAL_KEYWORDS = ["locacao", "locação", "aluguel", "aluga", "alugar"]
 
+DIRECT_SELLING_PHRASES = [
+    "minhas opcoes",
+    "minhas opcoes diretas",
+    "opcoes diretas para venda",
+]
+
 
 def normalize_text(text: str) -> str:
     text = text.lower()
@@ -142,61 +149,119 @@ def normalize_text(text: str) -> str:
     return text
 
 
-def calculate_selling_score(normalized_text: str) -> Tuple[int, List[str]]:
+PRICE_PATTERN = re.compile(r"(r\$|valor:|preco:)\s*[\d.,]+")
+AREA_PATTERN = re.compile(r"\d+\s*m[2²]")
+ROOMS_PATTERN = re.compile(r"\d+\s*(quarto|suite)")
+HIGH_VALUE_PATTERN = re.compile(r"[\d.,]+\s*(milhao|milhoes|mil)")
+
+COMPILED_USELESS_PATTERNS = [re.compile(pattern) for pattern in USELESS_PATTERNS]
+
+# Incrementar ao mudar a lógica de classify_message (limiares, ordem das regras).
+CLASSIFIER_RULES_REVISION = 1
+
+# Versão das regras usada como chave do cache de classificação: muda sozinha
+# quando qualquer tabela de sinais/padrões é editada.
+CLASSIFIER_RULES_VERSION = hashlib.md5(
+    repr(
+        (
+            CLASSIFIER_RULES_REVISION,
+            SELLING_SIGNALS,
+            BUYING_SIGNALS,
+            USELESS_PATTERNS,
+            RENTAL_KEYWORDS,
+            DIRECT_SELLING_PHRASES,
+        )
+    ).encode()
+).hexdigest()[:12]
+
+
+class SignalScan(NamedTuple):
+    sell_score: int
+    sell_matches: List[str]
+    buy_score: int
+    buy_matches: List[str]
+    rental: bool
+    direct_selling: bool
+
+
+def _flatten_signals(signals: Dict[str, List[Tuple[str, int]]]):
+    """
+    palavra-chave -> [(posição na tabela, peso, rótulo)], para montar score e
+    lista de matches na mesma ordem da varredura antiga, tabela por tabela.
+    """
+    entries = [entry for group in signals.values() for entry in group]
+    hits = {}
+    for position, (keyword, weight) in enumerate(entries):
+        hits.setdefault(keyword, []).append((position, weight, f"{keyword}(+{weight})"))
+    return hits
+
+
+_SELLING_HITS = _flatten_signals(SELLING_SIGNALS)
+_BUYING_HITS = _flatten_signals(BUYING_SIGNALS)
+_RENTAL_SET = frozenset(RENTAL_KEYWORDS)
+_DIRECT_SELLING_SET = frozenset(DIRECT_SELLING_PHRASES)
+
+# Uma única varredura cobre sinais de venda/compra, locação e vendas diretas.
+_SIGNAL_AUTOMATON = KeywordAutomaton(
+    list(_SELLING_HITS) + list(_BUYING_HITS) + RENTAL_KEYWORDS + DIRECT_SELLING_PHRASES
+)
+
+
+def _score_hits(table, found) -> Tuple[int, List[str]]:
+    hits = []
+    for keyword in found:
+        entries = table.get(keyword)
+        if entries:
+            hits.extend(entries)
+    hits.sort()
+    return sum(h[1] for h in hits), [h[2] for h in hits]
+
+
+def _selling_extras(normalized_text: str) -> Tuple[int, List[str]]:
     score = 0
     matches = []
 
-    for keyword, weight in SELLING_SIGNALS["strong"]:
-        if keyword in normalized_text:
-            score += weight
-            matches.append(f"{keyword}(+{weight})")
-
-    for keyword, weight in SELLING_SIGNALS["medium"]:
-        if keyword in normalized_text:
-            score += weight
-            matches.append(f"{keyword}(+{weight})")
-
-    for keyword, weight in SELLING_SIGNALS["indicators"]:
-        if keyword in normalized_text:
-            score += weight
-            matches.append(f"{keyword}(+{weight})")
-
-    has_price = bool(re.search(r"(r\$|valor:|preco:)\s*[\d.,]+", normalized_text))
-    has_area = bool(re.search(r"\d+\s*m[2²]", normalized_text))
-    has_rooms = bool(re.search(r"\d+\s*(quarto|suite)", normalized_text))
-    has_high_value = bool(re.search(r"[\d.,]+\s*(milhao|milhoes|mil)", normalized_text))
-
-    if has_price:
+    if PRICE_PATTERN.search(normalized_text):
         score += 8
         matches.append("preco(+8)")
-    if has_area:
+    if AREA_PATTERN.search(normalized_text):
         score += 6
         matches.append("area(+6)")
-    if has_rooms:
+    if ROOMS_PATTERN.search(normalized_text):
         score += 5
         matches.append("quartos(+5)")
-    if has_high_value:
+    if HIGH_VALUE_PATTERN.search(normalized_text):
         score += 4
         matches.append("valor_alto(+4)")
 
     return score, matches
 
 
-def calculate_buying_score(normalized_text: str) -> Tuple[int, List[str]]:
-    score = 0
-    matches = []
+def scan_signals(normalized_text: str) -> SignalScan:
+    found = _SIGNAL_AUTOMATON.find(normalized_text)
 
-    for keyword, weight in BUYING_SIGNALS["strong"]:
-        if keyword in normalized_text:
-            score += weight
-            matches.append(f"{keyword}(+{weight})")
+    sell_score, sell_matches = _score_hits(_SELLING_HITS, found)
+    extra_score, extra_matches = _selling_extras(normalized_text)
+    buy_score, buy_matches = _score_hits(_BUYING_HITS, found)
 
-    for keyword, weight in BUYING_SIGNALS["medium"]:
-        if keyword in normalized_text:
-            score += weight
-            matches.append(f"{keyword}(+{weight})")
+    return SignalScan(
+        sell_score=sell_score + extra_score,
+        sell_matches=sell_matches + extra_matches,
+        buy_score=buy_score,
+        buy_matches=buy_matches,
+        rental=not found.isdisjoint(_RENTAL_SET),
+        direct_selling=not found.isdisjoint(_DIRECT_SELLING_SET),
+    )
+
+
+def calculate_selling_score(normalized_text: str) -> Tuple[int, List[str]]:
+    scan = scan_signals(normalized_text)
+    return scan.sell_score, scan.sell_matches
 
-    return score, matches
+
+def calculate_buying_score(normalized_text: str) -> Tuple[int, List[str]]:
+    scan = scan_signals(normalized_text)
+    return scan.buy_score, scan.buy_matches
 
 
 def classify_message(message_data: Dict[str, Any], debug: bool = False) -> str:
@@ -206,27 +271,25 @@ def classify_message(message_data: Dict[str, Any], debug: bool = False) -> str:
         return "useless"
 
     normalized = normalize_text(message)
+    scan = scan_signals(normalized)
 
-    if any(kw in normalized for kw in RENTAL_KEYWORDS):
+    if scan.rental:
         return "useless"
 
-    for pattern in USELESS_PATTERNS:
-        if re.match(pattern, normalized.strip()):
+    stripped = normalized.strip()
+    for pattern in COMPILED_USELESS_PATTERNS:
+        if pattern.match(stripped):
             return "useless"
 
-    sell_score, sell_matches = calculate_selling_score(normalized)
-    buy_score, buy_matches = calculate_buying_score(normalized)
+    sell_score, sell_matches = scan.sell_score, scan.sell_matches
+    buy_score, buy_matches = scan.buy_score, scan.buy_matches
 
     if debug:
         print(f"\nMensagem: {message[:60]}...")
         print(f"Venda Score: {sell_score} - {sell_matches}")
         print(f"Compra Score: {buy_score} - {buy_matches}")
 
-    if (
-        "minhas opcoes" in normalized
-        or "minhas opcoes diretas" in normalized
-        or "opcoes diretas para venda" in normalized
-    ):
+    if scan.direct_selling:
         return "selling"
 
     if buy_score >= 15:
@@ -252,20 +315,28 @@ class Message:
         self.author_phone = data_line.get("author_phone", "Desconhecido")
         self.raw_message = data_line.get("message", "")
         self.normalized_message = normalize_text(self.raw_message)
-        self.doc = nlp(self.normalized_message)
         self.type = ""
 
+    @cached_property
+    def doc(self):
+        """Só é processado pelo spaCy se lemmas/entities forem usados."""
+        return get_nlp()(self.normalized_message)
+
     @property
     def lemmas(self) -> List[str]:
+        if self.doc is None:
+            return []
         return [token.lemma_ for token in self.doc if not token.is_stop]
 
     @property
     def entities(self):
+        if self.doc is None:
+            return []
         return [(ent.text, ent.label_) for ent in self.doc.ents]
 
     def classify(self) -> str:
-        sell_score, _ = calculate_selling_score(self.normalized_message)
-        buy_score, _ = calculate_buying_score(self.normalized_message)
+        scan = scan_signals(self.normalized_message)
+        sell_score, buy_score = scan.sell_score, scan.buy_score
 
         if buy_score >= 15 and buy_score > sell_score:
             self.type = "COMPRA"
@@ -299,6 +370,9 @@ class BuyingMessage(Message):
 
 
 class UselessMessage(Message):
+    # Mensagens inúteis nunca passam pelo spaCy.
+    doc = None
+
     def __init__(self, data_line: Dict[str, Any]):
         super().__init__(data_line)
         self.type = "INÚTIL"
@@ -342,7 +416,7 @@ def print_messages(
         print(f"... e mais {len(messages) - max_display} mensagens")
 
 
-def run_classifier(data) -> None:
+def run_classifier(data, cache=None) -> None:
     if not data:
         print("Nenhuma mensagem carregada. Encerrando.")
         return
@@ -351,8 +425,10 @@ def run_classifier(data) -> None:
     buyers: List[BuyingMessage] = []
     useless: List[UselessMessage] = []
 
+    classify = cache.classify if cache is not None else classify_message
+
     for message_data in data:
-        classification = classify_message(message_data)
+        classification = classify(message_data)
 
         if classification == "selling":
             sellers.append(SellingMessage(message_data))
@@ -361,4 +437,4 @@ def run_classifier(data) -> None:
         else:
             useless.append(UselessMessage(message_data))
 
-    return sellers, buyers, useless
\ No newline at end of file
+    return sellers, buyers, useless
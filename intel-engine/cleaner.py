@@ -1,14 +1,23 @@
+import bisect
+import itertools
 import json
 import time
 import os
 import hashlib
 import re
 import unicodedata
-from classifier import classify_message
+from author_index import AuthorIndex, AUTHOR_INDEX_FILE
+from classification_cache import ClassificationCache
+from compaction import compact_file, iter_raw_lines
+from dedup_store import SeenStore
+from egest import OPPORTUNITY_ADS_FILE, OpportunityStore, _locked
+from engine import load_state, save_state, remap_journal
+from journal import Journal, iter_sealed_lines, segment_name, segment_start
+from record_scanner import RecordScanner, parse_record
+from sqlite_store import STORAGE_BACKEND, SqliteStore
 
 MESSAGES_FILE = "../data/messages.jsonl"
 OPPORTUNITIES_FILE = "../data/opportunities.jsonl"
-ENGINE_STATE_FILE = "../data/engine_state.json"
 DISPATCH_STATE_FILE = "../data/state.json"
 
 THREE_MONTHS = 7_776_000
@@ -29,53 +38,85 @@ def _compute_ad_hash(message_text: str) -> str:
     return hashlib.md5(_normalize_for_hash(message_text).encode()).hexdigest()
 
 
-def _load_jsonl(filepath: str):
-    """Lê um .jsonl e retorna lista de (linha_raw, objeto_parsed). Ignora linhas inválidas."""
-    results = []
-    with open(filepath, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                results.append((line, json.loads(line)))
-            except json.JSONDecodeError:
-                results.append((line, None))
-    return results
+def _scan_jsonl(filepath: str, fields):
+    """
+    (offset, linha, record) para cada linha completa do .jsonl, em streaming;
+    record traz só os fields (RecordScanner) e é None quando a linha não é
+    JSON válido. Junto, o tamanho lido (fim da última linha), que delimita o
+    que a compactação decide.
+    """
+    scanner = RecordScanner(fields)
+    scanned = {"size": 0}
 
+    def rows():
+        with open(filepath, "rb") as f:
+            for offset, line in iter_raw_lines(f):
+                scanned["size"] = offset + len(line)
+                if not line.strip():
+                    continue
+                yield offset, line, scanner.extract(line)
 
-def _write_jsonl(filepath: str, objects: list):
-    with open(filepath, "w", encoding="utf-8") as f:
-        for obj in objects:
-            f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+    return rows(), scanned
 
 
-def sync_engine_state(kept_message_ids: list):
-    try:
-        with open(ENGINE_STATE_FILE) as f:
-            state = json.load(f)
-    except Exception:
-        return
+def _tail_collector(keys):
+    """on_tail para compact_file: guarda os valores de keys das linhas novas."""
+    scanner = RecordScanner(keys)
+    collected = {key: [] for key in keys}
 
-    kept_id_set = set(kept_message_ids)
-    state["seen_ids"] = [mid for mid in state.get("seen_ids", []) if mid in kept_id_set]
+    def on_tail(line):
+        record = scanner.extract(line)
+        if record is None:
+            return
+        for key in keys:
+            if record.get(key):
+                collected[key].append(record[key])
 
-    with open(ENGINE_STATE_FILE, "w") as f:
-        json.dump(state, f)
+    return on_tail, collected
 
 
-def sync_engine_state_hashes(kept_hashes: list):
-    """Atualiza seen_hashes no engine_state para refletir o que realmente está no arquivo."""
-    try:
-        with open(ENGINE_STATE_FILE) as f:
-            state = json.load(f)
-    except Exception:
+def sync_engine_state(removed_ids, removed_hashes):
+    """Tira do estado de dedup do engine as chaves que saíram do journal."""
+    seen = SeenStore()
+    if not seen.exists():
         return
+    seen.ids.discard(removed_ids)
+    seen.hashes.discard(removed_hashes)
+
+
+def sync_classification_cache(cache, removed_hashes):
+    """Remove do cache de classificação hashes descartados e versões antigas."""
+    stats = cache.stats()
+    cache.flush()
+    stale = cache.purge_stale()
+    dropped = cache.discard(removed_hashes)
+    cache.close()
+    print(
+        f"[CLEANER] cache de classificação: {stats['hits']} hits, "
+        f"{stats['disk_hits']} do disco, {stats['misses']} misses, "
+        f"{stale + dropped} entradas removidas."
+    )
 
-    state["seen_hashes"] = kept_hashes
 
-    with open(ENGINE_STATE_FILE, "w") as f:
-        json.dump(state, f)
+def sync_opportunity_index():
+    """
+    Reindexa o opportunities.jsonl reescrito (offsets mudaram) e tira do
+    opportunity_ads.jsonl os anúncios que nenhuma oportunidade cita mais.
+    """
+    store = OpportunityStore()
+    store.rebuild()
+    dropped = store.compact_ads()
+    store.close()
+    return dropped
+
+
+def sync_author_index():
+    """Reconstrói o índice de autores do purge, se existir (offsets mudaram)."""
+    if not os.path.exists(AUTHOR_INDEX_FILE):
+        return
+    index = AuthorIndex()
+    index.rebuild()
+    index.close()
 
 
 def sync_dispatch_state(kept_opp_ids: list):
@@ -94,86 +135,392 @@ def sync_dispatch_state(kept_opp_ids: list):
         json.dump(state, f, indent=2)
 
 
-def clean_and_dedup_messages():
+def _classify_line(line: bytes, cache):
     """
-    Faz três coisas em uma única passagem sobre messages.jsonl:
-      1. Remove mensagens mais antigas que THREE_MONTHS.
-      2. Remove mensagens de compradores mais antigas que THIRTY_DAYS.
-      3. Remove duplicatas — tanto por message_id quanto por ad_hash.
-         - Se o ad_hash não existir no registro, recalcula a partir do texto.
-         - Quando há duplicata de conteúdo, mantém a mais recente.
+    (rótulo, objeto decodificado). O cache é pelo texto exato da mensagem,
+    então a linha é sempre decodificada. O rótulo é None quando a linha não
+    é JSON válido (o caminho rápido do RecordScanner sem orjson só confere o
+    enquadramento); quem chama descarta a linha, como faz com record None.
     """
-    if not os.path.exists(MESSAGES_FILE):
-        return
+    obj = parse_record(line)
+    if obj is None:
+        return None, None
+    return cache.classify(obj), obj
 
-    now = int(time.time())
+
+def _dedup_hash(line: bytes, stored_hash, obj):
+    """ad_hash do dedup; se não existir no registro, recalcula a partir do texto."""
+    if stored_hash:
+        return stored_hash
+    obj = obj or parse_record(line)
+    msg_text = obj.get("message", "") if obj is not None else ""
+    return _compute_ad_hash(msg_text) if msg_text else None
+
+
+def _kept_shift(keep: dict, scanned_size: int):
+    """
+    shift para remap_journal depois do compact_file: posição no arquivo
+    antigo -> bytes mantidos antes dela. keep: offset -> tamanho da linha.
+    """
+    offsets = sorted(keep)
+    ends, total = [], 0
+    for offset in offsets:
+        total += keep[offset]
+        ends.append(total)
+
+    def shift(position):
+        if position > scanned_size:
+            return total + position - scanned_size
+        i = bisect.bisect_left(offsets, position)
+        return ends[i - 1] if i else 0
+
+    return shift
+
+
+def roll_messages(journal, now: int, cache):
+    """
+    Limpa o messages.jsonl e sela em segmentos do journal as mensagens de
+    períodos já fechados:
+      1. Remove mensagens mais antigas que THREE_MONTHS e de compradores mais
+         antigas que THIRTY_DAYS.
+      2. Remove duplicatas — tanto por message_id quanto por ad_hash.
+         - Se o ad_hash não existir no registro, recalcula a partir do texto.
+         - Quando há duplicata de conteúdo, mantém a mais recente; uma cópia
+           mais antiga já selada vira tombstone no segmento dela.
+      3. Move para o segmento do dia (compradores num segmento "buying"
+         próprio) as mensagens de dias anteriores que o engine já leu.
+
+    A passagem só monta o índice de vencedores (chave -> offset, timestamp);
+    o Journal.roll anexa as seladas aos segmentos e compact_file reescreve o
+    arquivo ativo com o resto, preservando o que o collector anexar enquanto
+    isso.
+
+    Retorna duas listas de (message_id, ad_hash): as que continuam no arquivo
+    ativo e as que podem ter saído do journal (lidas do arquivo ativo ou
+    substituídas por tombstone), a conferir contra o que ficou selado.
+    """
     cutoff_3m = now - THREE_MONTHS
     cutoff_30d = now - THIRTY_DAYS
+    today = segment_start(now)
+
+    # Só é selado o que o engine já leu; o resto fica no arquivo ativo.
+    stat = os.stat(MESSAGES_FILE)
+    engine_journal = load_state()["journal"]
+    limit = None
+    if engine_journal.get("inode") == stat.st_ino:
+        limit = engine_journal.get("offset", 0)
 
-    rows = _load_jsonl(MESSAGES_FILE)
+    rows, scanned = _scan_jsonl(MESSAGES_FILE, ("message_id", "ad_hash", "timestamp"))
 
-    candidates = []
+    lines = 0
+    candidates = 0
+    scanned_keys = []
     removed_age = 0
     removed_buyer_age = 0
 
-    for raw, obj in rows:
-        if obj is None:
+    # message_id -> (offset, tamanho, timestamp, ad_hash, message_id,
+    # ad_hash gravado, comprador); sem message_id, vale o offset.
+    by_id: dict = {}
+    for offset, line, record in rows:
+        lines += 1
+        if record is None:
             continue
 
-        ts = obj.get("timestamp", 0)
+        ts = record.get("timestamp", 0)
+        stored_hash = record.get("ad_hash")
+        scanned_keys.append((record.get("message_id"), stored_hash))
 
         if ts < cutoff_3m:
             removed_age += 1
             continue
 
-        classification = classify_message(obj)
-        if classification == "buying" and ts < cutoff_30d:
+        classification, obj = _classify_line(line, cache)
+        if classification is None:
+            continue
+        buying = classification == "buying"
+        if buying and ts < cutoff_30d:
             removed_buyer_age += 1
             continue
 
-        candidates.append(obj)
+        candidates += 1
+        ad_hash = _dedup_hash(line, stored_hash, obj)
 
-    by_id: dict[str, dict] = {}
-    for obj in candidates:
-        mid = obj.get("message_id")
-        if not mid:
-            by_id[id(obj)] = obj
-            continue
-        existing = by_id.get(mid)
-        if existing is None or obj.get("timestamp", 0) > existing.get("timestamp", 0):
-            by_id[mid] = obj
-
-    by_hash: dict[str, dict] = {}
-    for obj in by_id.values():
-        ad_hash = obj.get("ad_hash")
-        if not ad_hash:
-            msg_text = obj.get("message", "")
-            ad_hash = _compute_ad_hash(msg_text) if msg_text else None
+        mid = record.get("message_id")
+        key = mid if mid else offset
+        existing = by_id.get(key)
+        if existing is None or ts > existing[2]:
+            by_id[key] = (offset, len(line), ts, ad_hash, mid, stored_hash, buying)
 
+    # ad_hash -> (offset, tamanho, timestamp, message_id, ad_hash gravado, comprador)
+    by_hash: dict = {}
+    for key, (offset, length, ts, ad_hash, mid, stored_hash, buying) in by_id.items():
+        winner = (offset, length, ts, mid, stored_hash, buying)
         if not ad_hash:
-            by_hash[obj.get("message_id", str(id(obj)))] = obj
+            by_hash[mid if mid else key] = winner
             continue
 
         existing = by_hash.get(ad_hash)
-        if existing is None or obj.get("timestamp", 0) > existing.get("timestamp", 0):
-            by_hash[ad_hash] = obj
-
-    kept = list(by_hash.values())
-    removed_dedup = len(candidates) - len(kept)
-
-    _write_jsonl(MESSAGES_FILE, kept)
+        if existing is None or ts > existing[2]:
+            by_hash[ad_hash] = winner
+    del by_id
+
+    winners = list(by_hash.values())
+    del by_hash
+    sealable = [
+        w
+        for w in winners
+        if segment_start(w[2]) < today and (limit is None or w[0] < limit)
+    ]
 
-    kept_ids = [o.get("message_id") for o in kept if o.get("message_id")]
-    kept_hashes = [o.get("ad_hash") for o in kept if o.get("ad_hash")]
-    sync_engine_state(kept_ids)
-    sync_engine_state_hashes(kept_hashes)
+    # Cópias já seladas dos mesmos anúncios: a mais recente vence.
+    sealed: dict = {}
+    for row in journal.find((w[3] for w in sealable), (w[4] for w in sealable)):
+        _, _, mid, ad_hash, _ = row
+        if mid:
+            sealed.setdefault(("id", mid), []).append(row)
+        if ad_hash:
+            sealed.setdefault(("hash", ad_hash), []).append(row)
+
+    moves, targets, tombstones = {}, {}, {}
+    for offset, _, ts, mid, stored_hash, buying in sealable:
+        matches = sealed.get(("id", mid), []) + sealed.get(("hash", stored_hash), [])
+        if any(row[4] > ts for row in matches):
+            continue
+        for segment, sealed_offset, sealed_id, sealed_hash, _ in matches:
+            tombstones.setdefault(segment, set()).add(sealed_offset)
+            scanned_keys.append((sealed_id, sealed_hash))
+
+        start = segment_start(ts)
+        intent = "buying" if buying else None
+        name = segment_name(start, intent)
+        moves[offset] = name
+        targets[name] = (start, intent)
+
+    sealable_offsets = {w[0] for w in sealable}
+    active = [w for w in winners if w[0] not in sealable_offsets]
+    del winners, sealable, sealed
+
+    keep = {offset: length for offset, length, *_ in active}
+    kept_keys = [(mid, stored_hash) for _, _, _, mid, stored_hash, _ in active]
+    del active
+
+    if moves or tombstones or len(keep) != lines:
+        on_tail, appended = _tail_collector(("message_id", "ad_hash"))
+        kept, tail, moved = journal.roll(
+            MESSAGES_FILE, moves, targets, keep, scanned["size"], tombstones, on_tail
+        )
+        kept_keys += [(mid, None) for mid in appended["message_id"]]
+        kept_keys += [(None, h) for h in appended["ad_hash"]]
+        sync_author_index()
+
+        if limit is not None:
+            state = load_state()
+            if remap_journal(state, stat.st_ino, _kept_shift(keep, scanned["size"])):
+                save_state(state)
+    else:
+        kept, tail, moved = len(keep), 0, 0
 
     print(
         f"[CLEANER] messages.jsonl: "
         f"{removed_age} removidas (3 meses), "
         f"{removed_buyer_age} compradores antigos removidos, "
-        f"{removed_dedup} duplicatas removidas, "
-        f"{len(kept)} mantidas."
+        f"{candidates - len(keep) - moved} duplicatas removidas, "
+        f"{moved} seladas em {len(targets)} segmentos, "
+        f"{sum(map(len, tombstones.values()))} cópias seladas substituídas, "
+        f"{kept} mantidas, "
+        f"{tail} anexadas durante a limpeza."
+    )
+    return kept_keys, scanned_keys
+
+
+def seal_into_store(store, journal, now: int, cache):
+    """
+    Backend sqlite (INTEL_STORAGE=sqlite): o histórico vai para o store.db em
+    vez dos segmentos do journal.
+      1. Os segmentos que ainda existirem (migração do backend jsonl) e as
+         linhas do messages.jsonl que o engine já leu são gravados numa
+         única transação (SqliteStore.seal), com o mesmo dedup por
+         message_id e ad_hash do roll_messages. Os segmentos migrados são
+         apagados depois.
+      2. O messages.jsonl fica só com o que o engine ainda não leu, pela
+         mesma compactação do roll_messages.
+
+    A retenção (THREE_MONTHS, THIRTY_DAYS para compradores) vira um DELETE
+    indexado no banco, feito antes de gravar as linhas novas.
+
+    Uma queda entre a transação e a compactação só faz as mesmas linhas
+    serem gravadas de novo na próxima execução, o que não muda nada.
+    Retorna as mesmas duas listas de roll_messages.
+    """
+    cutoff_3m = now - THREE_MONTHS
+    cutoff_30d = now - THIRTY_DAYS
+    fields = ("message_id", "ad_hash", "timestamp", "author_id")
+    scanner = RecordScanner(fields)
+    counts = {"lines": 0, "age": 0, "buyer_age": 0}
+    scanned_keys = []
+    kept_keys = []
+    keep = {}
+
+    def row(line, record):
+        ts = record.get("timestamp", 0)
+        stored_hash = record.get("ad_hash")
+        scanned_keys.append((record.get("message_id"), stored_hash))
+        if ts < cutoff_3m:
+            counts["age"] += 1
+            return None
+        classification, obj = _classify_line(line, cache)
+        if classification is None:
+            return None
+        if classification == "buying" and ts < cutoff_30d:
+            counts["buyer_age"] += 1
+            return None
+        ad_hash = _dedup_hash(line, stored_hash, obj)
+        return (
+            record.get("message_id"),
+            ad_hash,
+            record.get("author_id"),
+            ts,
+            classification,
+            line,
+        )
+
+    def segment_rows():
+        for line in iter_sealed_lines(journal.directory):
+            record = scanner.extract(line)
+            if record is not None:
+                yield row(line, record)
+
+    # Só é selado o que o engine já leu; o resto fica no arquivo ativo.
+    stat, limit, scanned = None, None, {"size": 0}
+    active = iter(())
+    if os.path.exists(MESSAGES_FILE):
+        stat = os.stat(MESSAGES_FILE)
+        engine_journal = load_state()["journal"]
+        if engine_journal.get("inode") == stat.st_ino:
+            limit = engine_journal.get("offset", 0)
+        active, scanned = _scan_jsonl(MESSAGES_FILE, fields)
+
+    def active_rows():
+        for offset, line, record in active:
+            counts["lines"] += 1
+            if record is None:
+                continue
+            if limit is None or offset >= limit:
+                keep[offset] = len(line)
+                kept_keys.append((record.get("message_id"), record.get("ad_hash")))
+                continue
+            yield row(line, record)
+
+    # A retenção vem antes: uma cópia vencida no banco não pode ganhar o dedup.
+    expired = store.expire(cutoff_3m, cutoff_30d)
+    rows = itertools.chain(segment_rows(), active_rows())
+    sealed, displaced = store.seal(r for r in rows if r is not None)
+
+    migrated = len(journal.segments)
+    if migrated:
+        # Tudo o que estava nos segmentos já está no banco.
+        journal.expire(float("inf"), float("inf"))
+
+    tail = 0
+    if stat is not None and len(keep) != counts["lines"]:
+        on_tail, appended = _tail_collector(("message_id", "ad_hash"))
+        _, tail = compact_file(MESSAGES_FILE, keep, scanned["size"], on_tail)
+        kept_keys += [(mid, None) for mid in appended["message_id"]]
+        kept_keys += [(None, h) for h in appended["ad_hash"]]
+        sync_author_index()
+
+        if limit is not None:
+            state = load_state()
+            if remap_journal(state, stat.st_ino, _kept_shift(keep, scanned["size"])):
+                save_state(state)
+
+    print(
+        f"[CLEANER] store.db: "
+        f"{migrated} segmentos migrados, "
+        f"{sealed} mensagens gravadas, "
+        f"{counts['age']} removidas (3 meses), "
+        f"{counts['buyer_age']} compradores antigos removidos, "
+        f"{len(displaced)} duplicatas removidas, "
+        f"{len(expired)} expiradas no banco, "
+        f"{len(keep)} mantidas no messages.jsonl, "
+        f"{tail} anexadas durante a limpeza."
+    )
+    return kept_keys, scanned_keys + displaced + expired
+
+
+def clean_and_dedup_messages():
+    """
+    Retenção do journal de mensagens sem reescrever o histórico: segmentos
+    selados mais antigos que THREE_MONTHS (THIRTY_DAYS para os de
+    compradores) são apagados inteiros, e só o messages.jsonl, que guarda
+    pouco mais que o dia corrente, é limpo e selado (roll_messages).
+
+    No backend sqlite, o histórico fica no store.db (seal_into_store).
+
+    O estado de dedup do engine e o cache de classificação perdem só as
+    chaves que saíram e não existem mais em nenhum lugar do journal.
+    """
+    now = int(time.time())
+    cache = ClassificationCache()
+    journal = Journal()
+    store = None
+
+    kept = []
+    if STORAGE_BACKEND == "sqlite":
+        store = SqliteStore()
+        kept, removed = seal_into_store(store, journal, now, cache)
+    else:
+        expired, removed = journal.expire(now - THREE_MONTHS, now - THIRTY_DAYS)
+        print(
+            f"[CLEANER] journal: {len(expired)} segmentos expirados "
+            f"({len(removed)} mensagens)."
+        )
+        if os.path.exists(MESSAGES_FILE):
+            kept, scanned = roll_messages(journal, now, cache)
+            removed += scanned
+
+    removed_ids = {mid for mid, _ in removed if mid}
+    removed_hashes = {h for _, h in removed if h}
+    present_ids = {mid for mid, _ in kept if mid}
+    present_hashes = {h for _, h in kept if h}
+    present = {row[2:4] for row in journal.find(removed_ids, removed_hashes)}
+    journal.close()
+    if store is not None:
+        present |= store.find(removed_ids, removed_hashes)
+        store.close()
+    for mid, ad_hash in present:
+        present_ids.add(mid)
+        present_hashes.add(ad_hash)
+
+    sync_engine_state(removed_ids - present_ids, removed_hashes - present_hashes)
+    sync_classification_cache(cache, removed_hashes - present_hashes)
+
+
+def clean_opportunities_in_store():
+    """
+    Backend sqlite: importa o que o engine e o wpp-egress gravaram, aplica a
+    retenção de FIFTEEN_DAYS numa transação (oportunidades, anúncios que só
+    elas citavam e entradas do dispatch) e exporta de volta os arquivos. O
+    dedup por id já acontece na importação.
+    """
+    store = SqliteStore()
+    has_dispatch = store.import_dispatch()
+    store.import_opportunities()
+    removed, dropped_ads = store.expire_opportunities(int(time.time()) - FIFTEEN_DAYS)
+    # Lock do OpportunityStore: um append do engine não cai no arquivo que
+    # está sendo trocado nem entre a troca e a reindexação.
+    with _locked(OPPORTUNITY_ADS_FILE):
+        kept = store.export_opportunities()
+        sync_opportunity_index()
+    if has_dispatch:
+        store.export_dispatch()
+    store.close()
+
+    print(
+        f"[CLEANER] store.db: "
+        f"{len(removed)} oportunidades removidas (15 dias), "
+        f"{kept} mantidas, "
+        f"{dropped_ads} anúncios sem referência removidos."
     )
 
 
@@ -182,95 +529,111 @@ def clean_and_dedup_opportunities():
     1. Remove oportunidades mais antigas que FIFTEEN_DAYS.
     2. Remove duplicatas por id (MD5 do par buyer+seller message_id).
        Quando há duplicata, mantém a mais recente (maior timestamp).
+
+    Mesma compactação em streaming do messages.jsonl: linhas anexadas pelo
+    engine durante a limpeza são preservadas.
     """
+    if STORAGE_BACKEND == "sqlite":
+        clean_opportunities_in_store()
+        return
     if not os.path.exists(OPPORTUNITIES_FILE):
         return
 
     now = int(time.time())
     cutoff = now - FIFTEEN_DAYS
 
-    rows = _load_jsonl(OPPORTUNITIES_FILE)
+    rows, scanned = _scan_jsonl(OPPORTUNITIES_FILE, ("id", "timestamp"))
 
     removed_age = 0
-    candidates = []
+    candidates = 0
 
-    for raw, obj in rows:
-        if obj is None:
+    # id -> (offset, timestamp); sem id, a linha é mantida (chave = offset).
+    by_id: dict = {}
+    for offset, _, record in rows:
+        if record is None:
             continue
-        if obj.get("timestamp", 0) < cutoff:
+        ts = record.get("timestamp", 0)
+        if ts < cutoff:
             removed_age += 1
             continue
-        candidates.append(obj)
+        candidates += 1
 
-    by_id: dict[str, dict] = {}
-    for obj in candidates:
-        oid = obj.get("id")
-        if not oid:
-            by_id[str(id(obj))] = obj
-            continue
-        existing = by_id.get(oid)
-        if existing is None or obj.get("timestamp", 0) > existing.get("timestamp", 0):
-            by_id[oid] = obj
+        key = record.get("id") or offset
+        existing = by_id.get(key)
+        if existing is None or ts > existing[1]:
+            by_id[key] = (offset, ts)
 
-    kept = list(by_id.values())
-    removed_dedup = len(candidates) - len(kept)
+    keep = {offset for offset, _ in by_id.values()}
+    kept_ids = [oid for oid in by_id if isinstance(oid, str)]
+    del by_id
 
-    _write_jsonl(OPPORTUNITIES_FILE, kept)
+    on_tail, appended = _tail_collector(("id",))
+    # Mesmo lock do OpportunityStore.append: um append aberto depois da cópia
+    # do fim e antes da troca iria para o arquivo antigo, e o índice seria
+    # salvo contra o arquivo errado.
+    with _locked(OPPORTUNITY_ADS_FILE):
+        kept, tail = compact_file(OPPORTUNITIES_FILE, keep, scanned["size"], on_tail)
+        dropped_ads = sync_opportunity_index()
+    removed_dedup = candidates - kept
 
-    kept_ids = [o.get("id") for o in kept if o.get("id")]
-    sync_dispatch_state(kept_ids)
+    sync_dispatch_state(kept_ids + appended["id"])
 
     print(
         f"[CLEANER] opportunities.jsonl: "
         f"{removed_age} removidas (15 dias), "
         f"{removed_dedup} duplicatas removidas, "
-        f"{len(kept)} mantidas."
+        f"{kept} mantidas, "
+        f"{tail} anexadas durante a limpeza, "
+        f"{dropped_ads} anúncios sem referência removidos."
     )
 
 
 def reconcile_engine_state():
     """
-    Reconstrói seen_ids e seen_hashes do zero a partir do messages.jsonl atual.
-    Garante que o engine_state.json fique estritamente proporcional ao que
-    existe no arquivo de mensagens — nunca maior.
+    Reconstrói os IDs e hashes vistos do zero a partir do journal: o índice
+    dos segmentos selados (ou o store.db, no backend sqlite) e o
+    messages.jsonl atual.
+    Garante que o estado de dedup do engine fique estritamente proporcional ao
+    que existe no journal — nunca maior.
     Cobre também o caso de messages.jsonl ausente ou corrompido.
     """
-    if not os.path.exists(ENGINE_STATE_FILE):
+    seen = SeenStore()
+    if not seen.exists():
         return
 
-    if not os.path.exists(MESSAGES_FILE):
-        with open(ENGINE_STATE_FILE, "w") as f:
-            json.dump({"seen_ids": [], "seen_hashes": []}, f)
-        print("[CLEANER] engine_state.json: zerado (messages.jsonl ausente).")
-        return
-
-    rows = _load_jsonl(MESSAGES_FILE)
-    real_ids = [
-        obj.get("message_id") for _, obj in rows if obj and obj.get("message_id")
-    ]
-    real_hashes = [obj.get("ad_hash") for _, obj in rows if obj and obj.get("ad_hash")]
-
-    try:
-        with open(ENGINE_STATE_FILE) as f:
-            state = json.load(f)
-    except Exception:
-        print("[CLEANER] engine_state.json: não foi possível ler, pulando.")
-        return
-
-    previous_ids = len(state.get("seen_ids", []))
-    previous_hashes = len(state.get("seen_hashes", []))
+    real_ids, real_hashes = [], []
+    journal = Journal()
+    sources = [journal]
+    if STORAGE_BACKEND == "sqlite":
+        sources.append(SqliteStore())
+    for source in sources:
+        for message_id, ad_hash in source.iter_keys():
+            if message_id:
+                real_ids.append(message_id)
+            if ad_hash:
+                real_hashes.append(ad_hash)
+        source.close()
+
+    if os.path.exists(MESSAGES_FILE):
+        rows, _ = _scan_jsonl(MESSAGES_FILE, ("message_id", "ad_hash"))
+        for _, _, record in rows:
+            if not record:
+                continue
+            if record.get("message_id"):
+                real_ids.append(record["message_id"])
+            if record.get("ad_hash"):
+                real_hashes.append(record["ad_hash"])
 
-    state["seen_ids"] = real_ids
-    state["seen_hashes"] = real_hashes
+    previous_ids = len(seen.ids)
+    previous_hashes = len(seen.hashes)
 
-    with open(ENGINE_STATE_FILE, "w") as f:
-        json.dump(state, f)
+    seen.reset(real_ids, real_hashes)
 
     print(
-        f"[CLEANER] engine_state.json: reconciliado — "
-        f"{previous_ids - len(real_ids)} IDs removidos, "
-        f"{previous_hashes - len(real_hashes)} hashes removidos, "
-        f"{len(real_ids)} IDs e {len(real_hashes)} hashes mantidos."
+        f"[CLEANER] estado de dedup: reconciliado — "
+        f"{previous_ids - len(seen.ids)} IDs removidos, "
+        f"{previous_hashes - len(seen.hashes)} hashes removidos, "
+        f"{len(seen.ids)} IDs e {len(seen.hashes)} hashes mantidos."
     )
 
 
@@ -0,0 +1,214 @@
+import numpy as np
+from matcher import OPPORTUNITY_SIGNALS
+
+NEARBEACH = 1
+SEAFRONT = 2
+HAS_NEIGHBORHOOD = 4
+
+
+def _number(value):
+    return np.nan if value is None else value
+
+
+class _Interner:
+    """Mapeia valores categóricos para ids inteiros (0 = ausente)."""
+
+    def __init__(self):
+        self.ids = {}
+
+    def add(self, value):
+        return self.ids.setdefault(value, len(self.ids) + 1)
+
+    def get(self, value):
+        return self.ids.get(value, -1)
+
+
+class SellerColumns:
+    """
+    Vendedores normalizados em arrays tipados, para avaliar as regras do
+    matcher com máscaras booleanas em vez de par a par.
+
+    O resultado de score() é idêntico ao de matcher.score_pair para cada linha.
+    """
+
+    def __init__(self, sellers):
+        self.sellers = list(sellers)
+
+        self.price = np.array([_number(s.get("price")) for s in self.sellers], float)
+        self.bedrooms = np.array(
+            [_number(s.get("bedrooms")) for s in self.sellers], float
+        )
+        self.area = np.array([_number(s.get("area_m2")) for s in self.sellers], float)
+        self.parking = np.array(
+            [_number(s.get("parking_spots")) for s in self.sellers], float
+        )
+
+        flags = np.zeros(len(self.sellers), np.uint8)
+        for i, s in enumerate(self.sellers):
+            if s.get("nearbeach", False):
+                flags[i] |= NEARBEACH
+            if s.get("seafront", False):
+                flags[i] |= SEAFRONT
+            neighborhoods = s.get("neighborhood")
+            if neighborhoods and isinstance(neighborhoods, list):
+                flags[i] |= HAS_NEIGHBORHOOD
+        self.flags = flags
+
+        self._property_types = _Interner()
+        self.property_type = np.array(
+            [self._property_types.add(s.get("property_type")) for s in self.sellers],
+            np.int32,
+        )
+
+        self._sun_types = _Interner()
+        self.sun_type = np.array(
+            [
+                self._sun_types.add(s["sun_type"]) if s.get("sun_type") else 0
+                for s in self.sellers
+            ],
+            np.int32,
+        )
+
+        self._condominiums = _Interner()
+        self.condominium = np.array(
+            [
+                (
+                    self._condominiums.add(s["condominium"].lower())
+                    if s.get("condominium")
+                    else 0
+                )
+                for s in self.sellers
+            ],
+            np.int32,
+        )
+
+        self._subs = _Interner()
+        self.sub_neighborhood = np.array(
+            [
+                (
+                    self._subs.add(s["sub_neighborhood"])
+                    if s.get("sub_neighborhood")
+                    else 0
+                )
+                for s in self.sellers
+            ],
+            np.int32,
+        )
+
+        self._neighborhood_rows = {}
+        for i, s in enumerate(self.sellers):
+            if flags[i] & HAS_NEIGHBORHOOD:
+                for n in set(s["neighborhood"]):
+                    self._neighborhood_rows.setdefault(n, []).append(i)
+        self._neighborhood_cols = {}
+
+    def __len__(self):
+        return len(self.sellers)
+
+    def _neighborhood_col(self, name):
+        col = self._neighborhood_cols.get(name)
+        if col is None:
+            col = np.zeros(len(self.sellers), bool)
+            col[self._neighborhood_rows.get(name, [])] = True
+            self._neighborhood_cols[name] = col
+        return col
+
+    def _neighborhood_mask(self, buyer, rows):
+        buyer_neighborhoods = buyer.get("neighborhood")
+        if not buyer_neighborhoods or not isinstance(buyer_neighborhoods, list):
+            return np.zeros(len(rows), bool)
+
+        has_neighborhood = (self.flags[rows] & HAS_NEIGHBORHOOD).astype(bool)
+
+        buyer_sub = buyer.get("sub_neighborhood")
+        if buyer_sub:
+            sub_id = self._subs.get(buyer_sub)
+            return has_neighborhood & (self.sub_neighborhood[rows] == sub_id)
+
+        mask = np.zeros(len(rows), bool)
+        for n in set(buyer_neighborhoods):
+            mask |= self._neighborhood_col(n)[rows]
+        return mask
+
+    def score(self, buyer, rows=None):
+        """
+        Avalia o comprador contra um bloco de linhas (todas, se rows=None).
+        Retorna (linhas que casam em ordem crescente, scores).
+        """
+        if rows is None:
+            rows = np.arange(len(self.sellers))
+        else:
+            rows = np.asarray(rows, dtype=np.intp)
+
+        buyer_price = buyer.get("price")
+        buyer_bedrooms = buyer.get("bedrooms")
+        if buyer_price is None or buyer_bedrooms is None or len(rows) == 0:
+            return rows[:0], np.zeros(0, np.int64)
+
+        mask = self._neighborhood_mask(buyer, rows)
+
+        price = self.price[rows]
+        mask &= (buyer_price * 0.80 <= price) & (price <= buyer_price + 50_000)
+        mask &= self.bedrooms[rows] >= buyer_bedrooms
+
+        score = np.full(
+            len(rows),
+            OPPORTUNITY_SIGNALS["neighborhood"]
+            + OPPORTUNITY_SIGNALS["price"]
+            + OPPORTUNITY_SIGNALS["bedrooms"],
+            np.int64,
+        )
+
+        same_type = self.property_type[rows] == self._property_types.get(
+            buyer.get("property_type")
+        )
+        score += same_type * OPPORTUNITY_SIGNALS["property_type"]
+
+        buyer_area = buyer.get("area_m2")
+        if buyer_area is not None:
+            mask &= self.area[rows] >= buyer_area
+            score += OPPORTUNITY_SIGNALS["area_m2"]
+
+        buyer_parking = buyer.get("parking_spots")
+        if buyer_parking is not None:
+            mask &= self.parking[rows] >= buyer_parking
+            score += OPPORTUNITY_SIGNALS["parking_spots"]
+
+        flags = self.flags[rows]
+        if buyer.get("nearbeach", False):
+            mask &= (flags & NEARBEACH).astype(bool)
+            score += OPPORTUNITY_SIGNALS["nearbeach"]
+
+        if buyer.get("seafront", False):
+            mask &= (flags & SEAFRONT).astype(bool)
+            score += OPPORTUNITY_SIGNALS["seafront"]
+
+        buyer_sun_type = buyer.get("sun_type")
+        if buyer_sun_type:
+            same_sun = self.sun_type[rows] == self._sun_types.get(buyer_sun_type)
+            score += same_sun * OPPORTUNITY_SIGNALS["sun_type"]
+
+        condominium = self.condominium[rows]
+        buyer_cond = buyer.get("condominium")
+        if buyer_cond:
+            if isinstance(buyer_cond, list):
+                wanted = [self._condominiums.get(c.lower()) for c in buyer_cond]
+            else:
+                wanted = [self._condominiums.get(buyer_cond.lower())]
+            mask &= np.isin(condominium, wanted)
+            score += OPPORTUNITY_SIGNALS["condominium"]
+        else:
+            score += (condominium != 0) * (OPPORTUNITY_SIGNALS["condominium"] // 2)
+
+        return rows[mask], score[mask]
+
+    def match(self, buyers):
+        """Avalia um lote inteiro de compradores contra todas as linhas."""
+        opportunities = []
+        for buyer in buyers:
+            rows, scores = self.score(buyer)
+            for row, score in zip(rows.tolist(), scores.tolist()):
+                opportunities.append(
+                    {"buyer": buyer, "seller": self.sellers[row], "score": score}
+                )
+        return opportunities
@@ -0,0 +1,157 @@
+import os
+
+
+def iter_raw_lines(f, start: int = 0, end: int = None):
+    """
+    (offset, linha com "\\n") para cada linha completa entre start e end, sem
+    decodificar. Uma linha final sem "\\n" ainda está sendo escrita e fica de fora.
+    """
+    f.seek(start)
+    position = start
+    for line in f:
+        if end is not None and position + len(line) > end:
+            break
+        if not line.endswith(b"\n"):
+            break
+        yield position, line
+        position += len(line)
+
+
+def _copy_lines(src, dst, start: int, on_line=None):
+    """Copia as linhas completas de src a partir de start. Retorna (fim, linhas)."""
+    position, count = start, 0
+    for offset, line in iter_raw_lines(src, start):
+        dst.write(line)
+        if on_line is not None:
+            on_line(line)
+        position = offset + len(line)
+        count += 1
+    return position, count
+
+
+def compact_file(path: str, keep, scanned_size: int, on_tail=None):
+    """
+    Reescreve path mantendo só as linhas cujos offsets estão em keep, na ordem
+    do arquivo e com os bytes inalterados.
+
+    keep foi decidido olhando o arquivo até scanned_size; tudo o que o collector
+    (ou o engine) anexou depois disso é preservado sem filtro, e on_tail recebe
+    cada uma dessas linhas. O resultado vai para um arquivo temporário com
+    fsync e só então substitui o original com os.replace, então uma queda no
+    meio deixa o arquivo antigo intacto. Appends que ainda caírem no inode
+    antigo durante a troca são copiados para o novo arquivo em seguida.
+
+    Retorna (linhas mantidas, linhas anexadas durante a compactação).
+    """
+    tmp_path = path + ".tmp"
+    kept = position = 0
+    with open(path, "rb") as src:
+        with open(tmp_path, "wb") as dst:
+            for offset, line in iter_raw_lines(src, 0, scanned_size):
+                if offset in keep:
+                    dst.write(line)
+                    kept += 1
+                position = offset + len(line)
+            # Uma linha que atravessa scanned_size também é tratada como nova.
+            position, tail = _copy_lines(src, dst, position, on_tail)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp_path, path)
+
+        # Quem abriu o caminho antes do replace ainda escreve no inode antigo.
+        with open(path, "ab") as dst:
+            _, late = _copy_lines(src, dst, position, on_tail)
+            if late:
+                dst.flush()
+                os.fsync(dst.fileno())
+
+    return kept, tail + late
+
+
+def rewrite_file(path: str, lines, scanned_size: int, on_tail=None):
+    """
+    Como compact_file, mas o trecho até scanned_size é trocado por lines
+    (bytes terminados em "\\n") em vez de filtrado: serve para exportar um
+    conteúdo montado em outro lugar (sqlite_store.py) sem perder o que foi
+    anexado ao arquivo depois de scanned_size. O arquivo pode não existir.
+
+    Retorna (bytes gravados de lines, linhas anexadas preservadas).
+    """
+    tmp_path = path + ".tmp"
+    try:
+        src = open(path, "rb")
+    except FileNotFoundError:
+        src = None
+
+    written = 0
+    with open(tmp_path, "wb") as dst:
+        for line in lines:
+            dst.write(line)
+            written += len(line)
+        position, tail = scanned_size, 0
+        if src is not None:
+            position, tail = _copy_lines(src, dst, scanned_size, on_tail)
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.replace(tmp_path, path)
+
+    if src is not None:
+        with src:
+            # Quem abriu o caminho antes do replace ainda escreve no inode antigo.
+            with open(path, "ab") as dst:
+                _, late = _copy_lines(src, dst, position, on_tail)
+                if late:
+                    dst.flush()
+                    os.fsync(dst.fileno())
+            tail += late
+
+    return written, tail
+
+
+COPY_BLOCK_SIZE = 1 << 20
+
+
+def _copy_range(src, dst, start: int, end: int):
+    src.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        block = src.read(min(COPY_BLOCK_SIZE, remaining))
+        if not block:
+            break
+        dst.write(block)
+        remaining -= len(block)
+
+
+def drop_ranges(path: str, drops):
+    """
+    Reescreve path sem os trechos drops [(offset, tamanho), ...], copiando o
+    resto em blocos, sem decodificar linhas: o custo é o de copiar o arquivo,
+    e a memória é proporcional ao que sai. Mesma troca atômica de
+    compact_file; tudo o que estiver depois do último trecho (inclusive o que
+    for anexado durante a cópia) é preservado.
+
+    Retorna o total de bytes removidos.
+    """
+    drops = sorted(drops)
+    tmp_path = path + ".tmp"
+    with open(path, "rb") as src:
+        with open(tmp_path, "wb") as dst:
+            position = 0
+            for offset, length in drops:
+                _copy_range(src, dst, position, offset)
+                position = offset + length
+            end = os.fstat(src.fileno()).st_size
+            _copy_range(src, dst, position, end)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp_path, path)
+
+        # Quem abriu o caminho antes do replace ainda escreve no inode antigo.
+        late = os.fstat(src.fileno()).st_size
+        if late > end:
+            with open(path, "ab") as dst:
+                _copy_range(src, dst, end, late)
+                dst.flush()
+                os.fsync(dst.fileno())
+
+    return sum(length for _, length in drops)
@@ -0,0 +1,199 @@
+import os
+import hashlib
+
+SEEN_IDS_FILE = "../data/seen_ids.bin"
+SEEN_HASHES_FILE = "../data/seen_hashes.bin"
+
+DIGEST_SIZE = 16
+
+
+def digest(key: str) -> bytes:
+    """Chave de tamanho fixo (MD5 binário, 16 bytes) usada nos arquivos de dedup."""
+    return hashlib.md5(key.encode()).digest()
+
+
+class DigestLog:
+    """
+    Conjunto persistente de digests de 16 bytes.
+
+    O arquivo é só uma sequência de registros de tamanho fixo: inserir é um
+    append, carregar é fatiar o arquivo em blocos de 16 bytes e a consulta é
+    um lookup em set. Remoções reescrevem o arquivo de forma atômica.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._digests = set()
+        self._pending = []
+        self._records = 0
+        self._identity = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b""
+
+        usable = len(data) - len(data) % DIGEST_SIZE
+        if usable != len(data):
+            # Registro incompleto de uma escrita interrompida.
+            os.truncate(self.path, usable)
+
+        self._digests = {
+            data[i : i + DIGEST_SIZE] for i in range(0, usable, DIGEST_SIZE)
+        }
+        self._records = usable // DIGEST_SIZE
+        self._pending = []
+        self._identity = self._stat()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size)
+
+    def refresh(self):
+        """Recarrega se outro processo reescreveu o arquivo (cleaner, purge)."""
+        current = self._stat()
+        if current is None or self._identity is None:
+            if current != self._identity:
+                self.load()
+            return
+        if current[0] != self._identity[0] or current[1] < self._identity[1]:
+            self.load()
+
+    def __contains__(self, key: str) -> bool:
+        return digest(key) in self._digests
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+    def add(self, key: str) -> bool:
+        d = digest(key)
+        if d in self._digests:
+            return False
+        self._digests.add(d)
+        self._pending.append(d)
+        return True
+
+    def flush(self):
+        if not self._pending:
+            return
+        with open(self.path, "ab") as f:
+            f.write(b"".join(self._pending))
+            f.flush()
+            os.fsync(f.fileno())
+        self._records += len(self._pending)
+        self._pending = []
+        self._identity = self._stat()
+
+    def _rewrite(self, digests):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(digests))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._digests = set(digests)
+        self._records = len(self._digests)
+        self._pending = []
+        self._identity = self._stat()
+
+    def reset(self, keys):
+        """Substitui todo o conteúdo pelas chaves informadas."""
+        self._rewrite(list({digest(k): None for k in keys if k}))
+
+    def retain(self, keys):
+        """Mantém apenas as chaves que já estavam no conjunto e estão em `keys`."""
+        keep = {digest(k) for k in keys if k}
+        self._rewrite([d for d in self._digests if d in keep])
+
+    def discard(self, keys):
+        drop = {digest(k) for k in keys if k}
+        if not drop & self._digests:
+            return
+        self._rewrite([d for d in self._digests if d not in drop])
+
+    def snapshot(self) -> bytes:
+        """Os digests concatenados, no mesmo formato do arquivo (checkpoint.py)."""
+        return b"".join(self._digests)
+
+    def restore(self, data):
+        """Substitui todo o conteúdo pelos digests concatenados de snapshot()."""
+        usable = len(data) - len(data) % DIGEST_SIZE
+        self._rewrite(
+            list(
+                {data[i : i + DIGEST_SIZE]: None for i in range(0, usable, DIGEST_SIZE)}
+            )
+        )
+
+    def compact(self):
+        """Remove registros repetidos (ex.: appends concorrentes)."""
+        self.flush()
+        if self._records > len(self._digests):
+            self._rewrite(list(self._digests))
+
+    def maybe_compact(self, ratio: float = 1.5):
+        if self._records > len(self._digests) * ratio:
+            self.compact()
+
+
+class SeenStore:
+    """Ponto único de acesso ao estado de dedup (message_id e ad_hash vistos)."""
+
+    def __init__(
+        self, ids_path: str = SEEN_IDS_FILE, hashes_path: str = SEEN_HASHES_FILE
+    ):
+        self.ids = DigestLog(ids_path)
+        self.hashes = DigestLog(hashes_path)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.ids.path) or os.path.exists(self.hashes.path)
+
+    def is_seen(self, msg_id, ad_hash) -> bool:
+        return bool(msg_id and msg_id in self.ids) or bool(
+            ad_hash and ad_hash in self.hashes
+        )
+
+    def add(self, msg_id, ad_hash):
+        if msg_id:
+            self.ids.add(msg_id)
+        if ad_hash:
+            self.hashes.add(ad_hash)
+
+    def flush(self):
+        self.ids.flush()
+        self.hashes.flush()
+        self.ids.maybe_compact()
+        self.hashes.maybe_compact()
+
+    def refresh(self):
+        self.ids.refresh()
+        self.hashes.refresh()
+
+    def reset(self, ids, hashes):
+        self.ids.reset(ids)
+        self.hashes.reset(hashes)
+
+    def snapshot(self):
+        return self.ids.snapshot(), self.hashes.snapshot()
+
+    def restore(self, ids: bytes, hashes: bytes):
+        self.ids.restore(ids)
+        self.hashes.restore(hashes)
+
+    def migrate_legacy(self, state: dict) -> bool:
+        """
+        Importa as listas seen_ids/seen_hashes do engine_state.json antigo.
+        Retorna True se o estado foi alterado e precisa ser salvo.
+        """
+        if "seen_ids" not in state and "seen_hashes" not in state:
+            return False
+        legacy_ids = state.pop("seen_ids", [])
+        legacy_hashes = state.pop("seen_hashes", [])
+        if not self.exists():
+            self.reset(legacy_ids, legacy_hashes)
+        return True
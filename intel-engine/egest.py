@@ -1,9 +1,17 @@
+import argparse
+import fcntl
 import json
 import hashlib
+import sqlite3
+import threading
 import time
 import os
+from contextlib import contextmanager
+from compaction import compact_file, drop_ranges
 
 OPPORTUNITIES_FILE = "../data/opportunities.jsonl"
+OPPORTUNITY_ADS_FILE = "../data/opportunity_ads.jsonl"
+OPPORTUNITY_INDEX_FILE = "../data/opportunities_index.db"
 
 
 def make_id(opp):
@@ -14,40 +22,605 @@ def make_id(opp):
     return hashlib.md5(base.encode()).hexdigest()
 
 
-def _load_existing_ids() -> set:
-    """Lê os IDs já presentes no arquivo para evitar duplicatas no append."""
-    existing = set()
-    if not os.path.exists(OPPORTUNITIES_FILE):
-        return existing
-    with open(OPPORTUNITIES_FILE, "r", encoding="utf-8") as f:
+def ad_message_id(ad):
+    try:
+        return ad["original_content"]["message_id"]
+    except (KeyError, TypeError):
+        return None
+
+
+def ad_author_id(ad):
+    try:
+        return ad["original_content"].get("author_id")
+    except (KeyError, TypeError, AttributeError):
+        return None
+
+
+def is_embedded(obj) -> bool:
+    """Linha no formato antigo, com os anúncios completos embutidos."""
+    return isinstance(obj.get("buyer"), dict) or isinstance(obj.get("seller"), dict)
+
+
+def pair_message_ids(obj):
+    """(buyer message_id, seller message_id) de uma linha, em qualquer formato."""
+    if is_embedded(obj):
+        return ad_message_id(obj.get("buyer")), ad_message_id(obj.get("seller"))
+    return obj.get("buyer_id"), obj.get("seller_id")
+
+
+def slim_row(opp):
+    """Linha compacta do opportunities.jsonl: referências aos anúncios."""
+    buyer_id, seller_id = pair_message_ids(opp)
+    return {
+        "id": opp.get("id"),
+        "buyer_id": buyer_id,
+        "seller_id": seller_id,
+        "score": opp.get("score"),
+        "timestamp": opp.get("timestamp"),
+    }
+
+
+def materialize(row, ads):
+    """
+    Visão expandida de uma linha compacta, com buyer/seller completos como o
+    export gravava antes. ads mapeia message_id -> anúncio normalizado.
+    Linhas no formato antigo já vêm expandidas e voltam como estão.
+    """
+    if is_embedded(row):
+        return row
+    return {
+        "buyer": ads.get(row.get("buyer_id")),
+        "seller": ads.get(row.get("seller_id")),
+        "score": row.get("score"),
+        "id": row.get("id"),
+        "timestamp": row.get("timestamp"),
+    }
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None, 0, 0
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _iter_lines(path, offset: int = 0):
+    """(offset, objeto) de cada linha completa e válida a partir de offset."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        f.seek(offset)
+        position = offset
         for line in f:
-            line = line.strip()
-            if not line:
-                continue
+            start = position
+            position += len(line)
+            if not line.endswith(b"\n"):
+                break
             try:
                 obj = json.loads(line)
-                oid = obj.get("id")
-                if oid:
-                    existing.add(oid)
             except json.JSONDecodeError:
                 continue
-    return existing
+            if isinstance(obj, dict):
+                yield start, obj
 
 
-def export_opportunities(opportunities):
-    existing_ids = _load_existing_ids()
+def _append_lines(path, objects) -> list:
+    """Anexa os objetos em um único write + fsync e devolve seus offsets."""
+    offsets, chunks = [], []
+    with open(path, "ab") as f:
+        offset = f.tell()
+        for obj in objects:
+            line = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+            offsets.append(offset)
+            chunks.append(line)
+            offset += len(line)
+        f.write(b"".join(chunks))
+        f.flush()
+        os.fsync(f.fileno())
+    return offsets
 
-    new_count = 0
-    with open(OPPORTUNITIES_FILE, "a", encoding="utf-8") as f:
-        for opp in opportunities:
-            opp["id"] = make_id(opp)
-            opp["timestamp"] = int(time.time())
 
-            if opp["id"] in existing_ids:
+def _write_atomic(path, objects):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for obj in objects:
+            f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# Locks já tomados por esta thread: _locked é reentrante (o cleaner segura o
+# lock em volta da compactação e chama compact_ads, que o pede de novo).
+_held = threading.local()
+
+
+@contextmanager
+def _locked(path):
+    """flock exclusivo em path + ".lock", entre processos (engine, cleaner, purge)."""
+    held = _held.__dict__.setdefault("paths", set())
+    if path in held:
+        yield
+        return
+    with open(path + ".lock", "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        held.add(path)
+        try:
+            yield
+        finally:
+            held.discard(path)
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def load_ads(path: str = OPPORTUNITY_ADS_FILE) -> dict:
+    """message_id -> anúncio; num message_id repetido vale a primeira linha."""
+    ads = {}
+    for _, ad in _iter_lines(path):
+        ads.setdefault(ad_message_id(ad), ad)
+    return ads
+
+
+def iter_opportunities(
+    path: str = OPPORTUNITIES_FILE, ads_path: str = OPPORTUNITY_ADS_FILE
+):
+    """
+    Leitor materializado: percorre o opportunities.jsonl devolvendo cada
+    oportunidade com buyer/seller completos. Os anúncios são lidos uma vez.
+    """
+    ads = load_ads(ads_path)
+    for _, row in _iter_lines(path):
+        yield materialize(row, ads)
+
+
+class OpportunityStore:
+    """
+    Oportunidades em formato normalizado, com um índice SQLite ao lado.
+
+    - opportunities.jsonl: linhas compactas (id, buyer_id, seller_id, score,
+      timestamp) — é o que o wpp-egress acompanha;
+    - opportunity_ads.jsonl: cada anúncio normalizado citado, uma única vez,
+      identificado pelo message_id da mensagem original.
+
+    O índice guarda o offset das linhas dos dois arquivos, então checar se um
+    id existe e achar oportunidades por comprador ou vendedor não relê nada.
+    Se um arquivo for reescrito por fora (cleaner.py, purge_user.py), a
+    assinatura (inode, tamanho, mtime) muda e o índice dele é reconstruído;
+    se só cresceu, apenas o final é indexado.
+
+    append, compact_ads e remove_ads seguram o mesmo flock: entre o anúncio e
+    a linha que o cita (dois writes) nenhuma reescrita pode rodar, ou o
+    anúncio ainda sem referência seria descartado.
+    """
+
+    def __init__(
+        self,
+        path: str = OPPORTUNITIES_FILE,
+        ads_path: str = OPPORTUNITY_ADS_FILE,
+        index_path: str = OPPORTUNITY_INDEX_FILE,
+    ):
+        self.path = path
+        self.ads_path = ads_path
+        self._conn = sqlite3.connect(index_path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS opportunities (
+                id TEXT PRIMARY KEY,
+                buyer_id TEXT,
+                seller_id TEXT,
+                offset INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS opportunities_buyer
+                ON opportunities (buyer_id);
+            CREATE INDEX IF NOT EXISTS opportunities_seller
+                ON opportunities (seller_id);
+            CREATE TABLE IF NOT EXISTS ads (
+                message_id TEXT PRIMARY KEY,
+                author_id TEXT,
+                offset INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ads_author ON ads (author_id);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+            """)
+        self._conn.commit()
+        self.sync()
+
+    def _meta(self, name):
+        rows = dict(self._conn.execute("SELECT key, value FROM meta"))
+        return (
+            rows.get(f"{name}.inode"),
+            rows.get(f"{name}.size", 0),
+            rows.get(f"{name}.mtime", 0),
+        )
+
+    def _save_meta(self, name, path):
+        inode, size, mtime = _file_signature(path)
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [
+                (f"{name}.inode", inode),
+                (f"{name}.size", size),
+                (f"{name}.mtime", mtime),
+            ],
+        )
+
+    def _index_ads(self, offset: int):
+        # Num message_id repetido vale a primeira linha, como em load_ads().
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO ads (message_id, author_id, offset) VALUES (?, ?, ?)",
+            (
+                (ad_message_id(ad), ad_author_id(ad), start)
+                for start, ad in _iter_lines(self.ads_path, offset)
+                if ad_message_id(ad)
+            ),
+        )
+        self._save_meta("ads", self.ads_path)
+
+    def _index_opportunities(self, offset: int):
+        # Em ids repetidos (arquivos antigos), vale a última linha.
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO opportunities (id, buyer_id, seller_id, offset)"
+            " VALUES (?, ?, ?, ?)",
+            (
+                (obj["id"], *pair_message_ids(obj), start)
+                for start, obj in _iter_lines(self.path, offset)
+                if obj.get("id")
+            ),
+        )
+        self._save_meta("opportunities", self.path)
+
+    def _sync_file(self, name, path, index):
+        inode, size, mtime = _file_signature(path)
+        indexed_inode, indexed_size, indexed_mtime = self._meta(name)
+
+        if (inode, size, mtime) == (indexed_inode, indexed_size, indexed_mtime):
+            return False
+        if inode == indexed_inode and size > indexed_size:
+            index(indexed_size)
+        else:
+            self._conn.execute(f"DELETE FROM {name}")
+            index(0)
+        return True
+
+    def sync(self):
+        """Confere o índice contra os arquivos e reindexa o que for preciso."""
+        changed = self._sync_file("ads", self.ads_path, self._index_ads)
+        changed |= self._sync_file(
+            "opportunities", self.path, self._index_opportunities
+        )
+        if changed:
+            self._conn.commit()
+
+    def rebuild(self):
+        self._conn.execute("DELETE FROM ads")
+        self._conn.execute("DELETE FROM opportunities")
+        self._index_ads(0)
+        self._index_opportunities(0)
+        self._conn.commit()
+
+    def __contains__(self, oid):
+        return (
+            self._conn.execute(
+                "SELECT 1 FROM opportunities WHERE id = ?", (oid,)
+            ).fetchone()
+            is not None
+        )
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM opportunities").fetchone()[0]
+
+    def _has_ad(self, message_id):
+        return (
+            self._conn.execute(
+                "SELECT 1 FROM ads WHERE message_id = ?", (message_id,)
+            ).fetchone()
+            is not None
+        )
+
+    def append(self, opportunities):
+        """
+        Grava as oportunidades ainda não conhecidas. Os anúncios que faltam vão
+        antes para o opportunity_ads.jsonl (um write + fsync), então uma linha
+        compacta nunca aponta para um anúncio ausente; depois as linhas
+        compactas, também em um write + fsync, tudo sob o lock do store. O
+        timestamp só é carimbado nas novas. Retorna quantas oportunidades
+        foram gravadas.
+        """
+        with _locked(self.ads_path):
+            return self._append(opportunities)
+
+    def _append(self, opportunities):
+        self.sync()
+
+        now = int(time.time())
+        fresh = {}
+        for opp in opportunities:
+            oid = opp["id"] = make_id(opp)
+            if oid in fresh or oid in self:
                 continue
+            opp["timestamp"] = now
+            fresh[oid] = opp
+
+        if not fresh:
+            return 0
+
+        new_ads = {}
+        for opp in fresh.values():
+            for ad in (opp["buyer"], opp["seller"]):
+                message_id = ad_message_id(ad)
+                if message_id not in new_ads and not self._has_ad(message_id):
+                    new_ads[message_id] = ad
+
+        if new_ads:
+            offsets = _append_lines(self.ads_path, new_ads.values())
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO ads (message_id, author_id, offset)"
+                " VALUES (?, ?, ?)",
+                [
+                    (message_id, ad_author_id(ad), offset)
+                    for (message_id, ad), offset in zip(new_ads.items(), offsets)
+                ],
+            )
+            self._save_meta("ads", self.ads_path)
+
+        rows = [slim_row(opp) for opp in fresh.values()]
+        offsets = _append_lines(self.path, rows)
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO opportunities (id, buyer_id, seller_id, offset)"
+            " VALUES (?, ?, ?, ?)",
+            [
+                (row["id"], row["buyer_id"], row["seller_id"], offset)
+                for row, offset in zip(rows, offsets)
+            ],
+        )
+        self._save_meta("opportunities", self.path)
+        self._conn.commit()
+        return len(fresh)
+
+    def compact_ads(self):
+        """
+        Reescreve o opportunity_ads.jsonl só com os anúncios ainda citados no
+        opportunities.jsonl, usando os offsets do índice. Anúncios anexados
+        pelo engine durante a troca são preservados (compaction.compact_file).
+        Chamado pelo cleaner e pelo purge depois de reescreverem as oportunidades.
+        """
+        with _locked(self.ads_path):
+            return self._compact_ads()
+
+    def _compact_ads(self):
+        self.sync()
+        keep = {
+            row[0]
+            for row in self._conn.execute(
+                "SELECT offset FROM ads WHERE message_id IN"
+                " (SELECT buyer_id FROM opportunities"
+                " UNION SELECT seller_id FROM opportunities)"
+            )
+        }
+        total = self._conn.execute("SELECT COUNT(*) FROM ads").fetchone()[0]
+        if len(keep) == total or not os.path.exists(self.ads_path):
+            return 0
+
+        _, indexed_size, _ = self._meta("ads")
+        compact_file(self.ads_path, keep, indexed_size)
+        self._conn.execute("DELETE FROM ads")
+        self._index_ads(0)
+        self._conn.commit()
+        return total - len(keep)
+
+    def _line_ranges(self, path, offsets):
+        ranges = []
+        with open(path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                line = f.readline()
+                if line.endswith(b"\n"):
+                    ranges.append((offset, len(line)))
+        return ranges
+
+    def _references(self, message_id) -> set:
+        return {
+            row[0]
+            for row in self._conn.execute(
+                "SELECT id FROM opportunities WHERE buyer_id = ?"
+                " UNION SELECT id FROM opportunities WHERE seller_id = ?",
+                (message_id, message_id),
+            )
+        }
+
+    def remove_ads(self, message_ids):
+        """
+        Remove os anúncios message_ids e toda oportunidade que cita algum
+        deles, tirando só esses trechos dos arquivos (compaction.drop_ranges).
+        O outro anúncio de cada par removido também sai se nenhuma oportunidade
+        restante o cita, como faria o compact_ads. As linhas saem antes dos
+        anúncios, então nenhuma linha fica apontando para um anúncio ausente.
+        Retorna os ids das oportunidades removidas.
+        """
+        with _locked(self.ads_path):
+            return self._remove_ads(message_ids)
+
+    def _remove_ads(self, message_ids):
+        self.sync()
+        message_ids = set(message_ids)
+        rows = {}
+        chunks = list(message_ids)
+        for i in range(0, len(chunks), 500):
+            chunk = chunks[i : i + 500]
+            marks = ",".join("?" * len(chunk))
+            for oid, offset, buyer_id, seller_id in self._conn.execute(
+                "SELECT id, offset, buyer_id, seller_id FROM opportunities"
+                f" WHERE buyer_id IN ({marks}) UNION"
+                " SELECT id, offset, buyer_id, seller_id FROM opportunities"
+                f" WHERE seller_id IN ({marks})",
+                chunk + chunk,
+            ):
+                rows[oid] = (offset, buyer_id, seller_id)
+
+        partners = {mid for _, *pair in rows.values() for mid in pair if mid}
+        drop_ads = set(message_ids)
+        for mid in partners - message_ids:
+            if self._references(mid) <= rows.keys():
+                drop_ads.add(mid)
+
+        ad_offsets = []
+        for mid in drop_ads:
+            row = self._conn.execute(
+                "SELECT offset FROM ads WHERE message_id = ?", (mid,)
+            ).fetchone()
+            if row is not None:
+                ad_offsets.append(row[0])
+
+        if rows:
+            offsets = [offset for offset, _, _ in rows.values()]
+            drop_ranges(self.path, self._line_ranges(self.path, offsets))
+        if ad_offsets:
+            drop_ranges(self.ads_path, self._line_ranges(self.ads_path, ad_offsets))
+        if rows or ad_offsets:
+            self.rebuild()
+        return list(rows)
+
+    def _read_at(self, path, offsets):
+        results = []
+        with open(path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                try:
+                    results.append(json.loads(f.readline()))
+                except json.JSONDecodeError:
+                    continue
+        return results
+
+    def ads(self, message_ids) -> dict:
+        """message_id -> anúncio normalizado, lido pelo offset do índice."""
+        message_ids = [mid for mid in dict.fromkeys(message_ids) if mid]
+        found = {}
+        offsets = []
+        for mid in message_ids:
+            row = self._conn.execute(
+                "SELECT offset FROM ads WHERE message_id = ?", (mid,)
+            ).fetchone()
+            if row is not None:
+                offsets.append(row[0])
+        if offsets:
+            for ad in self._read_at(self.ads_path, offsets):
+                found[ad_message_id(ad)] = ad
+        return found
+
+    def ad(self, message_id):
+        self.sync()
+        return self.ads([message_id]).get(message_id)
+
+    def ads_by_author(self, author_id) -> set:
+        """message_ids dos anúncios de um autor."""
+        self.sync()
+        return {
+            row[0]
+            for row in self._conn.execute(
+                "SELECT message_id FROM ads WHERE author_id = ?", (author_id,)
+            )
+        }
 
-            f.write(json.dumps(opp, ensure_ascii=False) + "\n")
-            existing_ids.add(opp["id"])
-            new_count += 1
+    def _materialize(self, rows, expand: bool):
+        if not expand:
+            return rows
+        ads = self.ads(mid for row in rows for mid in pair_message_ids(row))
+        return [materialize(row, ads) for row in rows]
+
+    def _lookup(self, column: str, message_id: str, expand: bool):
+        self.sync()
+        offsets = [
+            row[0]
+            for row in self._conn.execute(
+                f"SELECT offset FROM opportunities WHERE {column} = ? ORDER BY offset",
+                (message_id,),
+            )
+        ]
+        rows = self._read_at(self.path, offsets) if offsets else []
+        return self._materialize(rows, expand)
+
+    def get(self, oid, expand: bool = True):
+        self.sync()
+        row = self._conn.execute(
+            "SELECT offset FROM opportunities WHERE id = ?", (oid,)
+        ).fetchone()
+        if row is None:
+            return None
+        found = self._materialize(self._read_at(self.path, [row[0]]), expand)
+        return found[0] if found else None
+
+    def by_buyer(self, message_id: str, expand: bool = True):
+        return self._lookup("buyer_id", message_id, expand)
+
+    def by_seller(self, message_id: str, expand: bool = True):
+        return self._lookup("seller_id", message_id, expand)
+
+    def close(self):
+        self._conn.close()
+
+
+def migrate_opportunities(
+    path: str = OPPORTUNITIES_FILE, ads_path: str = OPPORTUNITY_ADS_FILE
+):
+    """
+    Migração única do formato antigo: tira os anúncios embutidos de cada
+    linha para o opportunity_ads.jsonl e deixa só a linha compacta. Linhas
+    já compactas são mantidas, então rodar de novo não muda nada. Os anúncios
+    são gravados (tmp + os.replace) antes das linhas que apontam para eles.
+    """
+    ads = load_ads(ads_path)
+    rows, migrated = [], 0
+    for _, obj in _iter_lines(path):
+        if is_embedded(obj):
+            for ad in (obj.get("buyer"), obj.get("seller")):
+                message_id = ad_message_id(ad)
+                if message_id:
+                    ads.setdefault(message_id, ad)
+            obj = slim_row(obj)
+            migrated += 1
+        rows.append(obj)
+
+    if migrated:
+        _write_atomic(ads_path, ads.values())
+        _write_atomic(path, rows)
+
+    store = OpportunityStore(path, ads_path)
+    store.rebuild()
+    store.close()
+
+    print(
+        f"[EGEST] migração: {migrated} oportunidades convertidas, "
+        f"{len(ads)} anúncios em {ads_path}."
+    )
+    return migrated
+
+
+_store = None
+
+
+def get_store() -> OpportunityStore:
+    global _store
+    if _store is None:
+        _store = OpportunityStore()
+    return _store
+
+
+def export_opportunities(opportunities):
+    return get_store().append(opportunities)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Armazenamento de oportunidades")
+    parser.add_argument(
+        "command",
+        choices=["migrate", "reindex"],
+        help="migrate: converte o formato antigo; reindex: reconstrói o índice",
+    )
+    args = parser.parse_args()
 
-    return new_count
+    if args.command == "migrate":
+        migrate_opportunities()
+    else:
+        store = OpportunityStore()
+        store.rebuild()
+        print(f"[EGEST] índice reconstruído: {len(store)} oportunidades.")
+        store.close()
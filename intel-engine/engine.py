@@ -1,22 +1,34 @@
-import time
+import argparse
+import asyncio
+import itertools
+import os
 import json
-from classifier import run_classifier
-from normalizer import run_normalizer
-from matcher import get_opportunity
-from egest import export_opportunities
+import time
+from concurrent.futures import ThreadPoolExecutor
+from checkpoint import CHECKPOINT_INTERVAL, load_checkpoint, write_checkpoint
+from classification_cache import ClassificationCache
+from pipeline import run_pipeline
+from dedup_store import SeenStore
+from inventory import AdInventory
+from normalized_store import NormalizedAdStore, restore_inventory
+from normalizer import NORMALIZER_WORKERS, shutdown_pool
+from file_watcher import watch_file
+from ingest_server import IngestServer, INGEST_SOCKET
+from sqlite_store import iter_history_lines
 
 STATE_FILE = "../data/engine_state.json"
+MESSAGES_FILE = "../data/messages.jsonl"
 
 
 def load_state():
     try:
         with open(STATE_FILE) as f:
             state = json.load(f)
-            if "seen_hashes" not in state:
-                state["seen_hashes"] = []
+            if "journal" not in state:
+                state["journal"] = {"offset": 0, "inode": None, "size": 0}
             return state
     except Exception:
-        return {"seen_ids": [], "seen_hashes": []}
+        return {"journal": {"offset": 0, "inode": None, "size": 0}}
 
 
 def save_state(state):
@@ -24,70 +36,480 @@ def save_state(state):
         json.dump(state, f)
 
 
-def read_new_messages(seen_ids, seen_hashes):
-    seen_id_set = set(seen_ids)
-    seen_hash_set = set(seen_hashes)
+def _resume_offset(journal, stat):
+    """
+    Retorna (offset de onde a leitura deve continuar, releitura completa).
+    A releitura acontece quando o arquivo foi reescrito sem que o estado fosse
+    ajustado (remap_journal). O collector só faz append, então inode diferente
+    ou arquivo menor do que o já lido indicam reescrita.
+    """
+    offset = journal.get("offset", 0)
+    if journal.get("inode") != stat.st_ino:
+        return 0, True
+    if stat.st_size < journal.get("size", 0) or stat.st_size < offset:
+        return 0, True
+    return offset, False
 
-    new_messages = []
-    all_ids = []
-    all_hashes = []
 
-    batch_ids = set()
-    batch_hashes = set()
+def remap_journal(state, old_inode, shift) -> bool:
+    """
+    Ajusta o offset do journal depois que o cleaner (roll) ou o purge
+    reescreveram o messages.jsonl, evitando a releitura completa que a troca
+    de inode provocaria. shift leva uma posição do arquivo antigo para a
+    posição correspondente no novo. Só vale se o estado ainda aponta para o
+    arquivo antigo; senão a releitura continua valendo.
+    """
+    journal = state["journal"]
+    if journal.get("inode") != old_inode:
+        return False
+    try:
+        stat = os.stat(MESSAGES_FILE)
+    except FileNotFoundError:
+        return False
+
+    journal.update(
+        offset=shift(journal.get("offset", 0)),
+        size=shift(journal.get("size", 0)),
+        inode=stat.st_ino,
+    )
+    return True
+
+
+READ_BLOCK_SIZE = 1 << 20
+PIPELINE_BATCH_SIZE = 500
+
+# Janela para agrupar rajadas de appends do collector em um único ciclo.
+DEBOUNCE_SECONDS = 0.01
+# Ciclo de segurança quando nenhum evento chega (expiração do inventário etc.).
+IDLE_WAKEUP_SECONDS = 300
 
-    with open("../data/messages.jsonl", encoding="utf-8") as f:
-        for line in f:
+
+class MessageBatch:
+    """Lote de mensagens lidas do journal e o offset logo após a última linha."""
+
+    def __init__(self, messages, offset, inode, size, backlog_bytes):
+        self.messages = messages
+        self.offset = offset
+        self.inode = inode
+        self.size = size
+        self.backlog_bytes = backlog_bytes
+        self.sellers = []
+        self.buyers = []
+        self.normalized_sellers = []
+        self.normalized_buyers = []
+        self.opportunities = []
+
+    def __len__(self):
+        return len(self.messages)
+
+
+def iter_message_batches(state, seen, batch_size: int = PIPELINE_BATCH_SIZE):
+    """
+    Lê os bytes acrescentados ao messages.jsonl desde o último ciclo e entrega
+    lotes de até batch_size mensagens novas, lendo o arquivo em blocos.
+
+    Uma linha final sem "\\n" ainda está sendo escrita pelo collector e fica
+    para o próximo ciclo. Se o arquivo foi reescrito, faz uma releitura completa
+    (histórico selado, de iter_history_lines, e depois o messages.jsonl) e,
+    ao final, o SeenStore passa a refletir exatamente o conteúdo atual.
+
+    O journal em state só avança quando o consumidor confirma o lote
+    (commit_batch), então um lote em processamento é relido após uma queda.
+    """
+    journal = state["journal"]
+
+    try:
+        stat = os.stat(MESSAGES_FILE)
+    except FileNotFoundError:
+        return
+
+    offset, full_rescan = _resume_offset(journal, stat)
+    # Enquanto lê os segmentos, o lote não avança o offset salvo: uma queda
+    # no meio repete a releitura inteira.
+    position = (journal.get("offset", 0), journal.get("inode"), journal.get("size", 0))
+    read_ids = []
+    read_hashes = []
+    batch = []
+
+    def lines(f):
+        if full_rescan:
+            for line in iter_history_lines():
+                yield None, line
+        yield from _iter_complete_lines(f, offset, stat.st_size)
+
+    with open(MESSAGES_FILE, "rb") as f:
+        for line_end, line in lines(f):
+            if line_end is not None:
+                offset = line_end
+                position = (offset, stat.st_ino, stat.st_size)
             line = line.strip()
             if not line:
                 continue
 
-            msg = json.loads(line)
+            try:
+                msg = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
             msg_id = msg.get("message_id")
             ad_hash = msg.get("ad_hash")
 
-            if msg_id:
-                all_ids.append(msg_id)
-            if ad_hash:
-                all_hashes.append(ad_hash)
+            already_seen = seen.is_seen(msg_id, ad_hash)
+            seen.add(msg_id, ad_hash)
 
-            id_seen = (msg_id in seen_id_set) or (msg_id in batch_ids)
-            hash_seen = (ad_hash in seen_hash_set) or (ad_hash in batch_hashes)
+            if full_rescan:
+                if msg_id:
+                    read_ids.append(msg_id)
+                if ad_hash:
+                    read_hashes.append(ad_hash)
 
-            if id_seen or hash_seen:
+            if already_seen:
                 continue
 
-            new_messages.append(msg)
+            batch.append(msg)
+            if len(batch) >= batch_size:
+                backlog = stat.st_size - offset
+                yield MessageBatch(batch, *position, backlog)
+                batch = []
+
+    if full_rescan:
+        seen.reset(read_ids, read_hashes)
+
+    yield MessageBatch(batch, offset, stat.st_ino, stat.st_size, 0)
+
+
+def _iter_complete_lines(f, offset: int, size: int):
+    """
+    (offset logo após a linha, linha) para cada linha terminada em "\\n" entre
+    offset e size, lendo em blocos de READ_BLOCK_SIZE.
+    """
+    f.seek(offset)
+    position = offset
+    pending = b""
+    while position < size:
+        block = f.read(min(READ_BLOCK_SIZE, size - position))
+        if not block:
+            break
+        position += len(block)
+        lines = (pending + block).split(b"\n")
+        pending = lines.pop()
+        line_end = position - len(pending)
+        ends = []
+        for line in reversed(lines):
+            ends.append(line_end)
+            line_end -= len(line) + 1
+        for line, end in zip(lines, reversed(ends)):
+            yield end, line
 
-            if msg_id:
-                batch_ids.add(msg_id)
-            if ad_hash:
-                batch_hashes.add(ad_hash)
 
-    return new_messages, all_ids, all_hashes
+def commit_batch(state, batch: MessageBatch):
+    state["journal"].update(offset=batch.offset, inode=batch.inode, size=batch.size)
+
+
+def _commit(state, seen, classification_cache, ad_store):
+    def commit(batch):
+        previous_journal = dict(state["journal"])
+        commit_batch(state, batch)
+        if batch.messages or state["journal"] != previous_journal:
+            # Anúncios antes do offset: uma queda aqui só renormaliza o lote.
+            ad_store.add_many(batch.normalized_sellers)
+            ad_store.add_many(batch.normalized_buyers)
+            ad_store.flush()
+            seen.flush()
+            classification_cache.flush()
+            save_state(state)
+
+    return commit
+
+
+def pushed_batch(state, seen, messages):
+    """
+    Lote com mensagens recebidas pelo IngestServer. Não mexe no offset do
+    journal: as mesmas linhas serão lidas do arquivo depois e descartadas
+    pelo SeenStore.
+    """
+    new_messages = []
+    for msg in messages:
+        msg_id = msg.get("message_id")
+        ad_hash = msg.get("ad_hash")
+        if seen.is_seen(msg_id, ad_hash):
+            continue
+        seen.add(msg_id, ad_hash)
+        new_messages.append(msg)
+
+    journal = state["journal"]
+    return MessageBatch(
+        new_messages, journal["offset"], journal["inode"], journal["size"], 0
+    )
 
 
-while True:
+def run_cycle(
+    seen,
+    inventory,
+    classification_cache,
+    ad_store,
+    pushed=None,
+    boot=None,
+    workers=None,
+):
+    """
+    Processa as mensagens empurradas pelo collector (se houver) e tudo o que
+    chegou ao journal desde o último ciclo.
 
+    boot ({"started": perf_counter, "first_match": None}) registra e reporta
+    uma vez o tempo do início do engine até a primeira oportunidade exportada.
+    workers: processos do normalizer (None = NORMALIZER_WORKERS).
+    """
     state = load_state()
+    seen.refresh()
 
-    new_messages, all_ids, all_hashes = read_new_messages(
-        state["seen_ids"], state["seen_hashes"]
+    batches = iter_message_batches(state, seen)
+    if pushed:
+        batches = itertools.chain([pushed_batch(state, seen, pushed)], batches)
+    processed, exported, stats = run_pipeline(
+        batches,
+        inventory,
+        classification_cache,
+        _commit(state, seen, classification_cache, ad_store),
+        ad_store=ad_store,
+        workers=workers,
     )
 
-    if new_messages:
+    if processed:
+        cache_stats = classification_cache.stats()
+        print(
+            "Processed:",
+            processed,
+            f"(cache: {cache_stats['hits'] + cache_stats['disk_hits']} hits, "
+            f"{cache_stats['misses']} misses)",
+        )
+        for stage in stats.values():
+            print(f"[PIPELINE] {stage.summary()}")
 
-        sellers, buyers, useless = run_classifier(new_messages)
-        sellers_pad, buyers_pad = run_normalizer(sellers, buyers)
-        opportunities = get_opportunity(sellers_pad, buyers_pad)
+    first_output = stats["egest"].first_output
+    if boot is not None and boot["first_match"] is None and first_output is not None:
+        boot["first_match"] = first_output - boot["started"]
+        print(
+            f"[ENGINE] primeira oportunidade {boot['first_match']:.2f}s após o início."
+        )
 
-        state["seen_ids"] = all_ids
-        state["seen_hashes"] = all_hashes
+    return processed
 
+
+def warm_start(state, seen, inventory, ad_store, workers=None) -> bool:
+    """
+    Retoma do checkpoint (checkpoint.py) se ele ainda vale para o
+    messages.jsonl atual: inventário e índice do matcher vêm prontos, sem
+    decodificar anúncio por anúncio nem reconstruir o SellerIndex. Se o
+    engine avançou depois do checkpoint, o offset e o SeenStore voltam para o
+    ponto do checkpoint e o próximo ciclo relê só essas linhas (anúncios do
+    normalized_ads.bin, classificação do cache, oportunidades repetidas
+    descartadas pelo OpportunityStore). Sem checkpoint utilizável, reconstrói
+    o inventário do normalized_ads.bin.
+
+    Retorna True se o estado do journal mudou e precisa ser salvo.
+    """
+    start = time.perf_counter()
+    checkpoint = load_checkpoint()
+    if checkpoint is None:
+        restore_inventory(inventory, ad_store, workers=workers)
+        return False
+
+    with checkpoint:
+        saved = checkpoint.journal
+        journal = state["journal"]
+        try:
+            inode = os.stat(MESSAGES_FILE).st_ino
+        except FileNotFoundError:
+            inode = None
+        # Cleaner ou purge reescreveram o arquivo depois do checkpoint.
+        if not (
+            saved["inode"] == journal.get("inode") == inode
+            and saved["offset"] <= journal.get("offset", 0)
+            and saved["size"] <= journal.get("size", 0)
+        ):
+            print("[CHECKPOINT] não corresponde ao messages.jsonl atual, ignorado.")
+            restore_inventory(inventory, ad_store, workers=workers)
+            return False
+
+        inventory.restore(checkpoint.inventory())
+        replay = journal.get("offset", 0) - saved["offset"]
+        if replay:
+            seen.restore(*checkpoint.seen())
+            journal.update(saved)
+        age = time.time() - checkpoint.created
+
+    # Anúncios purgados depois do checkpoint já têm tombstone no store.
+    if len(ad_store):
+        for mid in inventory.message_ids():
+            if mid not in ad_store:
+                inventory.remove(mid)
+
+    print(
+        f"[CHECKPOINT] retomado do checkpoint de {age / 60:.0f} min atrás: "
+        f"{len(inventory)} anúncios em {time.perf_counter() - start:.2f}s, "
+        f"{replay / 1024:.0f} KB do journal a reler."
+    )
+    return bool(replay)
+
+
+def save_checkpoint(seen, inventory):
+    """Grava o checkpoint com o estado do último commit."""
+    start = time.perf_counter()
+    size = write_checkpoint(load_state(), seen, inventory)
+    print(
+        f"[CHECKPOINT] {len(inventory)} anúncios, {size / (1024 * 1024):.1f} MB "
+        f"em {time.perf_counter() - start:.2f}s."
+    )
+
+
+def apply_controls(commands, seen, inventory, ad_store):
+    """Comandos recebidos pelo socket de ingestão (ex.: purge_user.py)."""
+    for command in commands:
+        if command.get("control") != "purge":
+            print(f"[INGEST] comando desconhecido: {command.get('control')!r}")
+            continue
+        removed = []
+        for author_id in command.get("author_ids", []):
+            removed += inventory.remove_author(author_id)
+        ad_store.discard(removed)
+        seen.refresh()
+        print(f"[PURGE] engine: {len(removed)} anúncios removidos do inventário.")
+
+
+async def run_engine(
+    debounce: float = DEBOUNCE_SECONDS,
+    polling: bool = False,
+    ingest_socket: str = None,
+    workers: int = NORMALIZER_WORKERS,
+):
+    """
+    Loop orientado a eventos: acorda quando o messages.jsonl muda (inotify,
+    ou polling como fallback) e roda um ciclo. Eventos que chegam durante a
+    janela de debounce ou durante um ciclo são agrupados no próximo. Sem
+    mudanças, fica parado (só acorda a cada IDLE_WAKEUP_SECONDS).
+
+    Com ingest_socket, também aceita mensagens empurradas pelo collector via
+    Unix socket (ingest_server.py), processadas antes de reler o journal.
+
+    Ao iniciar, retoma do checkpoint (warm_start); grava um novo a cada
+    CHECKPOINT_INTERVAL segundos com mudanças e ao encerrar.
+
+    workers > 1 normaliza em um pool de processos (normalize_parallel).
+    """
+    boot = {"started": time.perf_counter(), "first_match": None}
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="engine")
+
+    seen = SeenStore()
+    inventory = AdInventory()
+    classification_cache = ClassificationCache()
+    ad_store = NormalizedAdStore()
+
+    state = load_state()
+    changed = seen.migrate_legacy(state)
+    if warm_start(state, seen, inventory, ad_store, workers) or changed:
         save_state(state)
+    checkpoint_at = time.monotonic()
+    # Um checkpoint ignorado (ou ausente) é substituído no primeiro intervalo.
+    dirty = True
+
+    wake = asyncio.Event()
+    wake.set()
+    watcher = watch_file(MESSAGES_FILE, wake.set, loop, polling=polling)
+
+    pushed = []
+    controls = []
+
+    def on_pushed(messages):
+        pushed.extend(messages)
+        wake.set()
+
+    def on_control(command):
+        controls.append(command)
+        wake.set()
+
+    server = None
+    if ingest_socket:
+        server = IngestServer(on_pushed, ingest_socket, on_control)
+        await server.start()
+
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(wake.wait(), IDLE_WAKEUP_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            if debounce:
+                await asyncio.sleep(debounce)
+            wake.clear()
 
-        if opportunities:
-            export_opportunities(opportunities)
+            if controls:
+                commands, controls[:] = list(controls), []
+                await loop.run_in_executor(
+                    executor, apply_controls, commands, seen, inventory, ad_store
+                )
+                dirty = True
 
-        print("Processed:", len(new_messages))
+            batch, pushed[:] = list(pushed), []
+            processed = await loop.run_in_executor(
+                executor,
+                run_cycle,
+                seen,
+                inventory,
+                classification_cache,
+                ad_store,
+                batch,
+                boot,
+                workers,
+            )
+            dirty = dirty or bool(processed)
 
-    time.sleep(3)
+            if dirty and time.monotonic() - checkpoint_at >= CHECKPOINT_INTERVAL:
+                await loop.run_in_executor(executor, save_checkpoint, seen, inventory)
+                checkpoint_at = time.monotonic()
+                dirty = False
+    except Exception:
+        # Ciclo interrompido no meio: a memória pode estar à frente do commit.
+        dirty = False
+        raise
+    finally:
+        if server is not None:
+            await server.stop()
+        watcher.stop(loop)
+        executor.shutdown(wait=True)
+        if dirty:
+            save_checkpoint(seen, inventory)
+        ad_store.close()
+        shutdown_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="intel-engine")
+    parser.add_argument(
+        "--poll", action="store_true", help="usa polling em vez de inotify"
+    )
+    parser.add_argument(
+        "--ingest-socket",
+        nargs="?",
+        const=INGEST_SOCKET,
+        default=None,
+        help=f"aceita mensagens do collector via Unix socket ({INGEST_SOCKET})",
+    )
+    parser.add_argument(
+        "--normalizer-workers",
+        type=int,
+        metavar="N",
+        default=NORMALIZER_WORKERS,
+        help="processos do normalizer; 1 = em série (padrão: "
+        "INTEL_NORMALIZER_WORKERS ou 1)",
+    )
+    args = parser.parse_args()
+
+    asyncio.run(
+        run_engine(
+            polling=args.poll,
+            ingest_socket=args.ingest_socket,
+            workers=args.normalizer_workers,
+        )
+    )
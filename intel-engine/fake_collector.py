@@ -0,0 +1,71 @@
+"""
+Collector falso para testar o engine localmente, sem WhatsApp.
+
+Grava mensagens sintéticas no messages.jsonl (como o wpp-collector) e, se o
+engine estiver com --ingest-socket, também as envia pelo Unix socket.
+
+Uso:
+    python engine.py --ingest-socket
+    python fake_collector.py --count 50 --interval 0.2
+    python fake_collector.py --count 50 --no-push
+"""
+
+import argparse
+import json
+import socket
+import time
+from benchmarks import synthetic_messages
+from engine import MESSAGES_FILE
+from ingest_server import INGEST_SOCKET
+
+
+def connect(path: str):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError as e:
+        print(f"[FAKE] sem conexão com {path} ({e}); só gravando no journal.")
+        sock.close()
+        return None
+    return sock
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--socket", default=INGEST_SOCKET)
+    parser.add_argument("--no-push", action="store_true")
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else int(time.time())
+    sock = None if args.no_push else connect(args.socket)
+
+    for i, msg in enumerate(synthetic_messages(args.count, seed)):
+        msg["message_id"] = f"FAKE{seed}-{i:06d}"
+        msg["ad_hash"] = f"{seed:016x}{i:016x}"
+        msg["timestamp"] = int(time.time())
+        line = json.dumps(msg, ensure_ascii=False) + "\n"
+
+        # Journal primeiro, como o collector: o socket é só o atalho.
+        with open(MESSAGES_FILE, "a", encoding="utf-8") as f:
+            f.write(line)
+
+        if sock is not None:
+            try:
+                sock.sendall(line.encode("utf-8"))
+            except OSError as e:
+                print(f"[FAKE] envio falhou ({e}); seguindo só com o journal.")
+                sock.close()
+                sock = None
+
+        print(f"[FAKE] {msg['message_id']}: {msg['message'][:50]!r}")
+        time.sleep(args.interval)
+
+    if sock is not None:
+        sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct("iIII")
+
+POLL_INTERVAL = 0.5
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError, TypeError):
+        return None
+    return libc
+
+
+class InotifyWatcher:
+    """
+    Chama on_change quando o arquivo é modificado, criado ou substituído.
+
+    Observa o diretório e não o arquivo: cleaner.py e purge_user.py trocam o
+    messages.jsonl por os.replace, o que mudaria o inode observado.
+    """
+
+    def __init__(self, path: str, on_change):
+        libc = _load_libc()
+        if libc is None:
+            raise OSError("inotify indisponível")
+
+        self.path = path
+        self.name = os.fsencode(os.path.basename(path))
+        self.on_change = on_change
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+
+        directory = os.path.dirname(os.path.abspath(path))
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch falhou em {directory}")
+
+    def start(self, loop):
+        loop.add_reader(self.fd, self._read_events)
+
+    def _read_events(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        changed = False
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if name == self.name:
+                changed = True
+
+        if changed:
+            self.on_change()
+
+    def stop(self, loop):
+        loop.remove_reader(self.fd)
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Fallback sem inotify: compara inode/tamanho/mtime a cada POLL_INTERVAL."""
+
+    def __init__(self, path: str, on_change, interval: float = POLL_INTERVAL):
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self._task = None
+        self._last = self._signature()
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            current = self._signature()
+            if current != self._last:
+                self._last = current
+                self.on_change()
+
+    def start(self, loop):
+        self._task = loop.create_task(self._run())
+
+    def stop(self, loop):
+        if self._task is not None:
+            self._task.cancel()
+
+
+def watch_file(path: str, on_change, loop, polling: bool = False):
+    """Inicia um InotifyWatcher ou, se indisponível, um PollingWatcher."""
+    watcher = None
+    if not polling:
+        try:
+            watcher = InotifyWatcher(path, on_change)
+        except OSError as e:
+            print(f"[WATCHER] inotify indisponível ({e}); usando polling.")
+    if watcher is None:
+        watcher = PollingWatcher(path, on_change)
+    watcher.start(loop)
+    return watcher
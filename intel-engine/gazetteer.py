@@ -0,0 +1,384 @@
+import re
+from keyword_automaton import KeywordAutomaton
+
+NEIGHBORHOODS = [
+    "recreio",
+    "barra da tijuca",
+    "barra olímpica",
+    "barra",
+    "jacarepaguá",
+    "vargem grande",
+    "vargem pequena",
+    "freguesia",
+    "ipanema",
+    "copacabana",
+    "centro da cidade",
+    "curicica",
+    "taquara",
+    "anil",
+    "pechincha",
+    "itanhangá",
+    "humaitá",
+    "flamengo",
+    "botafogo",
+    "são conrado",
+    "leblon",
+    "gávea",
+    "jardim botânico",
+    "leme",
+    "urca",
+    "catete",
+    "glória",
+    "laranjeiras",
+]
+
+NEIGHBORHOOD_ALIASES = {
+    "barra da tijuca": "BARRA",
+    "barra": "BARRA",
+    "barra olímpica": "BARRA OLIMPICA",
+    "jacarepaguá": "JACAREPAGUÁ",
+    "itanhangá": "ITANHANGÁ",
+    "humaitá": "HUMAITÁ",
+    "são conrado": "SÃO CONRADO",
+    "gávea": "GÁVEA",
+    "jardim botânico": "JARDIM BOTÂNICO",
+    "glória": "GLÓRIA",
+}
+
+NEIGHBORHOOD_PARENT = {
+    "barra bonita": "RECREIO",
+    "pontal oceanico": "RECREIO",
+    "zico": "RECREIO",
+    "cidade jardim": "BARRA OLIMPICA",
+}
+
+# Sub-bairros extraídos do NEIGHBORHOOD_PARENT — detectados separadamente
+SUB_NEIGHBORHOODS = list(NEIGHBORHOOD_PARENT.keys())
+
+ZONES = {
+    "ZONA SUDOESTE": {
+        "aliases": [
+            "zona sudoeste",
+            "z. sudoeste",
+            "zona oeste",
+            "z. oeste",
+        ],
+        "neighborhoods": [
+            "RECREIO",
+            "BARRA",
+            "BARRA OLIMPICA",
+            "JACAREPAGUÁ",
+            "FREGUESIA",
+            "CURICICA",
+            "TAQUARA",
+            "ANIL",
+            "PECHINCHA",
+            "ITANHANGÁ",
+            "VARGEM GRANDE",
+            "VARGEM PEQUENA",
+        ],
+    },
+    "ZONA SUL": {
+        "aliases": [
+            "zona sul",
+            "z. sul",
+            "zs",
+        ],
+        "neighborhoods": [
+            "IPANEMA",
+            "COPACABANA",
+            "HUMAITÁ",
+            "FLAMENGO",
+            "BOTAFOGO",
+            "SÃO CONRADO",
+            "LEBLON",
+            "LAGOA",
+            "GÁVEA",
+            "JARDIM BOTÂNICO",
+            "LEME",
+            "URCA",
+            "CATETE",
+            "GLÓRIA",
+            "LARANJEIRAS",
+        ],
+    },
+}
+
+
+CONDOMINIUM = [
+    "Acqua Marine",
+    "Alameda dos Jequitibás",
+    "Alfa Barra",
+    "Aloha",
+    "Alphaville",
+    "Alto Leblon",
+    "Americas Park",
+    "Art Life",
+    "Atlântico Golf",
+    "Atlântico Sul",
+    "Barra Bali",
+    "Barra Central Park",
+    "Barramares",
+    "Barra Summer Dreams",
+    "Barra Sunday",
+    "Península",
+    "Beauclair",
+    "Blue House",
+    "Blue Vision",
+    "Bora Bora Resort",
+    "Bosque da Freguesia",
+    "Bosque dos Esquilos",
+    "Bothanica Nature",
+    "Califórnia Coast",
+    "Casa Alta",
+    "Duet",
+    "Duo Residenziale",
+    "Estrelas",
+    "Floresta Park",
+    "Fontano",
+    "Four Seasons",
+    "Frames",
+    "Freedom",
+    "Gleba A",
+    "Gleba B",
+    "Gleba C",
+    "Grand Prix",
+    "Green Park",
+    "Green Place",
+    "Icono Parque",
+    "Itaúna Gold",
+    "Jardim Interlagos",
+    "Jardins",
+    "Joia da Barra",
+    "Le Monde",
+    "Le Parc",
+    "Liberty Green",
+    "Libertá",
+    "Life Resort",
+    "Liv Lifestyle",
+    "Luar do Pontal",
+    "Lume Barra Bonita",
+    "Lume Residencial",
+    "Maayan",
+    "Malibu",
+    "Mandala",
+    "Maui",
+    "Maramar",
+    "Marina Costabella",
+    "Mediterrâneo",
+    "MORADA DO SOL",
+    "MUDRA",
+    "Next",
+    "Niemeyer",
+    "Nova Barra",
+    "Nova Ipanema",
+    "Nova Sernambetiba",
+    "Novo Leblon",
+    "Ocean Breeze",
+    "Origami",
+    "Palais",
+    "Palm Springs",
+    "Park Premium",
+    "Pedra de Itaúna",
+    "Península",
+    "Planície",
+    "Playa",
+    "Portal do Parque",
+    "Príncipe de Mônaco",
+    "Recanto das Garças",
+    "Recanto do Pontal",
+    "Reserva Jardim",
+    "Reserva do Parque",
+    "Rio Mar",
+    "Riserva Golf",
+    "Riviera Del Sol",
+    "Royal Green",
+    "Santa Marina",
+    "Santa Mônica Special",
+    "Saint Vivant",
+    "Saint Tropez",
+    "Stories Residence",
+    "Sublime Max",
+    "Sunset",
+    "Terra Nossa",
+    "Terrazas",
+    "Varandas",
+    "Verano",
+    "Vitality Spa",
+    "Villa Blanca",
+    "Villas da Barra",
+    "Viverde",
+    "Wonderful",
+]
+
+
+ACCENT_MAP = str.maketrans(
+    {
+        "á": "a",
+        "à": "a",
+        "ã": "a",
+        "â": "a",
+        "é": "e",
+        "ê": "e",
+        "è": "e",
+        "í": "i",
+        "ì": "i",
+        "î": "i",
+        "ó": "o",
+        "õ": "o",
+        "ô": "o",
+        "ò": "o",
+        "ú": "u",
+        "ü": "u",
+        "ù": "u",
+        "ç": "c",
+    }
+)
+
+
+def fold_accents(text: str) -> str:
+    """Remove acentos das minúsculas (mesma tabela do antigo _remove_accents)."""
+    return text.translate(ACCENT_MAP)
+
+
+# --- Condomínios -----------------------------------------------------------
+
+# Ordem de precedência: mais longos primeiro (sort estável, empates na ordem
+# da lista). Mantém os nomes repetidos, como no CONDOMINIUM original.
+CONDOMINIUMS_BY_LENGTH = sorted(CONDOMINIUM, key=len, reverse=True)
+_CONDOMINIUM_MASKS = [
+    (cond.lower(), fold_accents(cond.lower())) for cond in CONDOMINIUMS_BY_LENGTH
+]
+
+_CONDOMINIUM_AUTOMATON = KeywordAutomaton(lower for lower, _ in _CONDOMINIUM_MASKS)
+_CONDOMINIUM_FOLDED_AUTOMATON = KeywordAutomaton(
+    folded for _, folded in _CONDOMINIUM_MASKS
+)
+
+
+def find_condominiums(text_lower: str) -> list:
+    """Condomínios citados no texto (já em minúsculas), na ordem de precedência."""
+    found = _CONDOMINIUM_AUTOMATON.find(text_lower)
+    if not found:
+        return []
+    return [cond for cond in CONDOMINIUMS_BY_LENGTH if cond.lower() in found]
+
+
+def _mask(text: str, automaton: KeywordAutomaton, names) -> str:
+    """
+    Apaga os nomes de condomínio do texto, do mais longo para o mais curto.
+
+    Só os nomes achados pelo autômato são substituídos. Se depois disso ainda
+    sobrar algum nome (um apagamento que juntou pedaços do texto), refaz a
+    varredura sequencial completa, que é a definição do resultado.
+    """
+    found = automaton.find(text)
+    if not found:
+        return text
+
+    masked = text
+    for name in names:
+        if name in found:
+            masked = masked.replace(name, "")
+
+    if automaton.find(masked):
+        masked = text
+        for name in names:
+            masked = masked.replace(name, "")
+    return masked
+
+
+def mask_condominiums(text: str):
+    """
+    Retorna (texto sem condomínios, texto sem acentos e sem condomínios).
+    As duas versões são mascaradas de forma independente, como antes.
+    """
+    masked = _mask(
+        text, _CONDOMINIUM_AUTOMATON, [lower for lower, _ in _CONDOMINIUM_MASKS]
+    )
+    masked_folded = _mask(
+        fold_accents(text),
+        _CONDOMINIUM_FOLDED_AUTOMATON,
+        [folded for _, folded in _CONDOMINIUM_MASKS],
+    )
+    return masked, masked_folded
+
+
+# --- Bairros e sub-bairros -------------------------------------------------
+
+# Bairros + sub-bairros juntos, mais longos primeiro para evitar falsos parciais.
+PLACES_BY_LENGTH = sorted(NEIGHBORHOODS + SUB_NEIGHBORHOODS, key=len, reverse=True)
+_PLACE_FOLDED = {place: fold_accents(place) for place in PLACES_BY_LENGTH}
+
+# place -> lugares que, já casados, o tornam redundante ("barra" dentro de
+# "barra da tijuca"), comparados sem acento.
+_COVERED_BY = {
+    place: frozenset(
+        longer
+        for longer in PLACES_BY_LENGTH
+        if _PLACE_FOLDED[place] in _PLACE_FOLDED[longer]
+    )
+    for place in PLACES_BY_LENGTH
+}
+
+_PLACE_AUTOMATON = KeywordAutomaton(PLACES_BY_LENGTH)
+_PLACE_FOLDED_AUTOMATON = KeywordAutomaton(_PLACE_FOLDED.values())
+
+
+def find_places(text: str, text_folded: str):
+    """
+    Bairros e sub-bairros presentes no texto (com ou sem acento).
+
+    Retorna (bairros canônicos, sub-bairro canônico ou None), com a mesma
+    precedência da varredura antiga: mais longos primeiro, ignorando nomes
+    contidos em um lugar já casado.
+    """
+    found_accented = _PLACE_AUTOMATON.find(text)
+    found_folded = _PLACE_FOLDED_AUTOMATON.find(text_folded)
+
+    found = set()
+    matched = set()
+    sub_neighborhood = None
+    if not found_accented and not found_folded:
+        return found, sub_neighborhood
+
+    for place in PLACES_BY_LENGTH:
+        if place not in found_accented and _PLACE_FOLDED[place] not in found_folded:
+            continue
+        if not _COVERED_BY[place].isdisjoint(matched):
+            continue
+
+        matched.add(place)
+        canonical = NEIGHBORHOOD_ALIASES.get(place, place.upper())
+        found.add(canonical)
+
+        parent = NEIGHBORHOOD_PARENT.get(place)
+        if parent:
+            # É um sub-bairro: adiciona o parent e registra o sub-bairro detectado
+            found.add(parent)
+            sub_neighborhood = canonical
+
+    return found, sub_neighborhood
+
+
+# --- Zonas -----------------------------------------------------------------
+
+_ZONE_PATTERNS = [
+    (
+        zone_name,
+        [
+            re.compile(r"\b" + re.escape(fold_accents(alias)) + r"\b")
+            for alias in sorted(zone_data["aliases"], key=len, reverse=True)
+        ],
+    )
+    for zone_name, zone_data in ZONES.items()
+]
+
+
+def find_zone(text_folded: str):
+    """Primeira zona cujo apelido aparece como palavra inteira no texto."""
+    for zone_name, patterns in _ZONE_PATTERNS:
+        for pattern in patterns:
+            if pattern.search(text_folded):
+                return zone_name
+    return None
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import os
+
+INGEST_SOCKET = "../data/engine.sock"
+MAX_LINE_BYTES = 1 << 20
+
+
+class IngestServer:
+    """
+    Endpoint Unix socket para o collector empurrar mensagens em NDJSON.
+
+    Cada linha válida é entregue a on_messages assim que chega; quem agrupa
+    rajadas é o loop do engine. O messages.jsonl continua sendo o journal
+    durável: o collector grava no arquivo antes de enviar, e o SeenStore faz
+    o engine ignorar a mesma mensagem quando ela aparece depois no journal.
+
+    Linhas com a chave "control" (ex.: {"control": "purge", "author_ids": [...]},
+    enviada pelo purge_user.py) vão para on_control em vez de on_messages.
+    """
+
+    def __init__(self, on_messages, path: str = INGEST_SOCKET, on_control=None):
+        self.path = path
+        self.on_messages = on_messages
+        self.on_control = on_control
+        self.received = 0
+        self.invalid = 0
+        self._server = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(
+            self._handle, path=self.path, limit=MAX_LINE_BYTES
+        )
+        print(f"[INGEST] ouvindo em {self.path}")
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    self.invalid += 1
+                    break
+                if not line:
+                    break
+
+                msg = self._parse(line)
+                if msg is None:
+                    continue
+                if "control" in msg:
+                    if self.on_control is not None:
+                        self.on_control(msg)
+                    continue
+                self.received += 1
+                self.on_messages([msg])
+        finally:
+            writer.close()
+
+    def _parse(self, line: bytes):
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            msg = json.loads(line)
+        except json.JSONDecodeError:
+            self.invalid += 1
+            return None
+        if not isinstance(msg, dict):
+            self.invalid += 1
+            return None
+        if "control" not in msg and not msg.get("message_id"):
+            self.invalid += 1
+            return None
+        return msg
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
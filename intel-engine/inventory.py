@@ -0,0 +1,115 @@
+import time
+from matcher import SellerIndex
+
+SELLER_TTL = 7_776_000  # 3 meses, mesma janela do cleaner
+BUYER_TTL = 2_592_000  # 30 dias, mesma janela do cleaner
+
+
+def ad_message_id(ad):
+    return ad["original_content"]["message_id"]
+
+
+def ad_author_id(ad):
+    return ad["original_content"].get("author_id")
+
+
+def ad_timestamp(ad):
+    return ad["original_content"].get("timestamp", 0)
+
+
+class AdInventory:
+    """
+    Anúncios normalizados ainda vivos, indexados por message_id.
+
+    Substitui as listas globais do normalizer: o engine adiciona os anúncios
+    novos de cada ciclo e expira os antigos, então a memória acompanha a
+    janela de retenção e não o histórico inteiro.
+    """
+
+    def __init__(self, seller_ttl: int = SELLER_TTL, buyer_ttl: int = BUYER_TTL):
+        self.seller_ttl = seller_ttl
+        self.buyer_ttl = buyer_ttl
+        self._sellers = {}
+        self._buyers = {}
+        self.seller_index = SellerIndex()
+
+    @property
+    def sellers(self):
+        return list(self._sellers.values())
+
+    @property
+    def buyers(self):
+        return list(self._buyers.values())
+
+    def __len__(self):
+        return len(self._sellers) + len(self._buyers)
+
+    def message_ids(self):
+        return list(self._sellers) + list(self._buyers)
+
+    def __contains__(self, message_id):
+        return message_id in self._sellers or message_id in self._buyers
+
+    def _bucket(self, ad):
+        return self._sellers if ad["intent"] == "sell" else self._buyers
+
+    def add(self, ad):
+        """Adiciona (ou substitui) um anúncio. Retorna False se já existia."""
+        bucket = self._bucket(ad)
+        message_id = ad_message_id(ad)
+        is_new = message_id not in bucket
+        bucket[message_id] = ad
+        if bucket is self._sellers:
+            self.seller_index.remove(message_id)
+            self.seller_index.add(ad)
+        return is_new
+
+    def add_many(self, ads):
+        return sum(1 for ad in ads if self.add(ad))
+
+    def snapshot(self):
+        """
+        Anúncios e índice do matcher para o checkpoint (checkpoint.py). O
+        índice aponta para os mesmos dicts dos vendedores.
+        """
+        return (self._sellers, self._buyers, self.seller_index.snapshot())
+
+    def restore(self, snapshot):
+        self._sellers, self._buyers, index = snapshot
+        self.seller_index.restore(index)
+
+    def _drop(self, bucket, predicate):
+        removed = [mid for mid, ad in bucket.items() if predicate(ad)]
+        for mid in removed:
+            del bucket[mid]
+            if bucket is self._sellers:
+                self.seller_index.remove(mid)
+        return removed
+
+    def expire(self, now: int = None):
+        """Remove vendedores com mais de 3 meses e compradores com mais de 30 dias."""
+        now = int(time.time()) if now is None else now
+        seller_cutoff = now - self.seller_ttl
+        buyer_cutoff = now - self.buyer_ttl
+        removed = self._drop(self._sellers, lambda ad: ad_timestamp(ad) < seller_cutoff)
+        removed += self._drop(self._buyers, lambda ad: ad_timestamp(ad) < buyer_cutoff)
+        return removed
+
+    def is_live(self, ad, now: int = None) -> bool:
+        """Se o anúncio ainda está na janela de retenção (a mesma de expire)."""
+        now = int(time.time()) if now is None else now
+        ttl = self.seller_ttl if ad["intent"] == "sell" else self.buyer_ttl
+        return ad_timestamp(ad) >= now - ttl
+
+    def remove_author(self, author_id):
+        removed = self._drop(self._sellers, lambda ad: ad_author_id(ad) == author_id)
+        removed += self._drop(self._buyers, lambda ad: ad_author_id(ad) == author_id)
+        return removed
+
+    def remove(self, message_id):
+        ad = self._sellers.pop(message_id, None)
+        if ad is not None:
+            self.seller_index.remove(message_id)
+        else:
+            ad = self._buyers.pop(message_id, None)
+        return ad
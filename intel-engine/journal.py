@@ -0,0 +1,484 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+from compaction import compact_file, iter_raw_lines
+from record_scanner import RecordScanner
+
+JOURNAL_DIR = "../data/journal"
+MANIFEST_NAME = "manifest.json"
+INDEX_NAME = "index.db"
+
+# Período coberto por cada segmento. Múltiplos de um dia geram nomes
+# AAAA-MM-DD.jsonl; períodos menores, AAAA-MM-DDTHH.jsonl (UTC).
+SEGMENT_SECONDS = 86_400
+
+_SQL_CHUNK = 500
+
+
+def segment_start(ts: int) -> int:
+    return ts - ts % SEGMENT_SECONDS
+
+
+def segment_name(start: int, intent: str = None) -> str:
+    fmt = "%Y-%m-%d" if SEGMENT_SECONDS % 86_400 == 0 else "%Y-%m-%dT%H"
+    name = time.strftime(fmt, time.gmtime(start))
+    return f"{name}.{intent}.jsonl" if intent else f"{name}.jsonl"
+
+
+def _chunks(values, size: int = _SQL_CHUNK):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+def load_manifest(directory: str = JOURNAL_DIR) -> dict:
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"version": 1, "segments": [], "pending": None}
+
+
+def iter_sealed_lines(directory: str = JOURNAL_DIR):
+    """
+    Linhas (bytes, com "\\n") dos segmentos selados, do mais antigo ao mais
+    novo, sem as que viraram tombstone. Cada segmento só é lido até o tamanho
+    registrado no manifest, então um roll em andamento não aparece pela metade.
+    """
+    for entry in load_manifest(directory)["segments"]:
+        tombstones = set(entry["tombstones"])
+        try:
+            f = open(os.path.join(directory, entry["name"]), "rb")
+        except FileNotFoundError:
+            continue
+        with f:
+            for offset, line in iter_raw_lines(f, 0, entry["size"]):
+                if offset not in tombstones:
+                    yield line
+
+
+class Journal:
+    """
+    Mensagens já seladas do messages.jsonl, em segmentos por período
+    (SEGMENT_SECONDS) e intenção, descritos pelo manifest.json.
+
+    O collector continua anexando só ao messages.jsonl, que faz o papel de
+    segmento ativo. O cleaner sela nos segmentos as linhas de períodos já
+    fechados (roll), e a retenção vira apagar segmentos inteiros (expire): os
+    de compradores ("buying") saem antes, sem reler nem reclassificar nada.
+    Quando um anúncio reaparece, a cópia antiga vira tombstone no segmento
+    dela (offset listado no manifest) e os leitores a pulam.
+
+    O index.db guarda message_id, ad_hash, author_id e timestamp de cada
+    linha selada, para o dedup do roll, o purge e o estado de dedup do engine
+    não precisarem ler os segmentos. É derivado dos arquivos: sync() indexa o
+    final de um segmento que cresceu e reconstrói o de um que foi reescrito.
+    """
+
+    def __init__(self, directory: str = JOURNAL_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self.manifest = load_manifest(directory)
+        self._scanner = RecordScanner(
+            ("message_id", "ad_hash", "author_id", "timestamp")
+        )
+        self._conn = sqlite3.connect(os.path.join(directory, INDEX_NAME))
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS records (
+                segment TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                author_id TEXT,
+                message_id TEXT,
+                ad_hash TEXT,
+                timestamp INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS records_segment ON records (segment, offset);
+            CREATE INDEX IF NOT EXISTS records_author ON records (author_id);
+            CREATE INDEX IF NOT EXISTS records_id ON records (message_id);
+            CREATE INDEX IF NOT EXISTS records_hash ON records (ad_hash);
+            CREATE TABLE IF NOT EXISTS segments (
+                name TEXT PRIMARY KEY,
+                inode INTEGER,
+                size INTEGER,
+                tombstones INTEGER
+            );
+            """)
+        self._conn.commit()
+        self._recover()
+        self.sync()
+
+    @property
+    def segments(self):
+        return self.manifest["segments"]
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _entries(self) -> dict:
+        return {entry["name"]: entry for entry in self.segments}
+
+    def _add_entry(self, name: str, start: int, intent: str):
+        entry = {
+            "name": name,
+            "start": start,
+            "end": start + SEGMENT_SECONDS,
+            "intent": intent,
+            "size": 0,
+            "lines": 0,
+            "tombstones": [],
+        }
+        self.segments.append(entry)
+        self.segments.sort(key=lambda e: (e["start"], e["name"]))
+        return entry
+
+    def _save(self):
+        tmp_path = self._manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._manifest_path)
+
+    # --- roll -------------------------------------------------------------
+
+    def roll(
+        self,
+        active_path: str,
+        moves: dict,
+        targets: dict,
+        keep,
+        scanned_size: int,
+        tombstones: dict = None,
+        on_tail=None,
+    ):
+        """
+        Sela as linhas de active_path cujos offsets estão em moves (offset ->
+        nome do segmento; targets: nome -> (início, intenção)), anexando-as aos
+        segmentos, e reescreve active_path só com as linhas de keep
+        (compaction.compact_file, que preserva o que for anexado enquanto
+        isso). tombstones: nome do segmento -> offsets que deixam de valer.
+
+        O roll fica registrado como pendente no manifest antes de tocar nos
+        arquivos: se o processo cair antes da troca do messages.jsonl, os
+        appends nos segmentos são desfeitos na próxima abertura; se cair
+        depois, o roll é concluído.
+
+        Retorna (linhas mantidas, linhas anexadas durante o roll, linhas seladas).
+        """
+        entries = self._entries()
+        pending = self.manifest["pending"] = {
+            "active": active_path,
+            "inode": os.stat(active_path).st_ino,
+            "sizes": {
+                name: entries[name]["size"] if name in entries else 0
+                for name in targets
+            },
+            "targets": {name: list(target) for name, target in targets.items()},
+            "lines": {},
+            "tombstones": {
+                name: sorted(offsets) for name, offsets in (tombstones or {}).items()
+            },
+        }
+        self._save()
+
+        files = {}
+        try:
+            with open(active_path, "rb") as src:
+                for offset, line in iter_raw_lines(src, 0, scanned_size):
+                    name = moves.get(offset)
+                    if name is None:
+                        continue
+                    dst = files.get(name)
+                    if dst is None:
+                        path = self.path(name)
+                        # Sobras de um roll interrompido ficam de fora.
+                        if os.path.exists(path):
+                            os.truncate(path, pending["sizes"][name])
+                        dst = files[name] = open(path, "ab")
+                    dst.write(line)
+                    pending["lines"][name] = pending["lines"].get(name, 0) + 1
+            for dst in files.values():
+                dst.flush()
+                os.fsync(dst.fileno())
+        finally:
+            for dst in files.values():
+                dst.close()
+        self._save()
+
+        kept, tail = compact_file(active_path, keep, scanned_size, on_tail)
+        self._finish_roll()
+        return kept, tail, sum(pending["lines"].values())
+
+    def _finish_roll(self):
+        pending = self.manifest["pending"]
+        entries = self._entries()
+        for name, (start, intent) in pending["targets"].items():
+            path = self.path(name)
+            if not os.path.exists(path):
+                continue
+            entry = entries.get(name) or self._add_entry(name, start, intent)
+            entry["size"] = os.path.getsize(path)
+            entry["lines"] += pending["lines"].get(name, 0)
+        for name, offsets in pending["tombstones"].items():
+            entry = entries.get(name)
+            if entry is not None:
+                entry["tombstones"] = sorted(set(entry["tombstones"]) | set(offsets))
+        self.manifest["pending"] = None
+        self._save()
+        self.sync()
+
+    def _undo_roll(self):
+        pending = self.manifest["pending"]
+        for name, size in pending["sizes"].items():
+            path = self.path(name)
+            if not os.path.exists(path):
+                continue
+            if size:
+                os.truncate(path, size)
+            else:
+                os.remove(path)
+        self.manifest["pending"] = None
+        self._save()
+
+    def _recover(self):
+        pending = self.manifest.get("pending")
+        if not pending:
+            return
+        try:
+            inode = os.stat(pending["active"]).st_ino
+        except FileNotFoundError:
+            inode = None
+        if inode == pending["inode"]:
+            print("[JOURNAL] roll interrompido antes da troca: desfazendo.")
+            self._undo_roll()
+        else:
+            print("[JOURNAL] roll interrompido depois da troca: concluindo.")
+            self._finish_roll()
+
+    # --- retenção e purge ---------------------------------------------------
+
+    def expire(self, cutoff: int, buyer_cutoff: int):
+        """
+        Apaga os segmentos que terminam antes de cutoff e os de compradores
+        que terminam antes de buyer_cutoff. Retorna as entradas removidas e
+        os (message_id, ad_hash) que saíram com elas.
+        """
+        expired = [
+            entry
+            for entry in self.segments
+            if entry["end"] <= cutoff
+            or (entry["intent"] == "buying" and entry["end"] <= buyer_cutoff)
+        ]
+        if not expired:
+            return [], []
+
+        names = {entry["name"] for entry in expired}
+        keys = []
+        for chunk in _chunks(names):
+            keys += self._conn.execute(
+                "SELECT message_id, ad_hash FROM records"
+                f" WHERE segment IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+        self.manifest["segments"] = [e for e in self.segments if e["name"] not in names]
+        self._save()
+        for name in names:
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+        self.sync()
+        return expired, keys
+
+    def author_rows(self, author_ids):
+        """(segmento, offset, message_id, ad_hash) das linhas dos autores."""
+        rows = []
+        for chunk in _chunks(set(author_ids)):
+            rows += self._conn.execute(
+                "SELECT segment, offset, message_id, ad_hash FROM records"
+                f" WHERE author_id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+        return rows
+
+    def remove_authors(self, author_ids):
+        """
+        Tira dos segmentos as linhas dos autores. Cada segmento afetado é
+        reescrito (compact_file) sem elas e sem as tombstones; um segmento
+        que fica vazio é apagado. Retorna as linhas removidas como
+        (segmento, offset, message_id, ad_hash).
+        """
+        rows = self.author_rows(author_ids)
+        drops = {}
+        for name, offset, _, _ in rows:
+            drops.setdefault(name, set()).add(offset)
+
+        entries = self._entries()
+        for name, drop in drops.items():
+            entry = entries[name]
+            keep = {
+                offset
+                for (offset,) in self._conn.execute(
+                    "SELECT offset FROM records WHERE segment = ?", (name,)
+                )
+            }
+            keep -= drop
+            path = self.path(name)
+            if keep:
+                kept, _ = compact_file(path, keep, entry["size"])
+                entry.update(size=os.path.getsize(path), lines=kept, tombstones=[])
+                self._save()
+            else:
+                self.segments.remove(entry)
+                self._save()
+                os.remove(path)
+        self.sync()
+        return rows
+
+    # --- índice -----------------------------------------------------------
+
+    def _index_segment(self, entry, start: int):
+        tombstones = set(entry["tombstones"])
+        rows = []
+        with open(self.path(entry["name"]), "rb") as f:
+            for offset, line in iter_raw_lines(f, start, entry["size"]):
+                if offset in tombstones:
+                    continue
+                record = self._scanner.extract(line)
+                if record is None:
+                    continue
+                rows.append(
+                    (
+                        entry["name"],
+                        offset,
+                        record.get("author_id"),
+                        record.get("message_id"),
+                        record.get("ad_hash"),
+                        record.get("timestamp", 0),
+                    )
+                )
+        self._conn.executemany(
+            "INSERT INTO records"
+            " (segment, offset, author_id, message_id, ad_hash, timestamp)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def _drop_index(self, name: str):
+        self._conn.execute("DELETE FROM records WHERE segment = ?", (name,))
+        self._conn.execute("DELETE FROM segments WHERE name = ?", (name,))
+
+    def sync(self):
+        """Confere o índice contra o manifest, segmento por segmento."""
+        entries = self._entries()
+        indexed = {
+            name: (inode, size, tombstones)
+            for name, inode, size, tombstones in self._conn.execute(
+                "SELECT name, inode, size, tombstones FROM segments"
+            )
+        }
+        for name in indexed.keys() - entries.keys():
+            self._drop_index(name)
+
+        for name, entry in entries.items():
+            try:
+                inode = os.stat(self.path(name)).st_ino
+            except FileNotFoundError:
+                self._drop_index(name)
+                continue
+
+            previous = indexed.get(name)
+            if previous is None or previous[0] != inode or previous[1] > entry["size"]:
+                self._drop_index(name)
+                self._index_segment(entry, 0)
+            else:
+                if previous[1] < entry["size"]:
+                    self._index_segment(entry, previous[1])
+                if previous[2] != len(entry["tombstones"]):
+                    self._conn.executemany(
+                        "DELETE FROM records WHERE segment = ? AND offset = ?",
+                        [(name, offset) for offset in entry["tombstones"]],
+                    )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO segments (name, inode, size, tombstones)"
+                " VALUES (?, ?, ?, ?)",
+                (name, inode, entry["size"], len(entry["tombstones"])),
+            )
+        self._conn.commit()
+
+    def rebuild(self):
+        self._conn.execute("DELETE FROM records")
+        self._conn.execute("DELETE FROM segments")
+        self.sync()
+
+    def find(self, message_ids=(), ad_hashes=()):
+        """
+        Linhas seladas com algum desses message_ids ou ad_hashes:
+        (segmento, offset, message_id, ad_hash, timestamp).
+        """
+        rows = set()
+        for column, values in (("message_id", message_ids), ("ad_hash", ad_hashes)):
+            for chunk in _chunks({v for v in values if v}):
+                rows.update(
+                    self._conn.execute(
+                        "SELECT segment, offset, message_id, ad_hash, timestamp"
+                        f" FROM records WHERE {column} IN"
+                        f" ({','.join('?' * len(chunk))})",
+                        chunk,
+                    )
+                )
+        return rows
+
+    def shared_hashes(self, ad_hashes, author_ids) -> set:
+        """ad_hashes que ainda aparecem em linhas seladas de outros autores."""
+        author_ids = list(set(author_ids))
+        shared = set()
+        for chunk in _chunks({h for h in ad_hashes if h}):
+            shared.update(
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT DISTINCT ad_hash FROM records"
+                    f" WHERE ad_hash IN ({','.join('?' * len(chunk))})"
+                    " AND (author_id IS NULL OR author_id NOT IN"
+                    f" ({','.join('?' * len(author_ids))}))",
+                    chunk + author_ids,
+                )
+            )
+        return shared
+
+    def iter_keys(self):
+        """(message_id, ad_hash) de cada linha selada, direto do índice."""
+        yield from self._conn.execute("SELECT message_id, ad_hash FROM records")
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Segmentos do journal")
+    parser.add_argument(
+        "command",
+        choices=["status", "reindex"],
+        nargs="?",
+        default="status",
+        help="status: lista os segmentos; reindex: reconstrói o índice",
+    )
+    args = parser.parse_args()
+
+    journal = Journal()
+    if args.command == "reindex":
+        journal.rebuild()
+        print(f"[JOURNAL] índice reconstruído: {len(journal)} mensagens.")
+    for entry in journal.segments:
+        live = entry["lines"] - len(entry["tombstones"])
+        print(
+            f"[JOURNAL] {entry['name']}: {live} mensagens, "
+            f"{entry['size'] / (1024 * 1024):.1f} MB"
+        )
+    journal.close()
@@ -0,0 +1,81 @@
+import re
+
+try:
+    import ahocorasick
+except ImportError:  # fallback: regex em trie (só stdlib)
+    ahocorasick = None
+
+
+def _trie_pattern(keywords) -> str:
+    """
+    Regex em forma de trie: prefixos comuns são fatorados e, em cada nó, as
+    continuações mais longas são tentadas antes de encerrar a palavra, então
+    a primeira alternativa que casa é sempre a palavra-chave mais longa.
+    """
+    trie = {}
+    for kw in keywords:
+        node = trie
+        for char in kw:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node) -> str:
+        branches = [
+            re.escape(char) + build(child)
+            for char, child in sorted(node.items())
+            if char
+        ]
+        if "" in node:
+            branches.append("")
+        if len(branches) == 1:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")"
+
+    return build(trie)
+
+
+class KeywordAutomaton:
+    """
+    Conjunto de palavras-chave compilado em uma única regex.
+
+    find() devolve, em uma varredura, todas as palavras-chave presentes no
+    texto — inclusive sobrepostas — com o mesmo resultado de aplicar
+    `keyword in text` para cada uma delas.
+
+    Com o pyahocorasick instalado, usa o autômato Aho–Corasick em C. Sem ele,
+    usa uma regex em forma de trie dentro de um lookahead: em cada posição
+    ela captura a maior palavra-chave que começa ali. Qualquer outra
+    palavra-chave que comece na mesma posição é prefixo dessa, então basta
+    expandir pelos prefixos pré-calculados.
+    """
+
+    def __init__(self, keywords, use_ahocorasick: bool = True):
+        self.keywords = sorted({kw for kw in keywords if kw}, key=len, reverse=True)
+
+        self._automaton = None
+        if use_ahocorasick and ahocorasick is not None and self.keywords:
+            self._automaton = ahocorasick.Automaton()
+            for kw in self.keywords:
+                self._automaton.add_word(kw, kw)
+            self._automaton.make_automaton()
+
+        self._regex = (
+            re.compile(f"(?=({_trie_pattern(self.keywords)}))")
+            if self.keywords
+            else None
+        )
+        self._prefixes = {
+            kw: tuple(p for p in self.keywords if kw.startswith(p))
+            for kw in self.keywords
+        }
+
+    def find(self, text: str) -> set:
+        if self._automaton is not None:
+            return {kw for _, kw in self._automaton.iter(text)}
+
+        found = set()
+        if self._regex is None:
+            return found
+        for longest in set(self._regex.findall(text)):
+            found.update(self._prefixes[longest])
+        return found
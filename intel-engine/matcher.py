@@ -1,3 +1,10 @@
+import time
+from bisect import bisect_left, bisect_right, insort
+from itertools import count
+
+# "scalar" avalia par a par em Python; "numpy" usa columnar_matcher.SellerColumns.
+MATCH_ENGINE = "scalar"
+
 OPPORTUNITY_SIGNALS = {
     "neighborhood": 10,
     "price": 10,
@@ -91,87 +98,262 @@ def condominium_match(buyer_condominium, seller_condominium):
     return buyer_condominium.lower() == seller_lower
 
 
-def get_opportunity(sellers_padronized, buyers_padronized):
-    opportunities = []
-    seen_pairs = set()
-
-    for buyer in buyers_padronized:
-        for seller in sellers_padronized:
+def score_pair(buyer, seller):
+    """Pontua um par comprador/vendedor. Retorna None se o par não casa."""
+    score = 0
 
-            buyer_id = buyer["original_content"]["message_id"]
-            seller_id = seller["original_content"]["message_id"]
+    if not neighborhood_match(buyer, seller):
+        return None
+
+    score += OPPORTUNITY_SIGNALS["neighborhood"]
 
-            pair_key = (buyer_id, seller_id)
+    if not price_match(buyer.get("price"), seller.get("price")):
+        return None
+
+    score += OPPORTUNITY_SIGNALS["price"]
+
+    if not bedrooms_match(buyer.get("bedrooms"), seller.get("bedrooms")):
+        return None
 
-            if pair_key in seen_pairs:
+    score += OPPORTUNITY_SIGNALS["bedrooms"]
+
+    if buyer.get("property_type") == seller.get("property_type"):
+        score += OPPORTUNITY_SIGNALS["property_type"]
+
+    buyer_area = buyer.get("area_m2")
+    if buyer_area is not None:
+        if not area_match(buyer_area, seller.get("area_m2")):
+            return None
+        score += OPPORTUNITY_SIGNALS["area_m2"]
+
+    buyer_parking = buyer.get("parking_spots")
+    if buyer_parking is not None:
+        if not parking_spots_match(buyer_parking, seller.get("parking_spots")):
+            return None
+        score += OPPORTUNITY_SIGNALS["parking_spots"]
+
+    buyer_cond = buyer.get("condominium")
+    seller_cond = seller.get("condominium")
+
+    buyer_nearbeach = buyer.get("nearbeach", False)
+    seller_nearbeach = seller.get("nearbeach", False)
+    if not nearbeach_match(buyer_nearbeach, seller_nearbeach):
+        return None
+    if buyer_nearbeach and seller_nearbeach:
+        score += OPPORTUNITY_SIGNALS["nearbeach"]
+
+    buyer_seafront = buyer.get("seafront", False)
+    seller_seafront = seller.get("seafront", False)
+    if not seafront_match(buyer_seafront, seller_seafront):
+        return None
+    if buyer_seafront and seller_seafront:
+        score += OPPORTUNITY_SIGNALS["seafront"]
+
+    buyer_sun_type = buyer.get("sun_type")
+    seller_sun_type = seller.get("sun_type")
+    if buyer_sun_type:
+        if sun_type_match(buyer_sun_type, seller_sun_type):
+            score += OPPORTUNITY_SIGNALS["sun_type"]
+
+    if buyer_cond:
+        if not condominium_match(buyer_cond, seller_cond):
+            return None
+        score += OPPORTUNITY_SIGNALS["condominium"]
+    elif seller_cond:
+        score += OPPORTUNITY_SIGNALS["condominium"] // 2
+
+    return score
+
+
+def _price_window(buyer_price):
+    """Mesmos limites do price_match."""
+    return buyer_price * 0.80, buyer_price + 50_000
+
+
+class SellerIndex:
+    """
+    Índice invertido de vendedores por bairro e sub-bairro, com os preços de
+    cada bairro ordenados. Um comprador só é pontuado contra os vendedores dos
+    seus bairros cujo preço cai na janela do price_match.
+
+    Vendedores sem bairro ou sem preço não entram: nunca passariam no
+    neighborhood_match / price_match.
+    """
+
+    def __init__(self, sellers=()):
+        self._seq = count()
+        self._ads = {}
+        self._seqs_by_id = {}
+        self._by_neighborhood = {}
+        self._by_sub = {}
+        self._columns = None
+        for seller in sellers:
+            self.add(seller)
+
+    def __len__(self):
+        return len(self._ads)
+
+    def _keys(self, seller):
+        keys = [(self._by_neighborhood, n) for n in set(seller["neighborhood"])]
+        sub = seller.get("sub_neighborhood")
+        if sub:
+            keys.append((self._by_sub, sub))
+        return keys
+
+    def add(self, seller):
+        neighborhoods = seller.get("neighborhood")
+        price = seller.get("price")
+        if not neighborhoods or not isinstance(neighborhoods, list) or price is None:
+            return
+
+        seq = next(self._seq)
+        self._ads[seq] = seller
+        self._columns = None
+        message_id = seller["original_content"]["message_id"]
+        self._seqs_by_id.setdefault(message_id, []).append(seq)
+
+        for table, key in self._keys(seller):
+            insort(table.setdefault(key, []), (price, seq))
+
+    def remove(self, message_id):
+        for seq in self._seqs_by_id.pop(message_id, []):
+            seller = self._ads.pop(seq)
+            self._columns = None
+            entry = (seller["price"], seq)
+            for table, key in self._keys(seller):
+                entries = table[key]
+                del entries[bisect_left(entries, entry)]
+                if not entries:
+                    del table[key]
+
+    def snapshot(self):
+        """Estado do índice para o checkpoint (checkpoint.py), sem o cache colunar."""
+        return (self._ads, self._seqs_by_id, self._by_neighborhood, self._by_sub)
+
+    def restore(self, snapshot):
+        self._ads, self._seqs_by_id, self._by_neighborhood, self._by_sub = snapshot
+        self._seq = count(max(self._ads, default=-1) + 1)
+        self._columns = None
+
+    def candidates(self, buyer):
+        """Vendedores que podem casar com o comprador, na ordem de inserção."""
+        return [self._ads[seq] for seq in self.candidate_seqs(buyer)]
+
+    def candidate_seqs(self, buyer):
+        buyer_neighborhoods = buyer.get("neighborhood")
+        buyer_price = buyer.get("price")
+        if not buyer_neighborhoods or not isinstance(buyer_neighborhoods, list):
+            return []
+        if buyer_price is None:
+            return []
+
+        buyer_sub = buyer.get("sub_neighborhood")
+        if buyer_sub:
+            buckets = [self._by_sub.get(buyer_sub)]
+        else:
+            buckets = [self._by_neighborhood.get(n) for n in set(buyer_neighborhoods)]
+
+        lower, upper = _price_window(buyer_price)
+        seqs = set()
+        for entries in buckets:
+            if not entries:
                 continue
+            start = bisect_left(entries, (lower,))
+            end = bisect_right(entries, (upper, float("inf")))
+            seqs.update(seq for _, seq in entries[start:end])
 
-            seen_pairs.add(pair_key)
-
-            score = 0
-
-            if not neighborhood_match(buyer, seller):
-                continue
+        return sorted(seqs)
 
-            score += OPPORTUNITY_SIGNALS["neighborhood"]
+    def columns(self):
+        """
+        SellerColumns dos vendedores indexados (reconstruído após mudanças)
+        e o mapa seq -> linha.
+        """
+        if self._columns is None:
+            from columnar_matcher import SellerColumns
 
-            if not price_match(buyer.get("price"), seller.get("price")):
-                continue
+            seqs = sorted(self._ads)
+            rows = {seq: row for row, seq in enumerate(seqs)}
+            self._columns = (SellerColumns(self._ads[seq] for seq in seqs), rows)
+        return self._columns
 
-            score += OPPORTUNITY_SIGNALS["price"]
 
-            if not bedrooms_match(buyer.get("bedrooms"), seller.get("bedrooms")):
-                continue
+def _first_by_message_id(ads):
+    """
+    Mantém a primeira ocorrência de cada message_id. No laço completo, um par
+    repetido (buyer_id, seller_id) só era avaliado na primeira vez.
+    """
+    unique = {}
+    for ad in ads:
+        unique.setdefault(ad["original_content"]["message_id"], ad)
+    return list(unique.values())
 
-            score += OPPORTUNITY_SIGNALS["bedrooms"]
 
-            if buyer.get("property_type") == seller.get("property_type"):
-                score += OPPORTUNITY_SIGNALS["property_type"]
+def _match_buyers(index, buyers, engine=None):
+    if (engine or MATCH_ENGINE) == "numpy":
+        return _match_buyers_columnar(index, buyers)
 
-            buyer_area = buyer.get("area_m2")
-            if buyer_area is not None:
-                if not area_match(buyer_area, seller.get("area_m2")):
-                    continue
-                score += OPPORTUNITY_SIGNALS["area_m2"]
+    opportunities = []
+    for buyer in buyers:
+        for seller in index.candidates(buyer):
+            score = score_pair(buyer, seller)
+            if score is not None:
+                opportunities.append({"buyer": buyer, "seller": seller, "score": score})
+    return opportunities
 
-            buyer_parking = buyer.get("parking_spots")
-            if buyer_parking is not None:
-                if not parking_spots_match(buyer_parking, seller.get("parking_spots")):
-                    continue
-                score += OPPORTUNITY_SIGNALS["parking_spots"]
 
-            buyer_cond = buyer.get("condominium")
-            seller_cond = seller.get("condominium")
+def _match_buyers_columnar(index, buyers):
+    columns, rows_by_seq = index.columns()
+    opportunities = []
+    for buyer in buyers:
+        block = [rows_by_seq[seq] for seq in index.candidate_seqs(buyer)]
+        if not block:
+            continue
+        rows, scores = columns.score(buyer, block)
+        for row, score in zip(rows.tolist(), scores.tolist()):
+            opportunities.append(
+                {"buyer": buyer, "seller": columns.sellers[row], "score": score}
+            )
+    return opportunities
+
+
+def get_opportunity(sellers_padronized, buyers_padronized, engine=None):
+    index = SellerIndex(_first_by_message_id(sellers_padronized))
+    opportunities = _match_buyers(
+        index, _first_by_message_id(buyers_padronized), engine
+    )
+    return sorted(opportunities, key=lambda x: x["score"], reverse=True)
 
-            buyer_nearbeach = buyer.get("nearbeach", False)
-            seller_nearbeach = seller.get("nearbeach", False)
-            if not nearbeach_match(buyer_nearbeach, seller_nearbeach):
-                score = 0
-                continue
-            if buyer_nearbeach and seller_nearbeach:
-                score += OPPORTUNITY_SIGNALS["nearbeach"]
 
-            buyer_seafront = buyer.get("seafront", False)
-            seller_seafront = seller.get("seafront", False)
-            if not seafront_match(buyer_seafront, seller_seafront):
-                continue
-            if buyer_seafront and seller_seafront:
-                score += OPPORTUNITY_SIGNALS["seafront"]
-
-            buyer_sun_type = buyer.get("sun_type")
-            seller_sun_type = seller.get("sun_type")
-            if buyer_sun_type:
-                if sun_type_match(buyer_sun_type, seller_sun_type):
-                    score += OPPORTUNITY_SIGNALS["sun_type"]
-
-            if buyer_cond:
-                if not condominium_match(buyer_cond, seller_cond):
-                    continue
-                score += OPPORTUNITY_SIGNALS["condominium"]
-            elif seller_cond:
-                score += OPPORTUNITY_SIGNALS["condominium"] // 2
-
-            opportunities.append({"buyer": buyer, "seller": seller, "score": score})
+def get_new_opportunities(inventory, new_sellers, new_buyers, engine=None):
+    """
+    Casa apenas os anúncios novos contra o inventário: compradores novos contra
+    todos os vendedores vivos e vendedores novos contra os compradores que já
+    estavam no inventário. Pares antigos x antigos já foram avaliados em ciclos
+    anteriores. Ao final, os anúncios novos passam a fazer parte do inventário.
+
+    Anúncios novos que já chegam fora da janela de retenção (rescan completo,
+    histórico antigo de um grupo) são ignorados: não entram no inventário nem
+    geram oportunidades.
+    """
+    now = int(time.time())
+    new_sellers = [ad for ad in new_sellers if inventory.is_live(ad, now)]
+    new_buyers = [ad for ad in new_buyers if inventory.is_live(ad, now)]
+
+    new_buyer_ids = {ad["original_content"]["message_id"] for ad in new_buyers}
+    known_buyers = [
+        ad
+        for ad in inventory.buyers
+        if ad["original_content"]["message_id"] not in new_buyer_ids
+    ]
+
+    new_sellers = _first_by_message_id(new_sellers)
+    new_buyers = _first_by_message_id(new_buyers)
+
+    inventory.add_many(new_sellers)
+    opportunities = _match_buyers(inventory.seller_index, new_buyers, engine)
+    opportunities += _match_buyers(SellerIndex(new_sellers), known_buyers, engine)
+    inventory.add_many(new_buyers)
 
     return sorted(opportunities, key=lambda x: x["score"], reverse=True)
 
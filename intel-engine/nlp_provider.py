@@ -0,0 +1,66 @@
+import time
+
+MODEL_NAME = "pt_core_news_lg"
+
+# O normalizer só lê token.lemma_ e token.like_num: parser e NER são dispensáveis.
+NORMALIZER_DISABLED = ("parser", "ner")
+
+_nlp = None
+_load_seconds = None
+
+
+def get_nlp():
+    """
+    Pipeline spaCy compartilhado entre classifier e normalizer.
+    O modelo só é carregado no primeiro uso; quem só precisa de
+    classify_message (ex.: cleaner.py) nunca paga esse custo.
+    """
+    global _nlp, _load_seconds
+    if _nlp is None:
+        import spacy
+
+        start = time.perf_counter()
+        _nlp = spacy.load(MODEL_NAME)
+        _load_seconds = time.perf_counter() - start
+        print(
+            f"[NLP] {MODEL_NAME} carregado em {_load_seconds:.2f}s "
+            f"({', '.join(_nlp.pipe_names)})"
+        )
+    return _nlp
+
+
+def is_loaded() -> bool:
+    return _nlp is not None
+
+
+def enabled_components() -> list:
+    return list(_nlp.pipe_names) if _nlp is not None else []
+
+
+def load_seconds():
+    return _load_seconds
+
+
+def info() -> dict:
+    return {
+        "model": MODEL_NAME,
+        "loaded": is_loaded(),
+        "load_seconds": _load_seconds,
+        "components": enabled_components(),
+    }
+
+
+def _present(names) -> list:
+    pipe_names = get_nlp().pipe_names
+    return [name for name in names if name in pipe_names]
+
+
+def parse(text: str, disable=()):
+    return get_nlp()(text, disable=_present(disable))
+
+
+def pipe(texts, disable=(), batch_size: int = 64, n_process: int = 1):
+    """nlp.pipe com componentes desligados; preserva a ordem dos textos."""
+    return get_nlp().pipe(
+        texts, disable=_present(disable), batch_size=batch_size, n_process=n_process
+    )
@@ -0,0 +1,332 @@
+"""
+Anúncios normalizados persistidos por message_id (normalized_ads.bin).
+
+Ao reiniciar, o engine reconstrói o AdInventory a partir deste arquivo em vez
+de rodar spaCy e todos os extratores de novo sobre o histórico; só anúncios
+gravados com outra versão das regras do normalizer são renormalizados.
+
+Uso:
+    python normalized_store.py            # status
+    python normalized_store.py compact
+"""
+
+import argparse
+import marshal
+import mmap
+import os
+import struct
+import time
+from compaction import drop_ranges
+from dedup_store import digest
+from inventory import BUYER_TTL, SELLER_TTL, ad_timestamp
+from normalizer import NORMALIZER_RULES_VERSION, normalize_parallel
+
+NORMALIZED_ADS_FILE = "../data/normalized_ads.bin"
+
+# Cabeçalho do arquivo: magic, versão do formato e versão do marshal (o
+# formato do marshal pode mudar entre versões do Python).
+FILE_HEADER = struct.Struct("<4sHH")
+FILE_MAGIC = b"NADS"
+FORMAT_VERSION = 1
+
+# Cabeçalho de cada registro: digest do message_id, timestamp, intent, versão
+# das regras do normalizer e tamanho do payload (o dict em marshal).
+RECORD = struct.Struct("<16sqB12sI")
+INTENT_CODES = {"sell": 0, "buy": 1}
+TOMBSTONE = 255
+
+# Compacta quando mais da metade do arquivo é registro morto.
+COMPACT_RATIO = 0.5
+
+
+class NormalizedAdStore:
+    """
+    Log append-only com a saída do NormalizedAd.normalize() por message_id.
+
+    Carregar só percorre os cabeçalhos de tamanho fixo (mmap + unpack_from) e
+    monta um índice digest -> posição; o payload só é decodificado quando o
+    anúncio é pedido (get) ou restaurado (live), e registros fora da janela
+    de retenção nunca são lidos. O último registro de um message_id vence;
+    remover é anexar um registro vazio (tombstone), então outro processo
+    (purge_user.py) pode remover anúncios com o engine rodando.
+    """
+
+    def __init__(self, path: str = NORMALIZED_ADS_FILE):
+        self.path = path
+        self.version = NORMALIZER_RULES_VERSION.encode()
+        self._index = {}
+        self._pending = []
+        self._size = 0
+        self._fd = None
+        self.load()
+
+    def load(self):
+        self._close_fd()
+        self._index = {}
+        self._pending = []
+        self._size = 0
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                header = (
+                    FILE_HEADER.unpack_from(data) if size >= FILE_HEADER.size else None
+                )
+                if header != (FILE_MAGIC, FORMAT_VERSION, marshal.version):
+                    print(
+                        f"[NORMALIZED] {self.path} em outro formato ({header}); "
+                        "descartando, os anúncios serão renormalizados."
+                    )
+                    os.remove(self.path)
+                    return
+                position = self._scan(data, FILE_HEADER.size, size)
+
+        if position < size:
+            # Registro incompleto de uma escrita interrompida.
+            os.truncate(self.path, position)
+        self._size = position
+        self._fd = os.open(self.path, os.O_RDONLY)
+
+    def _scan(self, data, position: int, end: int) -> int:
+        index = self._index
+        unpack = RECORD.unpack_from
+        while position + RECORD.size <= end:
+            key, timestamp, intent, version, length = unpack(data, position)
+            record_end = position + RECORD.size + length
+            if record_end > end:
+                break
+            if intent == TOMBSTONE:
+                index.pop(key, None)
+            else:
+                index[key] = (position, timestamp, intent, version, length)
+            position = record_end
+        return position
+
+    def _close_fd(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def close(self):
+        self.flush()
+        self._close_fd()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, message_id):
+        return bool(message_id) and digest(message_id) in self._index
+
+    def _decode(self, entry, data=None):
+        offset, _, _, _, length = entry
+        start = offset + RECORD.size
+        if data is not None:
+            return marshal.loads(data[start : start + length])
+        return marshal.loads(os.pread(self._fd, length, start))
+
+    def get(self, message_id):
+        """Anúncio gravado com a versão atual das regras, ou None."""
+        if not message_id or self._fd is None:
+            return None
+        entry = self._index.get(digest(message_id))
+        if entry is None or entry[3] != self.version:
+            return None
+        return self._decode(entry)
+
+    def live(
+        self, now: int = None, seller_ttl: int = SELLER_TTL, buyer_ttl: int = BUYER_TTL
+    ):
+        """
+        Anúncios dentro da janela de retenção: (atuais, desatualizados), estes
+        gravados com outra versão das regras. O filtro usa só os cabeçalhos.
+        """
+        now = int(time.time()) if now is None else now
+        cutoffs = (now - seller_ttl, now - buyer_ttl)
+        current, stale = [], []
+        if not self._index:
+            return current, stale
+
+        with open(self.path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for entry in self._index.values():
+                    if entry[1] < cutoffs[entry[2]]:
+                        continue
+                    ad = self._decode(entry, data)
+                    (current if entry[3] == self.version else stale).append(ad)
+        return current, stale
+
+    def add(self, ad) -> bool:
+        """Agenda a gravação do anúncio; False se o mesmo registro já existe."""
+        message_id = ad["original_content"].get("message_id")
+        intent = INTENT_CODES.get(ad["intent"])
+        if not message_id or intent is None:
+            return False
+        key = digest(message_id)
+        timestamp = int(ad_timestamp(ad) or 0)
+        entry = self._index.get(key)
+        if entry is not None and entry[1:4] == (timestamp, intent, self.version):
+            return False
+        try:
+            payload = marshal.dumps(ad)
+        except ValueError:
+            return False
+        header = RECORD.pack(key, timestamp, intent, self.version, len(payload))
+        self._pending.append((key, timestamp, intent, header + payload))
+        return True
+
+    def add_many(self, ads):
+        return sum(1 for ad in ads if self.add(ad))
+
+    def discard(self, message_ids):
+        """Grava tombstones para os message_ids presentes. Retorna quantos."""
+        keys = {digest(mid) for mid in message_ids if mid}
+        keys = [key for key in keys if key in self._index]
+        for key in keys:
+            record = RECORD.pack(key, 0, TOMBSTONE, b"\0" * 12, 0)
+            self._pending.append((key, 0, TOMBSTONE, record))
+        self.flush()
+        return len(keys)
+
+    def flush(self):
+        if not self._pending:
+            return
+        data = b"".join(record for *_, record in self._pending)
+        with open(self.path, "ab") as f:
+            if f.tell() == 0:
+                f.write(FILE_HEADER.pack(FILE_MAGIC, FORMAT_VERSION, marshal.version))
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            end = f.tell()
+            replaced = self._fd is not None and (
+                os.fstat(f.fileno()).st_ino != os.fstat(self._fd).st_ino
+            )
+
+        if replaced:
+            # Outro processo compactou o arquivo: as posições do índice mudaram.
+            self._pending = []
+            self.load()
+            return
+        # Appends concorrentes (purge_user.py) podem ter entrado antes deste.
+        position = end - len(data)
+        for key, timestamp, intent, record in self._pending:
+            if intent == TOMBSTONE:
+                self._index.pop(key, None)
+            else:
+                length = len(record) - RECORD.size
+                self._index[key] = (position, timestamp, intent, self.version, length)
+            position += len(record)
+        self._pending = []
+        self._size = end
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDONLY)
+
+    def _dead_ranges(self, now: int, seller_ttl: int, buyer_ttl: int):
+        """Trechos de registros substituídos, removidos ou expirados."""
+        cutoffs = (now - seller_ttl, now - buyer_ttl)
+        keep = {
+            entry[0] for entry in self._index.values() if entry[1] >= cutoffs[entry[2]]
+        }
+        ranges = []
+        with open(self.path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                position = FILE_HEADER.size
+                while position + RECORD.size <= self._size:
+                    length = RECORD.unpack_from(data, position)[4]
+                    record_end = position + RECORD.size + length
+                    if position not in keep:
+                        if ranges and sum(ranges[-1]) == position:
+                            ranges[-1] = (ranges[-1][0], record_end - ranges[-1][0])
+                        else:
+                            ranges.append((position, record_end - position))
+                    position = record_end
+        return ranges
+
+    def compact(
+        self,
+        now: int = None,
+        seller_ttl: int = SELLER_TTL,
+        buyer_ttl: int = BUYER_TTL,
+        ratio: float = 0.0,
+    ):
+        """
+        Tira do arquivo os registros mortos com drop_ranges (troca atômica,
+        appends feitos durante a cópia são preservados) se eles passarem de
+        ratio do tamanho. Retorna os bytes removidos.
+        """
+        self.flush()
+        if self._size == 0:
+            return 0
+        now = int(time.time()) if now is None else now
+        ranges = self._dead_ranges(now, seller_ttl, buyer_ttl)
+        dead = sum(length for _, length in ranges)
+        if not dead or dead <= self._size * ratio:
+            return 0
+        removed = drop_ranges(self.path, ranges)
+        self.load()
+        return removed
+
+    def maybe_compact(
+        self, now: int = None, seller_ttl: int = SELLER_TTL, buyer_ttl: int = BUYER_TTL
+    ):
+        return self.compact(now, seller_ttl, buyer_ttl, COMPACT_RATIO)
+
+
+def restore_inventory(inventory, store, now: int = None, workers: int = None):
+    """
+    Reconstrói o inventário a partir do normalized_ads.bin. Só os anúncios
+    gravados com outra versão das regras passam de novo pelo normalizer (o
+    próprio dict guarda raw_text, intent e original_content). Retorna
+    quantos anúncios foram restaurados.
+    """
+    start = time.perf_counter()
+    now = int(time.time()) if now is None else now
+    current, stale = store.live(now, inventory.seller_ttl, inventory.buyer_ttl)
+    if stale:
+        renormalized = normalize_parallel(
+            [(ad["raw_text"], ad["intent"], ad["original_content"]) for ad in stale],
+            workers,
+        )
+        store.add_many(renormalized)
+        store.flush()
+        current += renormalized
+
+    restored = inventory.add_many(current)
+    removed = store.maybe_compact(now, inventory.seller_ttl, inventory.buyer_ttl)
+    print(
+        f"[NORMALIZED] inventário restaurado: {restored} anúncios "
+        f"({len(stale)} renormalizados) em {time.perf_counter() - start:.2f}s"
+        + (f", {removed / (1024 * 1024):.1f} MB compactados." if removed else ".")
+    )
+    return restored
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Anúncios normalizados persistidos")
+    parser.add_argument(
+        "command",
+        choices=["status", "compact"],
+        nargs="?",
+        default="status",
+        help="compact: remove registros substituídos, removidos e expirados",
+    )
+    args = parser.parse_args()
+
+    store = NormalizedAdStore()
+    if args.command == "compact":
+        removed = store.compact()
+        print(f"[NORMALIZED] {removed / (1024 * 1024):.1f} MB removidos.")
+    current, stale = store.live()
+    print(
+        f"[NORMALIZED] {NORMALIZED_ADS_FILE}: {len(store)} anúncios, "
+        f"{len(current)} vivos na versão {NORMALIZER_RULES_VERSION}, "
+        f"{len(stale)} em versões antigas, "
+        f"{store._size / (1024 * 1024):.1f} MB."
+    )
+    store.close()
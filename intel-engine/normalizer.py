@@ -1,10 +1,36 @@
+import hashlib
+import os
 import re
-import spacy
-
-nlp = spacy.load("pt_core_news_lg")
-
-sellers_padronized = []
-buyers_padronized = []
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import cached_property
+from nlp_provider import MODEL_NAME, NORMALIZER_DISABLED, get_nlp, parse, pipe
+from gazetteer import (
+    NEIGHBORHOODS,
+    NEIGHBORHOOD_ALIASES,
+    NEIGHBORHOOD_PARENT,
+    SUB_NEIGHBORHOODS,
+    ZONES,
+    CONDOMINIUM,
+    fold_accents,
+    find_condominiums,
+    find_places,
+    find_zone,
+    mask_condominiums,
+)
+from text_view import MENTION_PATTERNS, TextView
+
+NLP_BATCH_SIZE = 64
+NLP_N_PROCESS = 1
+
+# Processos do pool de normalização (1 = sempre em série). Cada worker carrega
+# o próprio modelo spaCy, então o custo de memória cresce com esse número.
+# INTEL_NORMALIZER_WORKERS muda o padrão; o engine também aceita
+# --normalizer-workers.
+NORMALIZER_WORKERS = int(os.environ.get("INTEL_NORMALIZER_WORKERS", "1"))
+# Abaixo disso o overhead do pool (pickle + IPC) supera o ganho.
+PARALLEL_MIN_ITEMS = 200
+PARALLEL_CHUNK_SIZE = 100
 
 PROPERTY_TYPE_MAP = {
     "APARTAMENTO": ["apartamento", "apto", "ap", "apt", "Apartamento"],
@@ -13,223 +39,76 @@ PROPERTY_TYPE_MAP = {
     "COBERTURA": ["cobertura", "Cobertura", "cob", "Cob", "COB"],
 }
 
-NEIGHBORHOODS = [
-    "recreio",
-    "barra da tijuca",
-    "barra olímpica",
-    "barra",
-    "jacarepaguá",
-    "vargem grande",
-    "vargem pequena",
-    "freguesia",
-    "ipanema",
-    "copacabana",
-    "centro da cidade",
-    "curicica",
-    "taquara",
-    "anil",
-    "pechincha",
-    "itanhangá",
-    "humaitá",
-    "flamengo",
-    "botafogo",
-    "são conrado",
-    "leblon",
-    "gávea",
-    "jardim botânico",
-    "leme",
-    "urca",
-    "catete",
-    "glória",
-    "laranjeiras",
+FORBIDDEN_PRICE_CONTEXT = [
+    "condominio",
+    "condomínio",
+    "cond",
+    "iptu",
+    "taxa",
+    "foro",
+    "laudemio",
+    "laudêmio",
 ]
 
-NEIGHBORHOOD_ALIASES = {
-    "barra da tijuca": "BARRA",
-    "barra": "BARRA",
-    "barra olímpica": "BARRA OLIMPICA",
-    "jacarepaguá": "JACAREPAGUÁ",
-    "itanhangá": "ITANHANGÁ",
-    "humaitá": "HUMAITÁ",
-    "são conrado": "SÃO CONRADO",
-    "gávea": "GÁVEA",
-    "jardim botânico": "JARDIM BOTÂNICO",
-    "glória": "GLÓRIA",
+PRICE_MULTIPLIERS = {
+    "milhões": 1_000_000,
+    "milhoes": 1_000_000,
+    "milhão": 1_000_000,
+    "milhao": 1_000_000,
+    "mi": 1_000_000,
+    "mil": 1_000,
+    "k": 1_000,
 }
 
-NEIGHBORHOOD_PARENT = {
-    "barra bonita": "RECREIO",
-    "pontal oceanico": "RECREIO",
-    "zico": "RECREIO",
-    "cidade jardim": "BARRA OLIMPICA",
+TEXT_NUMBERS = {
+    "um": 1,
+    "uma": 1,
+    "dois": 2,
+    "duas": 2,
+    "tres": 3,
+    "três": 3,
+    "quatro": 4,
+    "cinco": 5,
 }
 
-# Sub-bairros extraídos do NEIGHBORHOOD_PARENT — detectados separadamente
-SUB_NEIGHBORHOODS = list(NEIGHBORHOOD_PARENT.keys())
-
-ZONES = {
-    "ZONA SUDOESTE": {
-        "aliases": [
-            "zona sudoeste",
-            "z. sudoeste",
-            "zona oeste",
-            "z. oeste",
-        ],
-        "neighborhoods": [
-            "RECREIO",
-            "BARRA",
-            "BARRA OLIMPICA",
-            "JACAREPAGUÁ",
-            "FREGUESIA",
-            "CURICICA",
-            "TAQUARA",
-            "ANIL",
-            "PECHINCHA",
-            "ITANHANGÁ",
-            "VARGEM GRANDE",
-            "VARGEM PEQUENA",
-        ],
-    },
-    "ZONA SUL": {
-        "aliases": [
-            "zona sul",
-            "z. sul",
-            "zs",
-        ],
-        "neighborhoods": [
-            "IPANEMA",
-            "COPACABANA",
-            "HUMAITÁ",
-            "FLAMENGO",
-            "BOTAFOGO",
-            "SÃO CONRADO",
-            "LEBLON",
-            "LAGOA",
-            "GÁVEA",
-            "JARDIM BOTÂNICO",
-            "LEME",
-            "URCA",
-            "CATETE",
-            "GLÓRIA",
-            "LARANJEIRAS",
-        ],
-    },
-}
-
-
-CONDOMINIUM = [
-    "Acqua Marine",
-    "Alameda dos Jequitibás",
-    "Alfa Barra",
-    "Aloha",
-    "Alphaville",
-    "Alto Leblon",
-    "Americas Park",
-    "Art Life",
-    "Atlântico Golf",
-    "Atlântico Sul",
-    "Barra Bali",
-    "Barra Central Park",
-    "Barramares",
-    "Barra Summer Dreams",
-    "Barra Sunday",
-    "Península",
-    "Beauclair",
-    "Blue House",
-    "Blue Vision",
-    "Bora Bora Resort",
-    "Bosque da Freguesia",
-    "Bosque dos Esquilos",
-    "Bothanica Nature",
-    "Califórnia Coast",
-    "Casa Alta",
-    "Duet",
-    "Duo Residenziale",
-    "Estrelas",
-    "Floresta Park",
-    "Fontano",
-    "Four Seasons",
-    "Frames",
-    "Freedom",
-    "Gleba A",
-    "Gleba B",
-    "Gleba C",
-    "Grand Prix",
-    "Green Park",
-    "Green Place",
-    "Icono Parque",
-    "Itaúna Gold",
-    "Jardim Interlagos",
-    "Jardins",
-    "Joia da Barra",
-    "Le Monde",
-    "Le Parc",
-    "Liberty Green",
-    "Libertá",
-    "Life Resort",
-    "Liv Lifestyle",
-    "Luar do Pontal",
-    "Lume Barra Bonita",
-    "Lume Residencial",
-    "Maayan",
-    "Malibu",
-    "Mandala",
-    "Maui",
-    "Maramar",
-    "Marina Costabella",
-    "Mediterrâneo",
-    "MORADA DO SOL",
-    "MUDRA",
-    "Next",
-    "Niemeyer",
-    "Nova Barra",
-    "Nova Ipanema",
-    "Nova Sernambetiba",
-    "Novo Leblon",
-    "Ocean Breeze",
-    "Origami",
-    "Palais",
-    "Palm Springs",
-    "Park Premium",
-    "Pedra de Itaúna",
-    "Península",
-    "Planície",
-    "Playa",
-    "Portal do Parque",
-    "Príncipe de Mônaco",
-    "Recanto das Garças",
-    "Recanto do Pontal",
-    "Reserva Jardim",
-    "Reserva do Parque",
-    "Rio Mar",
-    "Riserva Golf",
-    "Riviera Del Sol",
-    "Royal Green",
-    "Santa Marina",
-    "Santa Mônica Special",
-    "Saint Vivant",
-    "Saint Tropez",
-    "Stories Residence",
-    "Sublime Max",
-    "Sunset",
-    "Terra Nossa",
-    "Terrazas",
-    "Varandas",
-    "Verano",
-    "Vitality Spa",
-    "Villa Blanca",
-    "Villas da Barra",
-    "Viverde",
-    "Wonderful",
-]
+BEDROOM_TERMS = {"quarto", "quartos", "qt", "qts"}
+SUITE_TERMS = {"suite", "suites", "suíte", "suítes"}
+
+# Incrementar ao mudar a lógica do NormalizedAd (extratores, campos do dict).
+NORMALIZER_RULES_REVISION = 1
+
+# Versão das regras gravada com cada anúncio no normalized_ads.bin
+# (normalized_store.py): muda sozinha quando uma tabela do normalizer, do
+# gazetteer ou do text_view é editada. Sets entram ordenados para o hash não
+# depender do PYTHONHASHSEED.
+NORMALIZER_RULES_VERSION = hashlib.md5(
+    repr(
+        (
+            NORMALIZER_RULES_REVISION,
+            MODEL_NAME,
+            PROPERTY_TYPE_MAP,
+            FORBIDDEN_PRICE_CONTEXT,
+            PRICE_MULTIPLIERS,
+            TEXT_NUMBERS,
+            sorted(BEDROOM_TERMS),
+            sorted(SUITE_TERMS),
+            NEIGHBORHOODS,
+            NEIGHBORHOOD_ALIASES,
+            NEIGHBORHOOD_PARENT,
+            ZONES,
+            CONDOMINIUM,
+            MENTION_PATTERNS,
+        )
+    ).encode()
+).hexdigest()[:12]
 
 
 class NormalizedAd:
-    def __init__(self, raw_text: str, intent: str, original_content):
+    def __init__(self, raw_text: str, intent: str, original_content, doc=None):
         self.raw_text = raw_text
         self.intent = intent
         self.text = self._normalize_text(raw_text)
-        self.doc = nlp(self.text)
+        self._doc = doc
         self.property_type = None
         self.neighborhood = []
         self.price = None
@@ -244,6 +123,22 @@ class NormalizedAd:
         self.zone = None
         self.sub_neighborhood = None
 
+    @property
+    def doc(self):
+        """
+        Doc do spaCy, só construído quando um extrator precisa de lemas
+        (tipo do imóvel e o fallback de quartos). run_normalizer já entrega
+        os docs prontos via nlp.pipe.
+        """
+        if self._doc is None:
+            self._doc = parse(self.text, disable=NORMALIZER_DISABLED)
+        return self._doc
+
+    @cached_property
+    def view(self) -> TextView:
+        """Texto bruto em minúsculas/sem acentos e suas menções numéricas."""
+        return TextView(self.raw_text)
+
     def _normalize_text(self, text: str) -> str:
         text = text.lower()
         text = re.sub(r"\s+", " ", text)
@@ -260,70 +155,50 @@ class NormalizedAd:
 
         return None
 
+    def _price_blocked_lines(self):
+        """Linhas com (ou logo abaixo de) condomínio, IPTU, taxas etc."""
+        lines = self.view.lines
+        flagged = [
+            any(word in line for word in FORBIDDEN_PRICE_CONTEXT) for line in lines
+        ]
+        return {
+            i for i in range(len(lines)) if flagged[i] or (i > 0 and flagged[i - 1])
+        }
+
     def extract_price(self):
         prices = []
-        text = self.raw_text.lower()
-
-        forbidden_context = [
-            "condominio",
-            "condomínio",
-            "cond",
-            "iptu",
-            "taxa",
-            "foro",
-            "laudemio",
-            "laudêmio",
-        ]
+        mentions = self.view.mentions["price"]
 
-        lines = text.splitlines()
+        blocked = self._price_blocked_lines() if mentions else set()
 
-        for i, line in enumerate(lines):
-            if any(word in line for word in forbidden_context):
+        for m in mentions:
+            if self.view.line_of(m.start) in blocked:
                 continue
 
-            if i > 0:
-                prev_line = lines[i - 1]
-                if any(word in prev_line for word in forbidden_context):
-                    continue
+            num_str, suffix = m.number, m.suffix
+            try:
+                if "," in num_str and "." in num_str:
+                    value = num_str.replace(".", "").replace(",", ".")
+                elif "," in num_str:
+                    value = num_str.replace(",", ".")
+                elif num_str.count(".") > 1:
+                    value = num_str.replace(".", "")
+                elif "." in num_str and suffix:
+                    value = num_str
+                elif "." in num_str and not suffix:
+                    value = num_str.replace(".", "")
+                else:
+                    value = num_str
 
-            matches = re.findall(
-                r"r\$\s*([\d\.,]+)\s*(milh[oõ]es|milh[aã]o|mil|mi|k)?", line
-            )
-            for m in matches:
-                num_str, suffix = m
-                try:
-                    if "," in num_str and "." in num_str:
-                        value = num_str.replace(".", "").replace(",", ".")
-                    elif "," in num_str:
-                        value = num_str.replace(",", ".")
-                    elif num_str.count(".") > 1:
-                        value = num_str.replace(".", "")
-                    elif "." in num_str and suffix:
-                        value = num_str
-                    elif "." in num_str and not suffix:
-                        value = num_str.replace(".", "")
-                    else:
-                        value = num_str
-
-                    base = float(value)
-
-                    multipliers = {
-                        "milhões": 1_000_000,
-                        "milhoes": 1_000_000,
-                        "milhão": 1_000_000,
-                        "milhao": 1_000_000,
-                        "mi": 1_000_000,
-                        "mil": 1_000,
-                        "k": 1_000,
-                    }
-
-                    multiplier = multipliers.get(suffix, 1)
-                    prices.append(int(base * multiplier))
-                except ValueError:
-                    continue
+                base = float(value)
+
+                multiplier = PRICE_MULTIPLIERS.get(suffix, 1)
+                prices.append(int(base * multiplier))
+            except ValueError:
+                continue
 
         if not prices:
-            informal = self._parse_money(text)
+            informal = self._parse_money()
             if informal:
                 prices.extend(informal)
 
@@ -338,78 +213,34 @@ class NormalizedAd:
 
         return self.price
 
-    def _parse_money(self, text: str):
+    def _parse_money(self):
         results = []
 
-        patterns = [
-            (r"(\d+(?:[\.,]\d+)?)\s*milh[oõ]es", 1_000_000),
-            (r"(\d+(?:[\.,]\d+)?)\s*milh[aã]o", 1_000_000),
-            (r"(\d+(?:[\.,]\d+)?)\s*mi\b", 1_000_000),
-            (r"(\d+(?:[\.,]\d+)?)\s*mil\b", 1_000),
-            (r"(\d+(?:[\.,]\d+)?)\s*k\b", 1_000),
-        ]
-
-        for pattern, multiplier in patterns:
-            matches = re.findall(pattern, text)
-            for m in matches:
-                try:
-                    value = float(m.replace(",", "."))
-                    results.append(int(value * multiplier))
-                except ValueError:
-                    continue
+        for m in self.view.mentions["money"]:
+            try:
+                value = float(m.number.replace(",", "."))
+                results.append(int(value * m.multiplier))
+            except ValueError:
+                continue
 
         return results if results else None
 
-    def extract_bedrooms(self):
-        text = self.raw_text.lower()
-        bedrooms = []
-
-        direct_patterns = [
-            r"quartos?\s*:?\s*(\d+)",
-            r"(\d+)\s*quartos?",
-            r"qts?\s*:?\s*(\d+)",
-            r"(\d+)\s*qts?",
-        ]
+    def _mention_ints(self, kind: str):
+        values = []
+        for m in self.view.mentions[kind]:
+            try:
+                values.append(int(m.number))
+            except ValueError:
+                continue
+        return values
 
-        for pattern in direct_patterns:
-            matches = re.findall(pattern, text)
-            for m in matches:
-                try:
-                    bedrooms.append(int(m))
-                except ValueError:
-                    continue
+    def extract_bedrooms(self):
+        bedrooms = self._mention_ints("bedrooms")
 
         if not bedrooms:
-            suite_patterns = [
-                r"suites?\s*:?\s*(\d+)",
-                r"(\d+)\s*suites?",
-                r"suítes?\s*:?\s*(\d+)",
-                r"(\d+)\s*suítes?",
-            ]
-
-            for pattern in suite_patterns:
-                matches = re.findall(pattern, text)
-                for m in matches:
-                    try:
-                        bedrooms.append(int(m))
-                    except ValueError:
-                        continue
+            bedrooms = self._mention_ints("suites")
 
         if not bedrooms:
-            text_nums = {
-                "um": 1,
-                "uma": 1,
-                "dois": 2,
-                "duas": 2,
-                "tres": 3,
-                "três": 3,
-                "quatro": 4,
-                "cinco": 5,
-            }
-
-            bedroom_terms = {"quarto", "quartos", "qt", "qts"}
-            suite_terms = {"suite", "suites", "suíte", "suítes"}
-
             for i, token in enumerate(self.doc):
                 value = None
 
@@ -418,7 +249,7 @@ class NormalizedAd:
                     if clean:
                         value = int(clean)
                 else:
-                    value = text_nums.get(token.lemma_.lower())
+                    value = TEXT_NUMBERS.get(token.lemma_.lower())
 
                 if value is None or value > 20:
                     continue
@@ -428,7 +259,7 @@ class NormalizedAd:
                 for w in window:
                     lemma = w.lemma_.lower()
 
-                    if lemma in bedroom_terms or lemma in suite_terms:
+                    if lemma in BEDROOM_TERMS or lemma in SUITE_TERMS:
                         bedrooms.append(value)
                         break
 
@@ -440,93 +271,28 @@ class NormalizedAd:
         return self.bedrooms
 
     def _remove_accents(self, text: str) -> str:
-        replacements = {
-            "á": "a",
-            "à": "a",
-            "ã": "a",
-            "â": "a",
-            "é": "e",
-            "ê": "e",
-            "è": "e",
-            "í": "i",
-            "ì": "i",
-            "î": "i",
-            "ó": "o",
-            "õ": "o",
-            "ô": "o",
-            "ò": "o",
-            "ú": "u",
-            "ü": "u",
-            "ù": "u",
-            "ç": "c",
-        }
-        for old, new in replacements.items():
-            text = text.replace(old, new)
-        return text
+        return fold_accents(text)
 
     def extract_neighborhood(self):
-        masked_accented = self.text
-        masked_no_accent = self._remove_accents(self.text)
-
-        for cond in sorted(CONDOMINIUM, key=len, reverse=True):
-            cond_lower = cond.lower()
-            cond_no_accent = self._remove_accents(cond_lower)
-            masked_accented = masked_accented.replace(cond_lower, "")
-            masked_no_accent = masked_no_accent.replace(cond_no_accent, "")
-
-        text_accented = masked_accented
-        text_no_accent = masked_no_accent
+        text_accented, text_no_accent = mask_condominiums(self.text)
 
-        found = set()
-        matched_strings = []
-
-        # Busca em bairros + sub-bairros juntos (longest first para evitar falsos parciais)
-        all_places = sorted(NEIGHBORHOODS + SUB_NEIGHBORHOODS, key=len, reverse=True)
-
-        for bairro in all_places:
-            bairro_no_accent = self._remove_accents(bairro)
-
-            in_text = (bairro in text_accented) or (bairro_no_accent in text_no_accent)
-            if not in_text:
-                continue
-
-            already_covered = any(
-                bairro_no_accent in self._remove_accents(longer)
-                for longer in matched_strings
-            )
-            if already_covered:
-                continue
-
-            matched_strings.append(bairro)
-            canonical = NEIGHBORHOOD_ALIASES.get(bairro, bairro.upper())
-            found.add(canonical)
-
-            parent = NEIGHBORHOOD_PARENT.get(bairro)
-            if parent:
-                # E um sub-bairro: adiciona o parent e registra o sub-bairro detectado
-                found.add(parent)
-                self.sub_neighborhood = canonical
+        found, sub_neighborhood = find_places(text_accented, text_no_accent)
+        if sub_neighborhood:
+            self.sub_neighborhood = sub_neighborhood
 
         self.neighborhood = list(found)
         return self.neighborhood
 
     def extract_condominium(self):
-        text_lower = self.raw_text.lower()
+        found = find_condominiums(self.view.lower)
         if self.intent == "buy":
-            found = []
-            for cond in sorted(CONDOMINIUM, key=len, reverse=True):
-                if cond.lower() in text_lower:
-                    found.append(cond)
             self.condominium = found if found else None
-        else:
-            for cond in sorted(CONDOMINIUM, key=len, reverse=True):
-                if cond.lower() in text_lower:
-                    self.condominium = cond
-                    return self.condominium
+        elif found:
+            self.condominium = found[0]
         return self.condominium
 
     def extract_nearbeach(self):
-        text_lower = self._remove_accents(self.raw_text.lower())
+        text_lower = self.view.folded
         keywords = ["praia", "lucio costa"]
         self.nearbeach = any(kw in text_lower for kw in keywords)
 
@@ -539,7 +305,7 @@ class NormalizedAd:
         return self.nearbeach
 
     def extract_sun_type(self):
-        text_lower = self._remove_accents(self.raw_text.lower())
+        text_lower = self.view.folded
 
         morning_keywords = ["sol da manha", "sol manha"]
         afternoon_keywords = ["sol da tarde", "sol tarde"]
@@ -557,23 +323,7 @@ class NormalizedAd:
         return self.sun_type
 
     def extract_parking_spots(self):
-        text = self.raw_text.lower()
-        spots = []
-
-        patterns = [
-            r"(\d+)\s*vaga[s]?\b",
-            r"vaga[s]?\s*:?\s*(\d+)",
-            r"(\d+)\s*garagem\b",
-            r"garagem\s*:?\s*(\d+)",
-        ]
-
-        for pattern in patterns:
-            matches = re.findall(pattern, text)
-            for m in matches:
-                try:
-                    spots.append(int(m))
-                except ValueError:
-                    continue
+        spots = self._mention_ints("parking")
 
         if not spots:
             self.parking_spots = None
@@ -587,22 +337,7 @@ class NormalizedAd:
         return self.parking_spots
 
     def extract_area(self):
-        text = self.raw_text.lower()
-        areas = []
-
-        patterns = [
-            r"(\d{2,4})\s*m²",
-            r"(\d{2,4})\s*m2",
-            r"(\d{2,4})\s*metros\s*quadrados",
-        ]
-
-        for pattern in patterns:
-            matches = re.findall(pattern, text)
-            for m in matches:
-                try:
-                    areas.append(int(m))
-                except ValueError:
-                    continue
+        areas = self._mention_ints("area")
 
         if not areas:
             self.area_m2 = None
@@ -616,19 +351,17 @@ class NormalizedAd:
         return self.area_m2
 
     def extract_zone(self):
-        text_no_accent = self._remove_accents(self.raw_text.lower())
+        text_no_accent = self.view.folded
 
         if self.intent == "buy":
-            for zone_name, zone_data in ZONES.items():
-                for alias in sorted(zone_data["aliases"], key=len, reverse=True):
-                    pattern = r"\b" + re.escape(self._remove_accents(alias)) + r"\b"
-                    if re.search(pattern, text_no_accent):
-                        self.zone = zone_name
-                        existing = set(self.neighborhood)
-                        for n in zone_data["neighborhoods"]:
-                            existing.add(n)
-                        self.neighborhood = list(existing)
-                        return self.zone
+            zone_name = find_zone(text_no_accent)
+            if zone_name:
+                self.zone = zone_name
+                existing = set(self.neighborhood)
+                for n in ZONES[zone_name]["neighborhoods"]:
+                    existing.add(n)
+                self.neighborhood = list(existing)
+                return self.zone
         else:
             for neighborhood in self.neighborhood:
                 for zone_name, zone_data in ZONES.items():
@@ -677,13 +410,136 @@ class NormalizedAd:
         }
 
 
-def run_normalizer(sellers, buyers):
-    for seller in sellers:
-        normalized_ad = NormalizedAd(seller.raw_message, "sell", seller.data)
-        sellers_padronized.append(normalized_ad.normalize())
-
-    for buyer in buyers:
-        normalized_ad = NormalizedAd(buyer.raw_message, "buy", buyer.data)
-        buyers_padronized.append(normalized_ad.normalize())
-
-    return sellers_padronized, buyers_padronized
+def normalize_batch(items, batch_size: int = None, n_process: int = None):
+    """
+    Normaliza uma lista de (raw_text, intent, original_content), processando os
+    textos em lote com nlp.pipe e o pipeline reduzido.
+    """
+    ads = [
+        NormalizedAd(raw_text, intent, original) for raw_text, intent, original in items
+    ]
+    if not ads:
+        return []
+
+    docs = pipe(
+        (ad.text for ad in ads),
+        disable=NORMALIZER_DISABLED,
+        batch_size=batch_size or NLP_BATCH_SIZE,
+        n_process=n_process or NLP_N_PROCESS,
+    )
+    for ad, doc in zip(ads, docs):
+        ad._doc = doc
+
+    return [ad.normalize() for ad in ads]
+
+
+_pool = None
+_pool_workers = 0
+
+
+def _init_worker():
+    """Carrega o modelo uma vez por processo do pool."""
+    get_nlp()
+
+
+def _normalize_chunk(chunk):
+    return normalize_batch(chunk)
+
+
+def _get_pool(workers: int):
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        shutdown_pool()
+        _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        _pool_workers = workers
+    return _pool
+
+
+def shutdown_pool():
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+    _pool_workers = 0
+
+
+def normalize_parallel(items, workers: int = None, chunk_size: int = None):
+    """
+    normalize_batch distribuído em um ProcessPoolExecutor, preservando a ordem.
+
+    Lotes pequenos (< PARALLEL_MIN_ITEMS) ou workers <= 1 rodam em série. O
+    pool é mantido entre chamadas para não recarregar o modelo a cada ciclo;
+    se um worker morrer, o pool é descartado e os blocos que faltam são
+    normalizados em série neste processo.
+    """
+    items = list(items)
+    workers = NORMALIZER_WORKERS if workers is None else workers
+    if workers <= 1 or len(items) < PARALLEL_MIN_ITEMS:
+        return normalize_batch(items)
+
+    chunk_size = chunk_size or PARALLEL_CHUNK_SIZE
+    chunks = [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    try:
+        pool = _get_pool(workers)
+        futures = [pool.submit(_normalize_chunk, chunk) for chunk in chunks]
+    except BrokenProcessPool:
+        shutdown_pool()
+        futures = [None] * len(chunks)
+
+    results = []
+    broken = False
+    for chunk, future in zip(chunks, futures):
+        if future is not None and not broken:
+            try:
+                results.extend(future.result())
+                continue
+            except BrokenProcessPool:
+                broken = True
+                shutdown_pool()
+                print(
+                    "[NORMALIZER] worker do pool encerrou inesperadamente; "
+                    "normalizando o restante em série."
+                )
+        results.extend(normalize_batch(chunk))
+
+    return results
+
+
+def run_normalizer(
+    sellers,
+    buyers,
+    batch_size: int = None,
+    n_process: int = None,
+    workers: int = None,
+    store=None,
+):
+    """
+    Normaliza só as mensagens recebidas. O acúmulo entre ciclos fica a cargo
+    do AdInventory (inventory.py), que expira anúncios antigos.
+
+    Com store (NormalizedAdStore), mensagens já normalizadas com a versão
+    atual das regras (ex.: numa releitura completa do journal) são lidas de
+    lá em vez de passar de novo pelo spaCy.
+    """
+    items = [(seller.raw_message, "sell", seller.data) for seller in sellers]
+    items += [(buyer.raw_message, "buy", buyer.data) for buyer in buyers]
+
+    normalized = [None] * len(items)
+    if store is not None:
+        for i, (_, intent, data) in enumerate(items):
+            ad = store.get(data.get("message_id"))
+            if ad is not None and ad["intent"] == intent:
+                normalized[i] = ad
+    missing = [i for i, ad in enumerate(normalized) if ad is None]
+    pending = [items[i] for i in missing]
+
+    workers = NORMALIZER_WORKERS if workers is None else workers
+    if workers > 1:
+        results = normalize_parallel(pending, workers)
+    else:
+        results = normalize_batch(pending, batch_size, n_process)
+    for i, ad in zip(missing, results):
+        normalized[i] = ad
+
+    return normalized[: len(sellers)], normalized[len(sellers) :]
@@ -0,0 +1,150 @@
+import time
+from classifier import run_classifier
+from normalizer import run_normalizer
+from matcher import get_new_opportunities
+from egest import export_opportunities
+
+STAGES = ("classifier", "normalizer", "matcher", "egest")
+
+
+class StageStats:
+    """Contadores de um estágio do pipeline: lotes, itens e tempo."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.batches = 0
+        self.items_in = 0
+        self.items_out = 0
+        self.seconds = 0.0
+        # perf_counter de quando o estágio entregou o primeiro item.
+        self.first_output = None
+
+    def record(self, items_in: int, items_out: int, seconds: float):
+        if items_out and self.first_output is None:
+            self.first_output = time.perf_counter()
+        self.batches += 1
+        self.items_in += items_in
+        self.items_out += items_out
+        self.seconds += seconds
+
+    @property
+    def throughput(self) -> float:
+        return self.items_in / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.name}: {self.items_in}->{self.items_out} em {self.seconds:.2f}s "
+            f"({self.batches} lotes, {self.throughput:.0f}/s)"
+        )
+
+
+def _stage(name, fn, upstream, stats, count_in, count_out):
+    """
+    Aplica fn a cada lote vindo de upstream e registra itens e tempo do
+    estágio. Como cada estágio é um gerador, ele só puxa o próximo lote
+    quando o de baixo pede: não há fila entre os estágios e no máximo um lote
+    por estágio fica em memória (backpressure).
+    """
+    stage_stats = stats[name]
+    for batch in upstream:
+        items = count_in(batch)
+        start = time.perf_counter()
+        if items:
+            fn(batch)
+        stage_stats.record(items, count_out(batch), time.perf_counter() - start)
+        yield batch
+
+
+def _classify(cache):
+    def run(batch):
+        batch.sellers, batch.buyers, _ = run_classifier(batch.messages, cache)
+
+    return run
+
+
+def _normalize(store, workers):
+    def run(batch):
+        batch.normalized_sellers, batch.normalized_buyers = run_normalizer(
+            batch.sellers, batch.buyers, workers=workers, store=store
+        )
+
+    return run
+
+
+def _match(inventory):
+    def run(batch):
+        batch.opportunities = get_new_opportunities(
+            inventory, batch.normalized_sellers, batch.normalized_buyers
+        )
+
+    return run
+
+
+def _ads(batch):
+    return len(batch.normalized_sellers) + len(batch.normalized_buyers)
+
+
+def run_pipeline(
+    batches, inventory, cache, commit, stats=None, ad_store=None, workers=None
+):
+    """
+    classifier -> normalizer -> matcher -> egest, lote a lote.
+
+    Com ad_store (NormalizedAdStore), o normalizer reaproveita anúncios já
+    gravados lá; gravar os novos fica para o commit. workers é repassado ao
+    run_normalizer (None = NORMALIZER_WORKERS).
+
+    commit(batch) é chamado depois do matcher e antes da exportação de cada
+    lote (mesma ordem do ciclo antigo: estado salvo, depois oportunidades),
+    então as primeiras oportunidades de um backlog grande saem já no
+    primeiro lote. Retorna (mensagens processadas, oportunidades, stats).
+    """
+    stats = {} if stats is None else stats
+    for name in STAGES:
+        stats.setdefault(name, StageStats(name))
+    inventory.expire()
+
+    pipeline = _stage(
+        "classifier",
+        _classify(cache),
+        batches,
+        stats,
+        len,
+        lambda b: len(b.sellers) + len(b.buyers),
+    )
+    pipeline = _stage(
+        "normalizer",
+        _normalize(ad_store, workers),
+        pipeline,
+        stats,
+        lambda b: len(b.sellers) + len(b.buyers),
+        _ads,
+    )
+    pipeline = _stage(
+        "matcher",
+        _match(inventory),
+        pipeline,
+        stats,
+        _ads,
+        lambda b: len(b.opportunities),
+    )
+
+    processed = 0
+    exported = 0
+    for batch in pipeline:
+        commit(batch)
+        processed += len(batch)
+        if batch.opportunities:
+            start = time.perf_counter()
+            export_opportunities(batch.opportunities)
+            exported += len(batch.opportunities)
+            count = len(batch.opportunities)
+            stats["egest"].record(count, count, time.perf_counter() - start)
+        if batch.backlog_bytes:
+            print(
+                f"[PIPELINE] lote de {len(batch)} mensagens, "
+                f"{len(batch.opportunities)} oportunidades, "
+                f"{batch.backlog_bytes / 1024:.0f} KB ainda no journal"
+            )
+
+    return processed, exported, stats
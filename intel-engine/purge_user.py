@@ -1,72 +1,259 @@
+"""
+Remove tudo o que veio de um ou mais autores: mensagens do journal (ativo e
+segmentos selados), oportunidades e anúncios que as citam, estado de dedup do
+engine, estado do dispatch (wpp-egress) e o inventário do engine em execução.
+
+Uso:
+    python purge_user.py 228707713171512@lid
+    python purge_user.py 123@lid 456@lid --dry-run
+    python purge_user.py --file autores.txt
+"""
+
+import argparse
 import json
+import os
+import socket
+import time
+from author_index import AuthorIndex
+from compaction import drop_ranges
+from dedup_store import SeenStore
+from egest import OpportunityStore
+from engine import MESSAGES_FILE, load_state, save_state, remap_journal
+from ingest_server import INGEST_SOCKET
+from journal import Journal
+from normalized_store import NormalizedAdStore
+from sqlite_store import STORAGE_BACKEND, SqliteStore
 
-MESSAGES_FILE = "../data/messages.jsonl"
-OPPORTUNITIES_FILE = "../data/opportunities.jsonl"
-# Add id from user who you want to purge
+DISPATCH_STATE_FILE = "../data/state.json"
+# Autor purgado quando nenhum id é passado na linha de comando.
 BLOCKED_ID = "228707713171512@lid"
 
 
-def purge_messages():
-    try:
-        with open(MESSAGES_FILE, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-    except FileNotFoundError:
+def _author_records(index, author_ids):
+    index.sync()
+    records = index.records_for(author_ids)
+    if records and not index.verify(records):
+        print("[PURGE] índice de autores desatualizado, reconstruindo.")
+        index.rebuild()
+        records = index.records_for(author_ids)
+        if not index.verify(records):
+            raise RuntimeError("índice de autores não bate com o messages.jsonl")
+    return records
+
+
+def _purge_active(author_ids, dry_run: bool):
+    """Linhas dos autores no messages.jsonl: (message_id, ad_hash) removidos."""
+    if not os.path.exists(MESSAGES_FILE):
         print(f"[PURGE] {MESSAGES_FILE} não encontrado, pulando.")
-        return
+        return [], set()
+
+    index = AuthorIndex()
+    records = _author_records(index, author_ids)
+    removed = [(record[4], record[5]) for record in records]
+
+    if dry_run or not records:
+        index.close()
+        print(f"[PURGE] messages.jsonl: {len(records)} mensagens dos autores.")
+        return removed, set()
+
+    old_inode = os.stat(MESSAGES_FILE).st_ino
+    drops = [(offset, length) for offset, length, *_ in records]
+    removed_bytes = drop_ranges(MESSAGES_FILE, drops)
+    index.remove(records, removed_bytes)
+
+    def shift(position):
+        return position - sum(length for offset, length in drops if offset < position)
+
+    state = load_state()
+    if remap_journal(state, old_inode, shift):
+        save_state(state)
+
+    shared = index.shared_hashes({h for _, h in removed}, author_ids)
+    index.close()
+    print(
+        f"[PURGE] messages.jsonl: {len(records)} removidas "
+        f"({removed_bytes / (1024 * 1024):.1f} MB)."
+    )
+    return removed, shared
+
+
+def purge_messages(author_ids, dry_run: bool = False):
+    """
+    Tira as linhas dos autores do messages.jsonl (achadas pelo AuthorIndex),
+    dos segmentos selados do journal (pelo índice do journal.py) e, no
+    backend sqlite, do store.db, e propaga para o SeenStore, o offset do
+    journal do engine e os anúncios normalizados (normalized_store.py).
+    Retorna os message_ids removidos.
+    """
+    journal = Journal()
+    if dry_run:
+        sealed = journal.author_rows(author_ids)
+        print(f"[PURGE] journal: {len(sealed)} mensagens seladas dos autores.")
+    else:
+        sealed = journal.remove_authors(author_ids)
+        segments = len({row[0] for row in sealed})
+        print(f"[PURGE] journal: {len(sealed)} removidas de {segments} segmentos.")
+
+    removed, shared = _purge_active(author_ids, dry_run)
+    removed += [(message_id, ad_hash) for _, _, message_id, ad_hash in sealed]
+
+    store = None
+    if STORAGE_BACKEND == "sqlite":
+        store = SqliteStore()
+        if dry_run:
+            stored = store.author_messages(author_ids)
+            print(f"[PURGE] store.db: {len(stored)} mensagens dos autores.")
+        else:
+            stored = store.remove_authors(author_ids)
+            print(f"[PURGE] store.db: {len(stored)} mensagens removidas.")
+        removed += stored
+
+    message_ids = [message_id for message_id, _ in removed if message_id]
+    if dry_run or not removed:
+        journal.close()
+        if store is not None:
+            store.close()
+        return message_ids
+
+    # Um hash compartilhado com mensagem mantida continua marcado como visto.
+    hashes = {ad_hash for _, ad_hash in removed if ad_hash}
+    shared |= journal.shared_hashes(hashes, author_ids)
+    journal.close()
+    if store is not None:
+        shared |= store.shared_hashes(hashes)
+        store.close()
+
+    seen = SeenStore()
+    if seen.exists():
+        seen.ids.discard(message_ids)
+        seen.hashes.discard(hashes - shared)
 
-    kept, removed = [], 0
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        try:
-            msg = json.loads(line)
-            if msg.get("author_id") == BLOCKED_ID:
-                removed += 1
-            else:
-                kept.append(line)
-        except json.JSONDecodeError:
-            kept.append(line)
+    # Sem isso o engine traria os anúncios de volta ao reiniciar.
+    ad_store = NormalizedAdStore()
+    discarded = ad_store.discard(message_ids)
+    ad_store.close()
+    print(f"[PURGE] normalized_ads: {discarded} anúncios removidos.")
+    return message_ids
 
-    with open(MESSAGES_FILE, "w", encoding="utf-8") as f:
-        f.write("\n".join(kept) + ("\n" if kept else ""))
 
-    print(f"[PURGE] messages.jsonl: {removed} removidas, {len(kept)} mantidas.")
+def _purge_store_opportunities(author_ids, dry_run: bool):
+    """Backend sqlite: remove_ads numa transação e exporta os arquivos."""
+    store = SqliteStore()
+    store.import_opportunities()
+    ad_ids = store.author_ads(author_ids)
 
+    if dry_run:
+        store.close()
+        print(f"[PURGE] store.db: {len(ad_ids)} anúncios dos autores.")
+        return []
 
-def purge_opportunities():
+    removed = store.remove_ads(ad_ids)
+    if removed:
+        store.export_opportunities()
+    store.close()
+    print(f"[PURGE] store.db: {len(removed)} oportunidades removidas.")
+    return removed
+
+
+def purge_opportunities(author_ids, dry_run: bool = False):
+    """
+    Remove as oportunidades que citam anúncios dos autores, achados pelo
+    índice do opportunity_ads. Linhas ainda no formato antigo (anúncios
+    embutidos) não entram no índice de anúncios: rode antes
+    `python egest.py migrate`. Retorna os ids das oportunidades removidas.
+    """
+    if STORAGE_BACKEND == "sqlite":
+        return _purge_store_opportunities(author_ids, dry_run)
+
+    store = OpportunityStore()
+    ad_ids = set()
+    for author_id in author_ids:
+        ad_ids |= store.ads_by_author(author_id)
+
+    if dry_run:
+        store.close()
+        print(f"[PURGE] opportunities: {len(ad_ids)} anúncios dos autores.")
+        return []
+
+    removed = store.remove_ads(ad_ids)
+    store.close()
+    print(f"[PURGE] opportunities.jsonl: {len(removed)} removidas.")
+    return removed
+
+
+def sync_dispatch_state(removed_opp_ids):
+    if not removed_opp_ids:
+        return
     try:
-        with open(OPPORTUNITIES_FILE, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-    except FileNotFoundError:
-        print(f"[PURGE] {OPPORTUNITIES_FILE} não encontrado, pulando.")
+        with open(DISPATCH_STATE_FILE) as f:
+            state = json.load(f)
+    except Exception:
         return
 
-    kept, removed = [], 0
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        try:
-            opp = json.loads(line)
-            buyer_id = opp.get("buyer", {}).get("original_content", {}).get("author_id")
-            seller_id = (
-                opp.get("seller", {}).get("original_content", {}).get("author_id")
-            )
-            if BLOCKED_ID in (buyer_id, seller_id):
-                removed += 1
-            else:
-                kept.append(line)
-        except json.JSONDecodeError:
-            kept.append(line)
-
-    with open(OPPORTUNITIES_FILE, "w", encoding="utf-8") as f:
-        f.write("\n".join(kept) + ("\n" if kept else ""))
-
-    print(f"[PURGE] opportunities.jsonl: {removed} removidas, {len(kept)} mantidas.")
+    removed = set(removed_opp_ids)
+    sent = state.get("sent", {})
+    state["sent"] = {oid: v for oid, v in sent.items() if oid not in removed}
+
+    tmp_path = DISPATCH_STATE_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, DISPATCH_STATE_FILE)
+    print(f"[PURGE] state.json: {len(sent) - len(state['sent'])} entradas removidas.")
+
+
+def notify_engine(author_ids, path: str = INGEST_SOCKET) -> bool:
+    """Pede ao engine em execução (--ingest-socket) para limpar o inventário."""
+    command = {"control": "purge", "author_ids": list(author_ids)}
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendall((json.dumps(command) + "\n").encode("utf-8"))
+    except OSError as e:
+        print(
+            f"[PURGE] engine não está ouvindo em {path} ({e}); "
+            "um engine sem --ingest-socket mantém o inventário até reiniciar."
+        )
+        return False
+    finally:
+        sock.close()
+    print("[PURGE] engine notificado.")
+    return True
+
+
+def _read_ids(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                yield line
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Remove mensagens e oportunidades de um ou mais autores."
+    )
+    parser.add_argument("author_ids", nargs="*", help="ex.: 123@lid")
+    parser.add_argument("--file", help="arquivo com um author_id por linha")
+    parser.add_argument("--dry-run", action="store_true", help="só conta")
+    parser.add_argument("--socket", default=INGEST_SOCKET)
+    parser.add_argument("--no-notify", action="store_true")
+    args = parser.parse_args()
+
+    author_ids = list(args.author_ids)
+    if args.file:
+        author_ids += _read_ids(args.file)
+    author_ids = list(dict.fromkeys(author_ids)) or [BLOCKED_ID]
+
+    start = time.perf_counter()
+    print(f"[PURGE] autores: {', '.join(author_ids)}")
+    purge_messages(author_ids, args.dry_run)
+    removed = purge_opportunities(author_ids, args.dry_run)
+    if not args.dry_run:
+        sync_dispatch_state(removed)
+        if not args.no_notify:
+            notify_engine(author_ids, args.socket)
+    print(f"[PURGE] Concluído em {time.perf_counter() - start:.1f}s.")
 
 
 if __name__ == "__main__":
-    purge_messages()
-    purge_opportunities()
-    print("[PURGE] Concluído.")
+    main()
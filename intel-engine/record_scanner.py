@@ -0,0 +1,93 @@
+import json
+import re
+from compaction import iter_raw_lines
+
+try:
+    import orjson
+except ImportError:  # fallback: extrator de chaves por regex (só stdlib)
+    orjson = None
+
+
+def parse_record(line: bytes, use_orjson: bool = True):
+    """Objeto completo de uma linha do .jsonl, ou None se não for um objeto JSON."""
+    try:
+        if use_orjson and orjson is not None:
+            obj = orjson.loads(line)
+        else:
+            obj = json.loads(line)
+    except ValueError:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+class RecordScanner:
+    """
+    Lê só alguns campos de cada linha de um .jsonl, para o cleaner e o purge
+    decidirem o que manter sem montar (nem reserializar) o objeto inteiro.
+
+    fields são nomes do topo ("message_id") ou caminhos aninhados
+    ("buyer.original_content.author_id"). extract() devolve um dict com os
+    campos presentes e não nulos, ou None quando a linha não é um objeto JSON.
+
+    Com o orjson instalado, a linha é decodificada por ele. Sem ele, linhas
+    planas (sem objetos aninhados) em que todos os campos pedidos são strings
+    sem escape ou inteiros saem direto de uma regex sobre os bytes; qualquer
+    outra linha cai no json da stdlib. Nesse caminho rápido só o enquadramento
+    ({ ... }) é conferido, não o JSON inteiro.
+    """
+
+    def __init__(self, fields, use_orjson: bool = True):
+        self.fields = tuple(fields)
+        self._paths = [(name, name.split(".")) for name in self.fields]
+        self._flat = all(len(path) == 1 for _, path in self._paths)
+        self.use_orjson = use_orjson and orjson is not None
+
+        names = b"|".join(re.escape(name.encode()) for name in self.fields)
+        self._pattern = re.compile(
+            rb'"(' + names + rb')"\s*:\s*(?:"([^"\\]*)"|(-?\d+)(?=\s*[,}]))'
+        )
+
+    def _extract_flat(self, line: bytes):
+        line = line.strip()
+        if not (line.startswith(b"{") and line.endswith(b"}")):
+            return None
+        if line.find(b"{", 1) >= 0:
+            return None
+
+        record = {}
+        for name, string, number in self._pattern.findall(line):
+            name = name.decode()
+            if name in record:
+                return None
+            record[name] = int(number) if number else string.decode("utf-8")
+
+        # Campo ausente, nulo, com escape ou float: o parser decide.
+        if len(record) != len(self.fields):
+            return None
+        return record
+
+    def extract(self, line: bytes):
+        if self._flat and not self.use_orjson:
+            record = self._extract_flat(line)
+            if record is not None:
+                return record
+
+        obj = parse_record(line, self.use_orjson)
+        if obj is None:
+            return None
+
+        record = {}
+        for name, path in self._paths:
+            value = obj
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            if value is not None:
+                record[name] = value
+        return record
+
+    def scan(self, f, start: int = 0, end: int = None):
+        """(offset, linha, record) para cada linha completa e não vazia de f."""
+        for offset, line in iter_raw_lines(f, start, end):
+            if not line.strip():
+                continue
+            yield offset, line, self.extract(line)
@@ -0,0 +1,553 @@
+import argparse
+import json
+import os
+import sqlite3
+from compaction import iter_raw_lines, rewrite_file
+from egest import (
+    OPPORTUNITIES_FILE,
+    OPPORTUNITY_ADS_FILE,
+    _locked,
+    ad_author_id,
+    ad_message_id,
+    is_embedded,
+    slim_row,
+)
+from journal import iter_sealed_lines
+from record_scanner import parse_record
+
+STORE_FILE = "../data/store.db"
+DISPATCH_STATE_FILE = "../data/state.json"
+
+# "jsonl" (padrão): histórico nos segmentos do journal.py. "sqlite": histórico
+# no store.db. Nos dois casos o collector e o wpp-egress continuam nos .jsonl.
+STORAGE_BACKEND = os.environ.get("INTEL_STORAGE", "jsonl")
+
+_SQL_CHUNK = 500
+
+
+def _chunks(values, size: int = _SQL_CHUNK):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+def _placeholders(values) -> str:
+    return ",".join("?" * len(values))
+
+
+def _dumps(obj) -> bytes:
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class SqliteStore:
+    """
+    Backend opcional (INTEL_STORAGE=sqlite) em SQLite com WAL: mensagens
+    seladas, anúncios normalizados, oportunidades e o estado do dispatch em
+    tabelas indexadas, para retenção, dedup e purge virarem consultas dentro
+    de uma transação em vez de passadas sobre arquivos.
+
+    Os .jsonl continuam sendo a ponte com o Node e com o engine:
+    - messages.jsonl é a caixa de entrada do collector; o cleaner sela aqui
+      o que o engine já leu (no lugar dos segmentos do journal.py);
+    - opportunities.jsonl, opportunity_ads.jsonl e state.json são importados
+      de forma incremental (tabela sources: inode e fim já lido) e
+      exportados de volta com troca atômica, preservando o que o engine
+      anexar durante a exportação.
+
+    As linhas são guardadas com os bytes originais, então exportar devolve
+    exatamente o que entrou.
+    """
+
+    def __init__(self, path: str = STORE_FILE):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY,
+                message_id TEXT UNIQUE,
+                ad_hash TEXT,
+                author_id TEXT,
+                timestamp INTEGER NOT NULL,
+                intent TEXT,
+                line BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS messages_hash
+                ON messages (ad_hash, timestamp);
+            CREATE INDEX IF NOT EXISTS messages_author ON messages (author_id);
+            CREATE INDEX IF NOT EXISTS messages_timestamp ON messages (timestamp);
+            CREATE INDEX IF NOT EXISTS messages_intent
+                ON messages (intent, timestamp);
+            CREATE TABLE IF NOT EXISTS ads (
+                message_id TEXT PRIMARY KEY,
+                author_id TEXT,
+                line BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ads_author ON ads (author_id);
+            CREATE TABLE IF NOT EXISTS opportunities (
+                id TEXT PRIMARY KEY,
+                buyer_id TEXT,
+                seller_id TEXT,
+                timestamp INTEGER NOT NULL,
+                line BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS opportunities_buyer
+                ON opportunities (buyer_id);
+            CREATE INDEX IF NOT EXISTS opportunities_seller
+                ON opportunities (seller_id);
+            CREATE INDEX IF NOT EXISTS opportunities_timestamp
+                ON opportunities (timestamp);
+            CREATE TABLE IF NOT EXISTS dispatch (
+                opp_id TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sources (
+                path TEXT PRIMARY KEY,
+                inode INTEGER,
+                size INTEGER NOT NULL
+            );
+            """)
+        self._conn.commit()
+
+    # Mensagens
+
+    def _add_message(self, message_id, ad_hash, author_id, ts, intent, line):
+        """
+        Primeira etapa do dedup: por message_id vale a mensagem mais recente
+        (num empate, a que já estava). Retorna (gravada, (message_id, ad_hash)
+        que deixou de estar aqui ou None).
+        """
+        existing = None
+        if message_id:
+            existing = self._conn.execute(
+                "SELECT ad_hash, timestamp FROM messages WHERE message_id = ?",
+                (message_id,),
+            ).fetchone()
+        if existing is None:
+            self._conn.execute(
+                "INSERT INTO messages"
+                " (message_id, ad_hash, author_id, timestamp, intent, line)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (message_id, ad_hash, author_id, ts, intent, line),
+            )
+            return True, None
+        if ts <= existing[1]:
+            return False, (message_id, ad_hash)
+        # O id da linha não muda: a ordem de chegada continua a da primeira.
+        self._conn.execute(
+            "UPDATE messages SET ad_hash = ?, author_id = ?, timestamp = ?,"
+            " intent = ?, line = ? WHERE message_id = ?",
+            (ad_hash, author_id, ts, intent, line, message_id),
+        )
+        return True, (message_id, existing[0])
+
+    def seal(self, rows):
+        """
+        Grava numa única transação as linhas
+        (message_id, ad_hash, author_id, timestamp, intent, linha), com o
+        mesmo dedup do cleaner: primeiro por message_id, depois por ad_hash
+        entre as que sobraram, sempre mantendo a mais recente (num empate, a
+        que chegou antes). A segunda etapa só olha os ad_hashes gravados
+        agora: os outros grupos não mudaram. Uma queda no meio não grava
+        nada; repetir a mesma entrada não muda nada.
+        Retorna (gravadas, (message_id, ad_hash) que saíram ou não entraram).
+        """
+        sealed, displaced = 0, []
+        with self._conn:
+            self._conn.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS touched (ad_hash TEXT PRIMARY KEY)"
+            )
+            self._conn.execute("DELETE FROM touched")
+            for row in rows:
+                written, lost = self._add_message(*row)
+                if lost is not None:
+                    displaced.append(lost)
+                if written:
+                    sealed += 1
+                    if row[1]:
+                        self._conn.execute(
+                            "INSERT OR IGNORE INTO touched VALUES (?)", (row[1],)
+                        )
+            displaced += self._conn.execute(
+                "DELETE FROM messages"
+                " WHERE ad_hash IN (SELECT ad_hash FROM touched)"
+                " AND EXISTS (SELECT 1 FROM messages AS other"
+                " WHERE other.ad_hash = messages.ad_hash"
+                " AND (other.timestamp > messages.timestamp"
+                " OR (other.timestamp = messages.timestamp"
+                " AND other.id < messages.id)))"
+                " RETURNING message_id, ad_hash"
+            ).fetchall()
+            self._conn.execute("DELETE FROM touched")
+        return sealed, displaced
+
+    def expire(self, cutoff: int, buyer_cutoff: int):
+        """Retenção: (message_id, ad_hash) das mensagens apagadas."""
+        with self._conn:
+            return self._conn.execute(
+                "DELETE FROM messages WHERE timestamp < ?"
+                " OR (intent = 'buying' AND timestamp < ?)"
+                " RETURNING message_id, ad_hash",
+                (cutoff, buyer_cutoff),
+            ).fetchall()
+
+    def author_messages(self, author_ids):
+        rows = []
+        for chunk in _chunks(set(author_ids)):
+            rows += self._conn.execute(
+                "SELECT message_id, ad_hash FROM messages"
+                f" WHERE author_id IN ({_placeholders(chunk)})",
+                chunk,
+            ).fetchall()
+        return rows
+
+    def remove_authors(self, author_ids):
+        """Apaga as mensagens dos autores; retorna seus (message_id, ad_hash)."""
+        removed = []
+        with self._conn:
+            for chunk in _chunks(set(author_ids)):
+                removed += self._conn.execute(
+                    "DELETE FROM messages"
+                    f" WHERE author_id IN ({_placeholders(chunk)})"
+                    " RETURNING message_id, ad_hash",
+                    chunk,
+                ).fetchall()
+        return removed
+
+    def find(self, message_ids=(), ad_hashes=()) -> set:
+        """(message_id, ad_hash) das mensagens com algum desses ids ou hashes."""
+        rows = set()
+        for column, values in (("message_id", message_ids), ("ad_hash", ad_hashes)):
+            for chunk in _chunks({v for v in values if v}):
+                rows.update(
+                    self._conn.execute(
+                        f"SELECT message_id, ad_hash FROM messages"
+                        f" WHERE {column} IN ({_placeholders(chunk)})",
+                        chunk,
+                    )
+                )
+        return rows
+
+    def shared_hashes(self, ad_hashes) -> set:
+        """ad_hashes que ainda aparecem em alguma mensagem."""
+        return {ad_hash for _, ad_hash in self.find((), ad_hashes)} - {None}
+
+    def iter_keys(self):
+        yield from self._conn.execute("SELECT message_id, ad_hash FROM messages")
+
+    def iter_lines(self):
+        """Linhas (bytes, com "\\n") das mensagens, da mais antiga à mais nova."""
+        for (line,) in self._conn.execute(
+            "SELECT line FROM messages ORDER BY timestamp, id"
+        ):
+            yield line
+
+    # Ponte com os .jsonl
+
+    def _import_file(self, path: str, handle) -> int:
+        """
+        Passa para handle as linhas completas de path ainda não importadas e
+        registra até onde leu. Um arquivo trocado por fora é lido do começo
+        (as inserções são idempotentes). Roda dentro da transação de quem
+        chama. Retorna o fim lido.
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return 0
+        row = self._conn.execute(
+            "SELECT inode, size FROM sources WHERE path = ?", (path,)
+        ).fetchone()
+        start = 0
+        if row is not None and row[0] == stat.st_ino and row[1] <= stat.st_size:
+            start = row[1]
+
+        end = start
+        with open(path, "rb") as f:
+            for offset, line in iter_raw_lines(f, start):
+                end = offset + len(line)
+                handle(line)
+        self._set_source(path, stat.st_ino, end)
+        return end
+
+    def _set_source(self, path: str, inode, size: int):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sources (path, inode, size) VALUES (?, ?, ?)",
+            (path, inode, size),
+        )
+
+    def _add_ad(self, line: bytes):
+        ad = parse_record(line)
+        if ad is None or not ad_message_id(ad):
+            return
+        self._conn.execute(
+            "INSERT OR IGNORE INTO ads (message_id, author_id, line) VALUES (?, ?, ?)",
+            (ad_message_id(ad), ad_author_id(ad), line),
+        )
+
+    def _add_opportunity(self, line: bytes):
+        obj = parse_record(line)
+        if obj is None or not obj.get("id"):
+            return
+        if is_embedded(obj):
+            for ad in (obj.get("buyer"), obj.get("seller")):
+                if ad_message_id(ad):
+                    self._add_ad(_dumps(ad))
+            obj = slim_row(obj)
+            line = _dumps(obj)
+        # Mesmo id: vale a mais recente, como no cleaner.
+        self._conn.execute(
+            "INSERT INTO opportunities (id, buyer_id, seller_id, timestamp, line)"
+            " VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (id) DO UPDATE SET buyer_id = excluded.buyer_id,"
+            " seller_id = excluded.seller_id, timestamp = excluded.timestamp,"
+            " line = excluded.line WHERE excluded.timestamp > opportunities.timestamp",
+            (
+                obj["id"],
+                obj.get("buyer_id"),
+                obj.get("seller_id"),
+                obj.get("timestamp") or 0,
+                line,
+            ),
+        )
+
+    def import_opportunities(
+        self, path: str = OPPORTUNITIES_FILE, ads_path: str = OPPORTUNITY_ADS_FILE
+    ):
+        """
+        Traz o que o engine anexou aos dois arquivos. As oportunidades são
+        lidas antes dos anúncios: o egest grava os anúncios primeiro, então
+        toda oportunidade importada tem os seus. Linhas no formato antigo
+        (anúncios embutidos) entram já separadas.
+        """
+        with self._conn:
+            self._import_file(path, self._add_opportunity)
+            self._import_file(ads_path, self._add_ad)
+
+    def import_dispatch(self, path: str = DISPATCH_STATE_FILE):
+        """Espelha o "sent" do state.json (gravado inteiro pelo wpp-egress)."""
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except Exception:
+            return False
+        sent = {k: v for k, v in state.get("sent", {}).items() if k and v is not None}
+        with self._conn:
+            self._conn.execute("DELETE FROM dispatch")
+            self._conn.executemany(
+                "INSERT INTO dispatch (opp_id, value) VALUES (?, ?)",
+                [(oid, json.dumps(value)) for oid, value in sent.items()],
+            )
+        return True
+
+    def _drop_orphan_ads(self, message_ids) -> int:
+        """
+        Apaga, entre message_ids, os anúncios que nenhuma oportunidade cita.
+        Só candidatos vindos de oportunidades apagadas: um anúncio novo cuja
+        oportunidade ainda não foi importada não pode sair.
+        """
+        dropped = 0
+        for chunk in _chunks({m for m in message_ids if m}):
+            dropped += self._conn.execute(
+                f"DELETE FROM ads WHERE message_id IN ({_placeholders(chunk)})"
+                " AND NOT EXISTS (SELECT 1 FROM opportunities"
+                " WHERE buyer_id = ads.message_id)"
+                " AND NOT EXISTS (SELECT 1 FROM opportunities"
+                " WHERE seller_id = ads.message_id)",
+                chunk,
+            ).rowcount
+        return dropped
+
+    def _drop_dispatch(self, opp_ids):
+        self._conn.executemany(
+            "DELETE FROM dispatch WHERE opp_id = ?", [(oid,) for oid in opp_ids]
+        )
+
+    def expire_opportunities(self, cutoff: int):
+        """
+        Retenção das oportunidades, dos anúncios que só elas citavam e das
+        entradas do dispatch, numa transação. Importe o state.json antes das
+        oportunidades, para que toda entrada enviada tenha a sua. Retorna
+        (oportunidades, anúncios) removidos.
+        """
+        with self._conn:
+            removed = self._conn.execute(
+                "DELETE FROM opportunities WHERE timestamp < ?"
+                " RETURNING id, buyer_id, seller_id",
+                (cutoff,),
+            ).fetchall()
+            dropped = self._drop_orphan_ads(
+                {m for _, buyer, seller in removed for m in (buyer, seller)}
+            )
+            # Como no cleaner: o dispatch só guarda oportunidades mantidas.
+            self._conn.execute(
+                "DELETE FROM dispatch WHERE opp_id NOT IN (SELECT id FROM opportunities)"
+            )
+        return [oid for oid, _, _ in removed], dropped
+
+    def author_ads(self, author_ids) -> set:
+        ads = set()
+        for chunk in _chunks(set(author_ids)):
+            ads.update(
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT message_id FROM ads"
+                    f" WHERE author_id IN ({_placeholders(chunk)})",
+                    chunk,
+                )
+            )
+        return ads
+
+    def remove_ads(self, message_ids):
+        """
+        Mesmo efeito de OpportunityStore.remove_ads numa transação: saem os
+        anúncios, as oportunidades que citam algum deles, os anúncios
+        parceiros que ficaram sem referência e as entradas do dispatch.
+        Retorna os ids das oportunidades removidas.
+        """
+        message_ids = set(message_ids)
+        removed = []
+        with self._conn:
+            for chunk in _chunks(message_ids):
+                marks = _placeholders(chunk)
+                removed += self._conn.execute(
+                    "DELETE FROM opportunities"
+                    f" WHERE buyer_id IN ({marks}) OR seller_id IN ({marks})"
+                    " RETURNING id, buyer_id, seller_id",
+                    chunk + chunk,
+                ).fetchall()
+            for chunk in _chunks(message_ids):
+                self._conn.execute(
+                    f"DELETE FROM ads WHERE message_id IN ({_placeholders(chunk)})",
+                    chunk,
+                )
+            self._drop_orphan_ads(
+                {m for _, buyer, seller in removed for m in (buyer, seller)}
+                - message_ids
+            )
+            self._drop_dispatch(oid for oid, _, _ in removed)
+        return [oid for oid, _, _ in removed]
+
+    def export_opportunities(
+        self, path: str = OPPORTUNITIES_FILE, ads_path: str = OPPORTUNITY_ADS_FILE
+    ):
+        """
+        Regrava opportunity_ads.jsonl e depois opportunities.jsonl a partir do
+        banco (anúncios antes das linhas que apontam para eles). O que o
+        engine anexar enquanto isso fica no fim do arquivo novo e é importado
+        na próxima vez. Tudo sob o lock do OpportunityStore, para um append
+        do engine não cair no arquivo que está sendo trocado. Retorna quantas
+        oportunidades foram gravadas.
+        """
+        with _locked(ads_path):
+            with self._conn:
+                scanned = {
+                    path: self._import_file(path, self._add_opportunity),
+                    ads_path: self._import_file(ads_path, self._add_ad),
+                }
+
+            for target, table in ((ads_path, "ads"), (path, "opportunities")):
+                lines = (
+                    row[0]
+                    for row in self._conn.execute(
+                        f"SELECT line FROM {table} ORDER BY rowid"
+                    )
+                )
+                written, _ = rewrite_file(target, lines, scanned[target])
+                with self._conn:
+                    self._set_source(target, os.stat(target).st_ino, written)
+        return len(self)
+
+    def export_dispatch(self, path: str = DISPATCH_STATE_FILE):
+        """Regrava o "sent" do state.json, mantendo as outras chaves."""
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except Exception:
+            state = {}
+        state["sent"] = {
+            oid: json.loads(value)
+            for oid, value in self._conn.execute(
+                "SELECT opp_id, value FROM dispatch ORDER BY rowid"
+            )
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def export_messages(self, path: str) -> int:
+        """Todas as mensagens seladas em path (.jsonl), em ordem de timestamp."""
+        count = 0
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for line in self.iter_lines():
+                f.write(line)
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return count
+
+    def counts(self) -> dict:
+        return {
+            table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("messages", "ads", "opportunities", "dispatch")
+        }
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM opportunities").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+def iter_history_lines():
+    """
+    Linhas já seladas, para a releitura completa do engine: os segmentos do
+    journal.py e, no backend sqlite, o store.db. Os dois podem coexistir até
+    o cleaner terminar a migração; repetições são descartadas pelo SeenStore.
+    """
+    yield from iter_sealed_lines()
+    if STORAGE_BACKEND == "sqlite" and os.path.exists(STORE_FILE):
+        store = SqliteStore()
+        try:
+            yield from store.iter_lines()
+        finally:
+            store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backend SQLite (INTEL_STORAGE)")
+    parser.add_argument(
+        "command",
+        choices=["status", "import", "export"],
+        nargs="?",
+        default="status",
+        help="import: traz oportunidades, anúncios e state.json; export: "
+        "regrava esses arquivos a partir do banco",
+    )
+    parser.add_argument(
+        "--messages", help="com export: grava também as mensagens seladas neste .jsonl"
+    )
+    args = parser.parse_args()
+
+    store = SqliteStore()
+    if args.command == "import":
+        store.import_dispatch()
+        store.import_opportunities()
+    elif args.command == "export":
+        store.export_opportunities()
+        store.export_dispatch()
+        if args.messages:
+            count = store.export_messages(args.messages)
+            print(f"[STORE] {count} mensagens exportadas para {args.messages}.")
+    counts = store.counts()
+    print(
+        f"[STORE] {STORE_FILE} (backend {STORAGE_BACKEND}): "
+        f"{counts['messages']} mensagens, {counts['ads']} anúncios, "
+        f"{counts['opportunities']} oportunidades, "
+        f"{counts['dispatch']} entradas do dispatch."
+    )
+    store.close()
@@ -0,0 +1,132 @@
+import re
+from bisect import bisect_right
+from functools import cached_property
+from typing import NamedTuple
+from gazetteer import fold_accents
+from keyword_automaton import KeywordAutomaton
+
+# Mesmas quebras de linha que str.splitlines().
+LINE_BREAK = re.compile(r"\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+
+# \s sem quebra de linha: o padrão de preço era aplicado linha a linha.
+_INLINE_SPACE = r"[^\S\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]"
+
+_DIGIT = re.compile(r"\d")
+
+# (tipo, padrão, multiplicador, literais que precisam aparecer no texto)
+MENTION_PATTERNS = [
+    (
+        "price",
+        rf"r\${_INLINE_SPACE}*([\d\.,]+){_INLINE_SPACE}*"
+        r"(milh[oõ]es|milh[aã]o|mil|mi|k)?",
+        1,
+        ("r$",),
+    ),
+    ("money", r"(\d+(?:[\.,]\d+)?)\s*milh[oõ]es", 1_000_000, ("milh",)),
+    ("money", r"(\d+(?:[\.,]\d+)?)\s*milh[aã]o", 1_000_000, ("milh",)),
+    ("money", r"(\d+(?:[\.,]\d+)?)\s*mi\b", 1_000_000, ("mi",)),
+    ("money", r"(\d+(?:[\.,]\d+)?)\s*mil\b", 1_000, ("mil",)),
+    ("money", r"(\d+(?:[\.,]\d+)?)\s*k\b", 1_000, ("k",)),
+    ("bedrooms", r"quartos?\s*:?\s*(\d+)", 1, ("quarto",)),
+    ("bedrooms", r"(\d+)\s*quartos?", 1, ("quarto",)),
+    ("bedrooms", r"qts?\s*:?\s*(\d+)", 1, ("qt",)),
+    ("bedrooms", r"(\d+)\s*qts?", 1, ("qt",)),
+    ("suites", r"suites?\s*:?\s*(\d+)", 1, ("suite",)),
+    ("suites", r"(\d+)\s*suites?", 1, ("suite",)),
+    ("suites", r"suítes?\s*:?\s*(\d+)", 1, ("suíte",)),
+    ("suites", r"(\d+)\s*suítes?", 1, ("suíte",)),
+    ("parking", r"(\d+)\s*vaga[s]?\b", 1, ("vaga",)),
+    ("parking", r"vaga[s]?\s*:?\s*(\d+)", 1, ("vaga",)),
+    ("parking", r"(\d+)\s*garagem\b", 1, ("garagem",)),
+    ("parking", r"garagem\s*:?\s*(\d+)", 1, ("garagem",)),
+    ("area", r"(\d{2,4})\s*m²", 1, ("m²",)),
+    ("area", r"(\d{2,4})\s*m2", 1, ("m2",)),
+    ("area", r"(\d{2,4})\s*metros\s*quadrados", 1, ("metros",)),
+]
+
+MENTION_KINDS = ("price", "money", "bedrooms", "suites", "parking", "area")
+
+_COMPILED_MENTIONS = [
+    (kind, re.compile(pattern), multiplier, frozenset(anchors))
+    for kind, pattern, multiplier, anchors in MENTION_PATTERNS
+]
+_ANCHOR_AUTOMATON = KeywordAutomaton(
+    anchor for *_, anchors in MENTION_PATTERNS for anchor in anchors
+)
+
+
+class Mention(NamedTuple):
+    kind: str
+    number: str
+    suffix: str
+    multiplier: int
+    start: int
+
+
+class TextView:
+    """
+    Visões do texto bruto de um anúncio, calculadas uma única vez: minúsculas,
+    sem acentos, linhas e offsets de início de linha.
+    """
+
+    def __init__(self, raw_text: str):
+        self.raw_text = raw_text
+
+    @cached_property
+    def lower(self) -> str:
+        return self.raw_text.lower()
+
+    @cached_property
+    def folded(self) -> str:
+        return fold_accents(self.lower)
+
+    @cached_property
+    def lines(self) -> list:
+        return self.lower.splitlines()
+
+    @cached_property
+    def line_starts(self) -> list:
+        return [0] + [m.end() for m in LINE_BREAK.finditer(self.lower)]
+
+    def line_of(self, position: int) -> int:
+        return bisect_right(self.line_starts, position) - 1
+
+    @cached_property
+    def mentions(self) -> dict:
+        """Menções numéricas por tipo (ver scan_mentions)."""
+        return scan_mentions(self)
+
+
+def scan_mentions(view: TextView) -> dict:
+    """
+    Tokeniza o texto em menções numéricas tipadas (preço, valor informal,
+    quartos, suítes, vagas, área). Menções de preço guardam o offset inicial,
+    para o extrator saber em que linha estão (TextView.line_of).
+
+    Uma varredura pelos literais de âncora decide quais padrões podem casar;
+    só esses rodam. Cada padrão mantém a semântica de re.findall (matches sem
+    sobreposição, da esquerda para a direita), então as listas são as mesmas
+    que os extratores obtinham antes, padrão por padrão.
+    """
+    mentions = {kind: [] for kind in MENTION_KINDS}
+    text = view.lower
+    if not _DIGIT.search(text):
+        return mentions
+
+    anchors = _ANCHOR_AUTOMATON.find(text)
+    if not anchors:
+        return mentions
+
+    for kind, pattern, multiplier, required in _COMPILED_MENTIONS:
+        if required.isdisjoint(anchors):
+            continue
+        bucket = mentions[kind]
+        if kind == "price":
+            for m in pattern.finditer(text):
+                bucket.append(
+                    Mention(kind, m.group(1), m.group(2) or "", multiplier, m.start())
+                )
+        else:
+            for number in pattern.findall(text):
+                bucket.append(Mention(kind, number, "", multiplier, -1))
+    return mentions
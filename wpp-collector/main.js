@@ -1,19 +1,24 @@
 const { Client, LocalAuth } = require("whatsapp-web.js");
 const qrcode = require("qrcode-terminal");
 const fs = require("fs");
+const net = require("net");
 const path = require("path");
 const crypto = require("crypto");
 
 const SESSION_PATH = path.join(__dirname, "session");
 const OUTPUT_FILE = path.join(__dirname, "../data/messages.jsonl");
+// Dias já fechados, selados em segmentos pelo cleaner (intel-engine/journal.py).
+const JOURNAL_DIR = path.join(__dirname, "../data/journal");
+// Opcional: socket do intel-engine (python engine.py --ingest-socket).
+const ENGINE_SOCKET = process.env.ENGINE_SOCKET || null;
 const DEDUP_WINDOW = 7776000;
 const BLOCKED_IDS = new Set(["37658826899485@lid", "228707713171512@lid"]);
 
 const knownIds = new Set();
 const lastSeenAds = new Map();
 
-if (fs.existsSync(OUTPUT_FILE)) {
-  const fileContent = fs.readFileSync(OUTPUT_FILE, "utf-8");
+const loadKnown = (file) => {
+  const fileContent = fs.readFileSync(file, "utf-8");
   fileContent.split("\n").forEach((line) => {
     if (line.trim()) {
       try {
@@ -30,6 +35,17 @@ if (fs.existsSync(OUTPUT_FILE)) {
       } catch (e) {}
     }
   });
+};
+
+if (fs.existsSync(JOURNAL_DIR)) {
+  fs.readdirSync(JOURNAL_DIR)
+    .filter((name) => name.endsWith(".jsonl"))
+    .sort()
+    .forEach((name) => loadKnown(path.join(JOURNAL_DIR, name)));
+}
+
+if (fs.existsSync(OUTPUT_FILE)) {
+  loadKnown(OUTPUT_FILE);
 }
 
 if (!fs.existsSync(SESSION_PATH)) {
@@ -76,6 +92,30 @@ client.on("auth_failure", (msg) => {
   console.log("=".repeat(80));
 });
 
+let engineSocket = null;
+let engineRetryAt = 0;
+
+const pushToEngine = (line) => {
+  if (!ENGINE_SOCKET) return;
+
+  if (!engineSocket) {
+    if (Date.now() < engineRetryAt) return;
+    engineSocket = net.createConnection(ENGINE_SOCKET);
+    engineSocket.on("error", (err) => {
+      console.warn("[ENGINE] socket indisponível:", err.message);
+      engineSocket.destroy();
+      engineSocket = null;
+      engineRetryAt = Date.now() + 5000;
+    });
+    engineSocket.on("close", () => {
+      engineSocket = null;
+    });
+  }
+
+  // O journal já foi gravado; se o envio falhar, o engine lê do arquivo.
+  engineSocket.write(line);
+};
+
 const normalizeText = (text) => {
   return text
     .toLowerCase()
@@ -124,9 +164,12 @@ client.on("message", async (message) => {
       timestamp: message.timestamp,
     };
 
-    fs.appendFileSync(OUTPUT_FILE, JSON.stringify(payload) + "\n", {
+    const line = JSON.stringify(payload) + "\n";
+
+    fs.appendFileSync(OUTPUT_FILE, line, {
       encoding: "utf-8",
     });
+    pushToEngine(line);
 
     knownIds.add(payload.message_id);
     lastSeenAds.set(adHash, payload.timestamp);
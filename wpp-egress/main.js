@@ -6,6 +6,7 @@ const { Client, LocalAuth } = require("whatsapp-web.js");
 const SESSION_PATH = path.join(__dirname, "session");
 const STATE_FILE = path.join(__dirname, "../data/state.json");
 const OPPORTUNITIES_FILE = path.join(__dirname, "../data/opportunities.jsonl");
+const ADS_FILE = path.join(__dirname, "../data/opportunity_ads.jsonl");
 const GROUP_ID = "120363424642701935@g.us";
 
 if (!fs.existsSync(SESSION_PATH)) {
@@ -63,17 +64,69 @@ client.on("auth_failure", (msg) => {
   console.log("=".repeat(80));
 });
 
+// Anúncios citados pelas oportunidades compactas (buyer_id / seller_id).
+// Lidos de forma incremental; se o arquivo for reescrito, recarrega tudo.
+const ads = new Map();
+let adsInode = null;
+let adsOffset = 0;
+
+function loadAds() {
+  if (!fs.existsSync(ADS_FILE)) return;
+
+  const stat = fs.statSync(ADS_FILE);
+  if (stat.ino !== adsInode || stat.size < adsOffset) {
+    ads.clear();
+    adsInode = stat.ino;
+    adsOffset = 0;
+  }
+  if (stat.size === adsOffset) return;
+
+  const fd = fs.openSync(ADS_FILE, "r");
+  const buffer = Buffer.alloc(stat.size - adsOffset);
+  fs.readSync(fd, buffer, 0, buffer.length, adsOffset);
+  fs.closeSync(fd);
+
+  // Só consome até a última linha completa.
+  const end = buffer.lastIndexOf(10);
+  if (end < 0) return;
+  adsOffset += end + 1;
+
+  for (const line of buffer.toString("utf8", 0, end).split("\n")) {
+    if (!line.trim()) continue;
+    try {
+      const ad = JSON.parse(line);
+      const id = ad.original_content && ad.original_content.message_id;
+      if (id && !ads.has(id)) ads.set(id, ad);
+    } catch (e) {}
+  }
+}
+
+// Linhas antigas trazem buyer/seller embutidos; as compactas, só os ids.
+function expand(opp) {
+  if (opp.buyer && opp.seller) return opp;
+  return {
+    ...opp,
+    buyer: ads.get(opp.buyer_id),
+    seller: ads.get(opp.seller_id),
+  };
+}
+
 async function dispatchLoop() {
   try {
     const state = JSON.parse(fs.readFileSync(STATE_FILE));
     const lines = fs.readFileSync(OPPORTUNITIES_FILE, "utf8").split("\n");
+    loadAds();
 
     for (const line of lines) {
       if (!line.trim()) continue;
 
-      const opp = JSON.parse(line);
+      const opp = expand(JSON.parse(line));
 
       if (state.sent[opp.id]) continue;
+      if (!opp.buyer || !opp.seller) {
+        console.warn(`Anúncio ausente para ${opp.id}, pulando.`);
+        continue;
+      }
 
       const msg = format(opp);
 